@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+
+from kinetic_analysis.analysis.analysis_stream import stream_tracks_analysis
+from kinetic_analysis.analysis.analysis_track import (
+    autocorrelation,
+    extract_track,
+    fit_autocorrelation_linear,
+    fit_autocorrelation_original,
+    tracks_analysis)
+
+from benchmarks.common import (DELTA_TS, INVIVO_DELTA_T, N_POINTS,
+                               PROTEIN_SIZE, TRACK_LENGTHS, invivo_file,
+                               invivo_tracks, sample_track, synthetic_tracks)
+
+
+class Autocorrelation:
+    params = (DELTA_TS, N_POINTS)
+    param_names = ["dt", "n_points"]
+
+    def setup(self, dt, n_points):
+        track = sample_track(synthetic_tracks(TRACK_LENGTHS[-1]), dt,
+                             n_points)
+        self.y = track["MEAN_INTENSITY_CH1"].to_numpy()
+
+    def time_autocorrelation(self, dt, n_points):
+        autocorrelation(self.y, delta_t=dt)
+
+    def peakmem_autocorrelation(self, dt, n_points):
+        autocorrelation(self.y, delta_t=dt)
+
+
+class Fit:
+    params = (DELTA_TS, ["original", "linear"])
+    param_names = ["dt", "method"]
+
+    def setup(self, dt, method):
+        track = sample_track(synthetic_tracks(TRACK_LENGTHS[-1]), dt, 5000)
+        self.x, self.y = autocorrelation(
+            track["MEAN_INTENSITY_CH1"].to_numpy(), delta_t=dt)
+        if method == "original":
+            self.fit = lambda: fit_autocorrelation_original(
+                self.x, self.y, protein_size=PROTEIN_SIZE)
+        else:
+            self.fit = lambda: fit_autocorrelation_linear(
+                self.x, self.y, protein_size=PROTEIN_SIZE)
+
+    def time_fit(self, dt, method):
+        self.fit()
+
+    def peakmem_fit(self, dt, method):
+        self.fit()
+
+
+class ExtractTrack:
+    # DataFrame filtering of one track among the 100 tracks
+    params = TRACK_LENGTHS
+    param_names = ["length"]
+
+    def setup(self, length):
+        self.df = synthetic_tracks(length)
+
+    def time_extract_track(self, length):
+        extract_track(self.df, 50, delta_t=0.1, simulation=True)
+
+
+class TracksAnalysisSynthetic:
+    # End to end analysis of the 100 tracks of 6000 sec
+    params = DELTA_TS
+    param_names = ["dt"]
+    number = 1
+    repeat = 1
+
+    def setup(self, dt):
+        df = synthetic_tracks(TRACK_LENGTHS[0])
+        t = int(round(dt / 0.1))
+        self.df = df.groupby("TRACK_ID", group_keys=False).apply(
+            lambda track: track[::t])
+
+    def time_tracks_analysis(self, dt):
+        tracks_analysis(self.df, delta_t=dt, protein_size=PROTEIN_SIZE,
+                        models=("linear",), force_analysis=True,
+                        simulation=True)
+
+    def peakmem_tracks_analysis(self, dt):
+        tracks_analysis(self.df, delta_t=dt, protein_size=PROTEIN_SIZE,
+                        models=("linear",), force_analysis=True,
+                        simulation=True)
+
+
+class TracksAnalysisInvivo:
+    # End to end analysis of an in vivo file of 5000 tracks
+    number = 1
+    repeat = 1
+
+    def setup(self):
+        self.df = invivo_tracks()
+
+    def time_tracks_analysis(self):
+        tracks_analysis(self.df, delta_t=INVIVO_DELTA_T,
+                        protein_size=PROTEIN_SIZE,
+                        models=("linear", "original"),
+                        qc_thresholds={})
+
+    def peakmem_tracks_analysis(self):
+        tracks_analysis(self.df, delta_t=INVIVO_DELTA_T,
+                        protein_size=PROTEIN_SIZE,
+                        models=("linear", "original"),
+                        qc_thresholds={})
+
+
+class StreamTracksAnalysisInvivo:
+    # Analysis of an in vivo file of 5000 tracks while it is read
+    number = 1
+    repeat = 1
+
+    def setup_cache(self):
+        return invivo_file(os.getcwd(), trackmate_header=True)
+
+    def setup(self, path):
+        self.output = os.path.join(tempfile.mkdtemp(), "results.csv")
+
+    def teardown(self, path):
+        shutil.rmtree(os.path.dirname(self.output), ignore_errors=True)
+
+    def time_stream_tracks_analysis(self, path):
+        stream_tracks_analysis(path, self.output, delta_t=INVIVO_DELTA_T,
+                               protein_size=PROTEIN_SIZE,
+                               models=("linear",), qc_thresholds={})
+
+    def peakmem_stream_tracks_analysis(self, path):
+        stream_tracks_analysis(path, self.output, delta_t=INVIVO_DELTA_T,
+                               protein_size=PROTEIN_SIZE,
+                               models=("linear",), qc_thresholds={})
@@ -0,0 +1,29 @@
+from kinetic_analysis.generator.generator_track import (generate_one_track,
+                                                        generate_tracks)
+
+from benchmarks.common import GENERATOR, N_TRACKS, TRACK_LENGTHS
+
+
+class GenerateOneTrack:
+    params = TRACK_LENGTHS
+    param_names = ["length"]
+
+    def time_generate_one_track(self, length):
+        generate_one_track(length=length, **GENERATOR)
+
+    def peakmem_generate_one_track(self, length):
+        generate_one_track(length=length, **GENERATOR)
+
+
+class GenerateTracks:
+    # 100 tracks of 82000 sec take minutes, run them once
+    params = TRACK_LENGTHS
+    param_names = ["length"]
+    number = 1
+    repeat = 1
+
+    def time_generate_tracks(self, length):
+        generate_tracks(N_TRACKS, length=length, seed=0, **GENERATOR)
+
+    def peakmem_generate_tracks(self, length):
+        generate_tracks(N_TRACKS, length=length, seed=0, **GENERATOR)
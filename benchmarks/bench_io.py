@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+
+from kinetic_analysis.generator.generator_cache import cached_generate_tracks
+from kinetic_analysis.utils.reader import cached_read_tracks, read_tracks
+from kinetic_analysis.utils.utils import read_csv_file
+
+from benchmarks.common import GENERATOR, invivo_file
+
+# Columns used by the analysis
+ANALYSIS_COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+class ReadInvivoFile:
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return invivo_file(os.getcwd())
+
+    def time_read_csv_file(self, path):
+        read_csv_file(path)
+
+    def peakmem_read_csv_file(self, path):
+        read_csv_file(path)
+
+
+class ReadTrackMateFile:
+    # TrackMate export with its 4 header lines
+    params = [None, ANALYSIS_COLUMNS]
+    param_names = ["columns"]
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return invivo_file(os.getcwd(), trackmate_header=True)
+
+    def time_read_tracks(self, path, columns):
+        read_tracks(path, columns)
+
+    def peakmem_read_tracks(self, path, columns):
+        read_tracks(path, columns)
+
+
+class ReopenTrackMateFile:
+    # Load from the sidecar written at the first read
+    number = 1
+    repeat = 3
+
+    def setup_cache(self):
+        return invivo_file(os.getcwd(), trackmate_header=True)
+
+    def setup(self, path):
+        self.cache_dir = tempfile.mkdtemp()
+        cached_read_tracks(path, cache_dir=self.cache_dir)
+
+    def teardown(self, path):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def time_cached_read_tracks(self, path):
+        cached_read_tracks(path, cache_dir=self.cache_dir)
+
+    def peakmem_cached_read_tracks(self, path):
+        cached_read_tracks(path, cache_dir=self.cache_dir)
+
+
+class DatasetCache:
+    # Load of 100 tracks of 6000 sec from the dataset cache
+    number = 1
+    repeat = 3
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        cached_generate_tracks(100, length=6000, seed=0,
+                               cache_dir=self.cache_dir, **GENERATOR)
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def time_load_cached_tracks(self):
+        cached_generate_tracks(100, length=6000, seed=0,
+                               cache_dir=self.cache_dir, **GENERATOR)
@@ -0,0 +1,132 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.generator.generator_cache import cached_generate_tracks
+from kinetic_analysis.generator.generator_track import generate_profile
+
+# Scales of the notebooks: snail with a 32x suntag, 100 tracks generated
+# every 0.1 sec, sub-sampled to the time step of the analysis
+SUNTAG_LENGTH = 796
+PROT_LENGTH = 390
+PROTEIN_SIZE = SUNTAG_LENGTH + PROT_LENGTH
+GENERATOR = {"prot_length": PROT_LENGTH,
+             "suntag_length": SUNTAG_LENGTH,
+             "nb_suntag": 32,
+             "fluo_one_suntag": 4,
+             "translation_rate": 5,
+             "binding_rate": 0.05,
+             "step": 0.1}
+N_TRACKS = 100
+TRACK_LENGTHS = [6000, 82000]
+DELTA_TS = [0.1, 1, 3, 5, 10, 30, 60]
+N_POINTS = [500, 5000, 50000]
+
+# In vivo files: 5000 tracks of a few hundred frames
+N_INVIVO_TRACKS = 5000
+INVIVO_DELTA_T = 3
+# Columns of a TrackMate spot export
+INVIVO_COLUMNS = ["LABEL", "ID", "TRACK_ID", "QUALITY", "POSITION_X",
+                  "POSITION_Y", "POSITION_Z", "POSITION_T", "FRAME",
+                  "RADIUS", "VISIBILITY", "MANUAL_SPOT_COLOR",
+                  "MEAN_INTENSITY_CH1", "MEDIAN_INTENSITY_CH1",
+                  "MIN_INTENSITY_CH1", "MAX_INTENSITY_CH1",
+                  "TOTAL_INTENSITY_CH1", "STD_INTENSITY_CH1", "CONTRAST_CH1",
+                  "SNR_CH1"]
+
+SEED = 0
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "..", ".asv", "datasets")
+
+
+def synthetic_tracks(length, n=N_TRACKS):
+    """
+    Tracks of the notebooks, generated once and then loaded from the
+    dataset cache.
+    """
+    return cached_generate_tracks(n, length=length, seed=SEED,
+                                  cache_dir=CACHE_DIR, **GENERATOR)
+
+
+def sample_track(df, delta_t, n_points, id_track=0):
+    """
+    One track sub-sampled to delta_t, as in the notebooks.
+
+    Raises NotImplementedError, so asv skips the case, when the track is
+    too short.
+    """
+    t = int(round(delta_t / GENERATOR["step"]))
+    track = df[df["TRACK_ID"] == id_track][::t][:n_points]
+    if len(track) < n_points:
+        raise NotImplementedError("track too short")
+    return track
+
+
+def invivo_tracks(n=N_INVIVO_TRACKS, delta_t=INVIVO_DELTA_T, seed=SEED):
+    """
+    Tracks that look like an in vivo TrackMate export.
+
+    Description
+    -----------
+    The signal of each track is the convolution of random initiations with
+    the profile of one protein, plus noise; the other columns are random.
+    """
+    rng = np.random.default_rng(seed)
+    _, profile = generate_profile(PROT_LENGTH, SUNTAG_LENGTH, 32, 4, 5,
+                                  step=delta_t)
+    lengths = rng.integers(50, 500, n)
+    track_id = np.repeat(np.arange(n), lengths)
+    frame = np.concatenate([np.arange(le) for le in lengths])
+    starts = rng.random(len(frame)) < GENERATOR["binding_rate"] * delta_t
+    signal = np.concatenate([
+        np.convolve(s, profile)[:len(s)]
+        for s in np.split(starts, np.cumsum(lengths)[:-1])])
+    intensity = signal + rng.normal(0, 5, len(frame)) + 100
+
+    df = pd.DataFrame(rng.random((len(frame), len(INVIVO_COLUMNS))),
+                      columns=INVIVO_COLUMNS)
+    df["LABEL"] = ["ID" + str(i) for i in range(len(frame))]
+    df["ID"] = np.arange(len(frame))
+    df["TRACK_ID"] = track_id
+    df["FRAME"] = frame
+    df["POSITION_T"] = frame * delta_t
+    df["MANUAL_SPOT_COLOR"] = ""
+    df["MEAN_INTENSITY_CH1"] = intensity
+    return df
+
+
+def invivo_file(directory=None, trackmate_header=False):
+    """
+    Write `invivo_tracks` in a csv file, as read by `read_csv_file`.
+
+    Parameters
+    ----------
+    directory : str
+        default value : None, a temporary directory
+    trackmate_header : bool
+        write the 3 extra header lines of TrackMate (long names, short names
+        and units) without index column, default value : False
+
+    Returns
+    -------
+    str, path of the file
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    df = invivo_tracks()
+    if not trackmate_header:
+        path = os.path.join(directory, "invivo_tracks.csv")
+        df.to_csv(path)
+        return path
+
+    path = os.path.join(directory, "invivo_tracks_trackmate.csv")
+    names = [c.replace("_", " ").capitalize() for c in df.columns]
+    with open(path, "w") as f:
+        f.write(",".join(df.columns) + "\n")
+        f.write(",".join(names) + "\n")
+        f.write(",".join(names) + "\n")
+        f.write(",".join(["(unit)"] * len(names)) + "\n")
+    df.to_csv(path, mode="a", header=False, index=False)
+    return path
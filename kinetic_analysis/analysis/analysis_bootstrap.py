@@ -0,0 +1,304 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import fit_function
+from kinetic_analysis.analysis.analysis_population import (tracks_to_matrix,
+                                                           batch_autocorrelation,
+                                                           fit_population_autocorrelation)
+from kinetic_analysis.utils.memory import WORKER_MEMORY, plan_batch
+
+STATISTICS = {"mean": np.nanmean,
+              "median": np.nanmedian}
+
+
+def resample_index(n, n_resamples, rng):
+    """
+    Matrix of bootstrap indexes.
+
+    Parameters
+    ----------
+    n : int
+        number of observations
+    n_resamples : int
+        number of resamples
+    rng : np.random.Generator
+
+    Returns
+    -------
+    np.array of shape (n_resamples, n), index of the observations drawn with
+    replacement for each resample
+    """
+    return rng.integers(0, n, size=(n_resamples, n))
+
+
+def resample_counts(n, n_resamples, rng):
+    """
+    Number of times each observation is drawn in each bootstrap resample.
+
+    Parameters
+    ----------
+    n : int
+        number of observations
+    n_resamples : int
+        number of resamples
+    rng : np.random.Generator
+
+    Returns
+    -------
+    np.array of shape (n_resamples, n)
+    """
+    index = resample_index(n, n_resamples, rng)
+    flat = index + n * np.arange(n_resamples)[:, None]
+    return np.bincount(flat.ravel(),
+                       minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def _percentile_ci(distribution, estimate, confidence_level):
+    alpha = (1 - confidence_level) / 2
+    low, high = np.nanpercentile(distribution, [100 * alpha,
+                                                100 * (1 - alpha)])
+    return {"estimate": estimate,
+            "ci_low": low,
+            "ci_high": high,
+            "se": np.nanstd(distribution, ddof=1),
+            "bias": np.nanmean(distribution) - estimate}
+
+
+def _bootstrap_values(values, n_resamples, confidence_level, statistic,
+                      seed, batch=1000):
+    rng = np.random.default_rng(seed)
+    func_ = STATISTICS.get(statistic, statistic)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return _percentile_ci(np.array([np.nan, np.nan]), np.nan,
+                              confidence_level)
+
+    # Resamples are drawn by batch to bound the size of the index matrix
+    distribution = np.concatenate([
+        func_(values[resample_index(len(values),
+                                    min(batch, n_resamples - i),
+                                    rng)], axis=1)
+        for i in range(0, n_resamples, batch)])
+    return _percentile_ci(distribution, func_(values), confidence_level)
+
+
+def _bootstrap_group(values, n_resamples, confidence_level, statistic, seed):
+    return {column: _bootstrap_values(v,
+                                      n_resamples,
+                                      confidence_level,
+                                      statistic,
+                                      s)
+            for (column, v), s in zip(values.items(), seed.spawn(len(values)))}
+
+
+def _map_groups(func_, args, n_jobs, item_bytes=0):
+    # Fewer processes when the groups do not fit in the memory budget
+    _, n_jobs = plan_batch(len(args), item_bytes, n_jobs, WORKER_MEMORY)
+    if n_jobs == 1 or len(args) <= 1:
+        return [func_(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(func_, *zip(*args)))
+
+
+def bootstrap_estimates(results,
+                        columns=("elongation_r", "init_translation_r"),
+                        by=("dt",),
+                        n_resamples=9999,
+                        confidence_level=0.95,
+                        statistic="mean",
+                        seed=None,
+                        n_jobs=None):
+    """
+    Bootstrap confidence intervals of per-track estimates.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        one row per analysed track, as saved by the analysis tabs
+    columns : list
+        columns to bootstrap, default value : elongation and initiation rates
+    by : list
+        columns that define the groups, default value : ("dt",). Use
+        ("dt", "long_track") to get all groups of a sweep in one call.
+    n_resamples : int
+        number of bootstrap resamples, default value : 9999
+    confidence_level : float
+        confidence level of the interval, default value : 0.95
+    statistic : str or function
+        "mean", "median" or a function that accepts an axis argument,
+        default value : "mean"
+    seed : int
+        seed of the random generator, default value : None
+    n_jobs : int
+        number of processes used for the groups, default value : None, all
+        processors
+
+    Returns
+    -------
+    pd.DataFrame with one row per group and column, with the estimate, the
+    percentile confidence interval, the bootstrap standard error and bias
+
+    Description
+    -----------
+    Each group is resampled with one index matrix of shape
+    (n_resamples, n_tracks) instead of a Python loop over resamples. Groups
+    are processed in parallel.
+    """
+    by = list(by) if by else []
+    columns = list(columns)
+    groups = results.groupby(by) if by else [((), results)]
+    groups = [(name if isinstance(name, tuple) else (name,), df)
+              for name, df in groups]
+    seeds = np.random.SeedSequence(seed).spawn(len(groups))
+    args = [({c: df[c].to_numpy(dtype=float) for c in columns},
+             n_resamples,
+             confidence_level,
+             statistic,
+             s)
+            for (_, df), s in zip(groups, seeds)]
+
+    # Index matrix and resampled values of the largest group
+    item_bytes = 2 * 8 * n_resamples * max((len(df) for _, df in groups),
+                                           default=0)
+    rows = []
+    for (name, df), res in zip(groups,
+                               _map_groups(_bootstrap_group, args, n_jobs,
+                                           item_bytes)):
+        for column in columns:
+            rows.append({**dict(zip(by, name)),
+                         "variable": column,
+                         "n": int(np.isfinite(df[column]).sum()),
+                         **res[column]})
+    return pd.DataFrame(rows)
+
+
+def _bootstrap_pooled_group(df, delta_t, protein_size, n_resamples,
+                            confidence_level, seed, max_lag, method,
+                            first_dot, func_):
+    rng = np.random.default_rng(seed)
+    ids_track, y, lengths = tracks_to_matrix(df)
+    x_auto, g_auto, weights = batch_autocorrelation(y,
+                                                    lengths,
+                                                    delta_t,
+                                                    max_lag)
+    weights = np.where(np.isfinite(g_auto), weights, 0).astype(float)
+    g_auto = np.where(weights > 0, g_auto, 0.)
+
+    # Row 0 is the original sample, the others are the resamples
+    counts = np.vstack([np.ones((1, len(ids_track))),
+                        resample_counts(len(ids_track), n_resamples, rng)])
+    w_sum = counts @ weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g_mean = (counts @ (weights * g_auto)) / w_sum
+        g_var = (counts @ (weights * g_auto ** 2)) / w_sum - g_mean ** 2
+        n_eff = w_sum ** 2 / (counts @ weights ** 2)
+        g_sem = np.sqrt(np.clip(g_var, 0, None) / n_eff)
+
+    rates = np.full((n_resamples + 1, 2), np.nan)
+    for i in range(n_resamples + 1):
+        try:
+            rates[i, 0], rates[i, 1], _ = fit_population_autocorrelation(
+                x_auto, g_mean[i], g_sem[i], func_, method, protein_size,
+                first_dot)
+        except (RuntimeError, ValueError, IndexError):
+            continue
+
+    return {"n": len(ids_track),
+            "elongation_r": _percentile_ci(rates[1:, 0], rates[0, 0],
+                                           confidence_level),
+            "init_translation_r": _percentile_ci(rates[1:, 1], rates[0, 1],
+                                                 confidence_level)}
+
+
+def bootstrap_pooled_fit(df,
+                         delta_t=0.5,
+                         protein_size=1500,
+                         by=None,
+                         dt_col=None,
+                         n_resamples=1000,
+                         confidence_level=0.95,
+                         seed=None,
+                         max_lag=None,
+                         method="original",
+                         first_dot=True,
+                         func_=fit_function,
+                         n_jobs=None):
+    """
+    Bootstrap confidence intervals of the pooled autocorrelation fit.
+
+    Parameters
+    ----------
+    df : pd.df
+        dataframe that contains tracks
+    delta_t : float
+        time between two time point in sec
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    by : list
+        columns of df that define the groups, default value : None
+    dt_col : str
+        column of df that gives the time step of each group, used instead of
+        delta_t, default value : None
+    n_resamples : int
+        number of bootstrap resamples, default value : 1000
+    confidence_level : float
+        confidence level of the interval, default value : 0.95
+    seed : int
+        seed of the random generator, default value : None
+    max_lag : int
+        last lag (in number of points) of the autocorrelation
+    method : str
+        choose the method of the analysis, "linear" or "original"
+    first_dot : bool
+        use the first point in the analysis, default value :True
+    func_ : function
+        function to fit with the "original" method, it needs to be picklable
+        when n_jobs is not 1
+    n_jobs : int
+        number of processes used for the groups, default value : None, all
+        processors
+
+    Returns
+    -------
+    pd.DataFrame with one row per group and rate, see `bootstrap_estimates`
+
+    Description
+    -----------
+    Tracks are resampled before the pooled fit of `pooled_analysis`. The
+    autocorrelation of each track is computed only once, the mean curves of
+    all resamples are then obtained with a single product between the
+    resample count matrix and the track curves. Only the fit is repeated
+    for each resample.
+    """
+    by = list(by) if by else []
+    groups = df.groupby(by) if by else [((), df)]
+    groups = [(name if isinstance(name, tuple) else (name,), d)
+              for name, d in groups]
+    seeds = np.random.SeedSequence(seed).spawn(len(groups))
+    args = [(d,
+             delta_t if dt_col is None else float(d[dt_col].iloc[0]),
+             protein_size,
+             n_resamples,
+             confidence_level,
+             s,
+             max_lag,
+             method,
+             first_dot,
+             func_)
+            for (_, d), s in zip(groups, seeds)]
+
+    # Resample count matrix of the largest group
+    item_bytes = 3 * 8 * (n_resamples + 1) * max(
+        (d["TRACK_ID"].nunique() for _, d in groups), default=0)
+    rows = []
+    for (name, _), res in zip(groups,
+                              _map_groups(_bootstrap_pooled_group, args,
+                                          n_jobs, item_bytes)):
+        for column in ["elongation_r", "init_translation_r"]:
+            rows.append({**dict(zip(by, name)),
+                         "variable": column,
+                         "n": res["n"],
+                         **res[column]})
+    return pd.DataFrame(rows)
@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+
+from scipy.interpolate import RegularGridInterpolator, interp1d
+
+from kinetic_analysis.analysis.analysis_track import single_track_analysis
+from kinetic_analysis.generator.generator_track import generate_tracks
+
+RATES = ["elongation_r", "init_translation_r"]
+
+
+def calibration_sweep(prot_length,
+                      suntag_length,
+                      nb_suntag,
+                      fluo_one_suntag,
+                      translation_rate,
+                      binding_rate,
+                      delta_ts,
+                      track_lengths,
+                      n_tracks=100,
+                      method="linear",
+                      retention_time=0,
+                      suntag_pos="begin",
+                      step=0.1):
+    """
+    Analyse synthetic tracks for a grid of time steps and track lengths.
+
+    Parameters
+    ----------
+    prot_length, suntag_length, nb_suntag, fluo_one_suntag,
+    translation_rate, binding_rate, retention_time, suntag_pos, step :
+        see `generate_tracks`
+    delta_ts : list
+        time steps of the analysis in sec, multiples of step
+    track_lengths : list
+        number of time points of the analysed tracks
+    n_tracks : int
+        number of tracks generated, default value : 100
+    method : str
+        choose the method of the analysis, "linear" or "original"
+
+    Returns
+    -------
+    pd.DataFrame with one row per analysed track, with the estimated rates,
+    the true rates and the "dt", "long_track", "protein_size" and "method"
+    columns used by `calibration_table`
+
+    Description
+    -----------
+    Same sweep as the delta_t and track length notebooks: tracks are
+    generated once, long enough for the largest grid cell, then subsampled
+    every dt and cut to each track length.
+    """
+    protein_size = prot_length + suntag_length
+    t_max = max(np.rint(np.asarray(delta_ts) / step))
+    length = 200 + step * t_max * (max(track_lengths) + 1)
+    datas = generate_tracks(n_tracks,
+                            prot_length,
+                            suntag_length,
+                            nb_suntag,
+                            fluo_one_suntag,
+                            translation_rate,
+                            binding_rate,
+                            retention_time,
+                            suntag_pos,
+                            step=step,
+                            length=length)
+
+    results = []
+    for dt in delta_ts:
+        t = int(np.rint(dt / step))
+        for long_track in track_lengths:
+            for i, track in datas.groupby("TRACK_ID"):
+                track = track[::t][:long_track]
+                if ((len(np.unique(track["MEAN_INTENSITY_CH1"])) <= 1) or
+                        (len(track) != long_track)):
+                    continue
+                try:
+                    (_, _, _, _,
+                     elongation_r,
+                     translation_init_r,
+                     _) = single_track_analysis(track,
+                                                i,
+                                                delta_t=dt,
+                                                protein_size=protein_size,
+                                                rtol=1e-1,
+                                                method=method,
+                                                force_analysis=True,
+                                                simulation=True)
+                except (RuntimeError, ValueError, IndexError):
+                    continue
+                results.append({"elongation_r": elongation_r,
+                                "init_translation_r": translation_init_r,
+                                "dt": dt,
+                                "long_track": long_track,
+                                "protein_size": protein_size,
+                                "method": method,
+                                "id": i,
+                                "true_elongation_r": translation_rate,
+                                "true_init_translation_r": 1 / binding_rate})
+    return pd.DataFrame(results)
+
+
+def calibration_table(results,
+                      by=("dt", "long_track", "protein_size", "method")):
+    """
+    Bias and variance of the estimates for each cell of a sweep.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        per track estimates with the true rates in "true_elongation_r" and
+        "true_init_translation_r", see `calibration_sweep`
+    by : list
+        columns that define the cells of the sweep
+
+    Returns
+    -------
+    pd.DataFrame with one row per cell, and for each rate the mean
+    estimate, the ratio between the mean estimate and the true value
+    ("_ratio"), the difference ("_bias") and the standard deviation
+    ("_std") of the estimates
+    """
+    by = list(by)
+    results = results.replace([np.inf, -np.inf], np.nan)
+    for rate in RATES:
+        # Failed fits return -1 with the linear method
+        results.loc[results[rate] <= 0, rate] = np.nan
+    grouped = results.groupby(by)
+    table = grouped.size().rename("n").to_frame()
+    for rate in RATES:
+        mean = grouped[rate].mean()
+        truth = grouped["true_" + rate].mean()
+        table[rate] = mean
+        table[rate + "_ratio"] = mean / truth
+        table[rate + "_bias"] = mean - truth
+        table[rate + "_std"] = grouped[rate].std()
+    return table.reset_index()
+
+
+def save_calibration_table(table, path):
+    """
+    Save a calibration table in a csv file.
+    """
+    table.to_csv(path, index=False)
+
+
+def load_calibration_table(path):
+    """
+    Load a calibration table saved with `save_calibration_table`.
+    """
+    return pd.read_csv(path)
+
+
+def _fill_missing(values, axes):
+    # Cells of the grid without estimate take the value of the closest cell
+    # with one
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values
+    coords = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+    distance = ((coords[missing][:, None, :] -
+                 coords[~missing][None, :, :]) ** 2).sum(axis=-1)
+    values = values.copy()
+    values[missing] = values[~missing][distance.argmin(axis=1)]
+    return values
+
+
+def _interpolator(table, column):
+    # Bias surfaces are smooth in log(dt), log(track length)
+    grid = table.pivot_table(index="dt", columns="long_track",
+                             values=column)
+    if grid.size == 0:
+        raise ValueError("No cell of the calibration table for " + column)
+    axes = [np.log(grid.index.values.astype(float)),
+            np.log(grid.columns.values.astype(float))]
+    values = _fill_missing(grid.values.astype(float), axes)
+    # Linear interpolation needs two points per axis, a sweep with a single
+    # dt or track length is interpolated along the other axis only
+    varying = [len(a) > 1 for a in axes]
+    if all(varying):
+        return RegularGridInterpolator(axes, values, bounds_error=False,
+                                       fill_value=None)
+    if not any(varying):
+        return lambda points: np.full(len(points), values[0, 0])
+    axis = varying.index(True)
+    curve = interp1d(axes[axis], values[:, 0] if axis == 0 else values[0],
+                     fill_value="extrapolate")
+    return lambda points: curve(points[:, axis])
+
+
+def calibrate_estimates(results,
+                        table,
+                        delta_t=None,
+                        track_length=None,
+                        protein_size=None,
+                        method=None,
+                        mode="ratio"):
+    """
+    Correct the bias of estimates with a calibration table.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        estimates to correct, per track or pooled
+    table : pd.DataFrame
+        see `calibration_table`
+    delta_t : float
+        time step of the estimates, default value : None, "dt" column of
+        results
+    track_length : int
+        number of time points of the tracks, default value : None,
+        "long_track" column of results
+    protein_size : int
+        protein (+ suntag) size, default value : None, closest size of the
+        table
+    method : str
+        method of the analysis, default value : None, first method of the
+        table
+    mode : str
+        "ratio" divides the estimates by the interpolated ratio,
+        "difference" subtracts the interpolated bias, default value :
+        "ratio"
+
+    Returns
+    -------
+    pd.DataFrame, results with the corrected rates ("_calibrated") and
+    their calibrated uncertainty ("_calibrated_std"), the spread of the
+    estimates of the sweep in the same conditions
+
+    Description
+    -----------
+    Bias and standard deviation surfaces of the table are interpolated in
+    (log dt, log track length) and extrapolated from the closest cells, so
+    no simulation is needed at analysis time. Cells without estimate take
+    the value of the closest cell, and a table with a single dt or track
+    length is interpolated along the other axis.
+    """
+    if mode not in ["ratio", "difference"]:
+        raise ValueError("mode value can only be \"ratio\" or \"difference\"")
+    results = results.copy()
+    sizes = np.unique(table["protein_size"])
+    if protein_size is None:
+        protein_size = sizes[0]
+    protein_size = sizes[np.argmin(np.abs(sizes - protein_size))]
+    if method is None:
+        method = table["method"].iloc[0]
+    table = table[(table["protein_size"] == protein_size) &
+                  (table["method"] == method)]
+
+    dt = results["dt"] if delta_t is None else delta_t
+    long_track = (results["long_track"] if track_length is None
+                  else track_length)
+    points = np.column_stack(np.broadcast_arrays(
+        np.log(np.asarray(dt, dtype=float)),
+        np.log(np.asarray(long_track, dtype=float)),
+        np.zeros(len(results))))[:, :2]
+
+    for rate in RATES:
+        std = _interpolator(table, rate + "_std")(points)
+        if mode == "ratio":
+            ratio = _interpolator(table, rate + "_ratio")(points)
+            results[rate + "_calibrated"] = results[rate] / ratio
+            results[rate + "_calibrated_std"] = std / ratio
+        else:
+            bias = _interpolator(table, rate + "_bias")(points)
+            results[rate + "_calibrated"] = results[rate] - bias
+            results[rate + "_calibrated_std"] = std
+    return results
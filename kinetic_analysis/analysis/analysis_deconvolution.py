@@ -0,0 +1,343 @@
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.generator.generator_track import generate_profile
+from kinetic_analysis.analysis.analysis_population import tracks_to_matrix
+
+
+def profile_kernel(prot_length,
+                   suntag_length,
+                   nb_suntag,
+                   fluo_one_suntag,
+                   translation_rate,
+                   retention_time=0,
+                   suntag_pos="begin",
+                   delta_t=0.5):
+    """
+    Fluorescence profile of one protein sampled at the time step of a track.
+
+    Parameters
+    ----------
+    see `generate_profile`, delta_t is the time between two time points of
+    the track
+
+    Returns
+    -------
+    np.array, fluorescence of one protein at each time point after its
+    initiation
+    """
+    _, kernel = generate_profile(prot_length,
+                                 suntag_length,
+                                 nb_suntag,
+                                 fluo_one_suntag,
+                                 translation_rate,
+                                 retention_time,
+                                 suntag_pos,
+                                 step=delta_t)
+    return kernel
+
+
+def deconvolve_tracks(y, kernel, method="nnls", regularisation=1e-2,
+                      n_iter=300):
+    """
+    Deconvolve several tracks against the profile of one protein.
+
+    Parameters
+    ----------
+    y : np.array
+        intensity of the tracks, shape (number of tracks, number of points),
+        nan are considered as 0
+    kernel : np.array
+        fluorescence profile of one protein, see `profile_kernel`
+    method : str
+        "fft" for a regularised (Wiener like) deconvolution in Fourier
+        space, "nnls" for a sparse non-negative deconvolution, default
+        value : "nnls"
+    regularisation : float
+        weight of the regularisation, relative to the energy of the kernel
+        for "fft" and to the sparsity of the events for "nnls", default
+        value : 1e-2
+    n_iter : int
+        number of iterations of the "nnls" method, default value : 300
+
+    Returns
+    -------
+    events : np.array
+        number of initiations at each time point, same shape as y
+    residual : np.array
+        mean squared error between each track and its reconstruction
+
+    Description
+    -----------
+    The signal of a track is a sum of shifted copies of the profile of one
+    protein, y = kernel * events. All tracks are deconvolved together with
+    FFT along the time axis.
+    The "nnls" method solves min |kernel * s - y|^2 + lambda sum(s) with
+    s >= 0 by projected gradient descent.
+    """
+    y = np.nan_to_num(np.atleast_2d(np.asarray(y, dtype=float)))
+    kernel = np.asarray(kernel, dtype=float)
+    n_points = y.shape[1]
+    n_fft = 1 << int(np.ceil(np.log2(n_points + len(kernel))))
+
+    fk = np.fft.rfft(kernel, n=n_fft)
+    power = np.abs(fk) ** 2
+
+    def convolve(s):
+        return np.fft.irfft(np.fft.rfft(s, n=n_fft, axis=1) * fk,
+                            n=n_fft, axis=1)[:, :n_points]
+
+    def correlate(r):
+        return np.fft.irfft(np.fft.rfft(r, n=n_fft, axis=1) * np.conj(fk),
+                            n=n_fft, axis=1)[:, :n_points]
+
+    if method == "fft":
+        fy = np.fft.rfft(y, n=n_fft, axis=1)
+        lam = regularisation * power.max()
+        events = np.fft.irfft(fy * np.conj(fk) / (power + lam),
+                              n=n_fft, axis=1)[:, :n_points]
+        events = np.clip(events, 0, None)
+    elif method == "nnls":
+        step = 1 / power.max()
+        lam = regularisation * np.sum(kernel ** 2)
+        events = np.zeros_like(y)
+        for _ in range(n_iter):
+            gradient = correlate(convolve(events) - y) + lam
+            events = np.clip(events - step * gradient, 0, None)
+    else:
+        raise ValueError("method value can only be \"fft\" or \"nnls\"")
+
+    residual = np.mean((convolve(events) - y) ** 2, axis=1)
+    return events, residual
+
+
+def detect_events(events, threshold=1e-3):
+    """
+    Initiation events of deconvolved tracks.
+
+    Parameters
+    ----------
+    events : np.array
+        deconvolved signal, see `deconvolve_tracks`, shape (number of
+        tracks, number of points)
+    threshold : float
+        values below it are considered as 0, default value : 1e-3
+
+    Returns
+    -------
+    row : np.array
+        track of each event
+    position : np.array
+        time point of each event, center of mass of its peak
+    counts : np.array
+        number of initiations of each event
+
+    Description
+    -----------
+    A peak is a run of consecutive time points above threshold. Its
+    integral is rounded once to give its number of initiations, peaks
+    rounded to 0 are dropped. Rounding each time point instead loses the
+    initiations spread over several points by the regularisation.
+    """
+    events = np.atleast_2d(events)
+    n_tracks, n_points = events.shape
+    # A 0 after each track, so that peaks do not span two tracks
+    signal = np.concatenate([events, np.zeros((n_tracks, 1))], axis=1)
+    signal = np.where(signal > threshold, signal, 0).ravel()
+    edges = np.diff(np.concatenate([[0], (signal > 0).astype(np.int8)]))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0]
+
+    mass = np.concatenate([[0], np.cumsum(signal)])
+    time = np.tile(np.arange(n_points + 1), n_tracks)
+    moment = np.concatenate([[0], np.cumsum(signal * time)])
+    integral = mass[ends] - mass[starts]
+    position = (moment[ends] - moment[starts]) / integral
+
+    counts = np.rint(integral)
+    keep = counts >= 1
+    return (starts[keep] // (n_points + 1), position[keep], counts[keep])
+
+
+def occupancy_from_events(events, n_profile):
+    """
+    Number of proteins in translation from the initiation events.
+
+    Parameters
+    ----------
+    events : np.array
+        number of initiations at each time point
+    n_profile : int
+        number of time points of the profile of one protein
+
+    Returns
+    -------
+    np.array, same format as `y_start_prot` of `generate_one_track`
+    """
+    events = np.atleast_2d(events)
+    cs = np.concatenate([np.zeros((events.shape[0], 1)),
+                         np.cumsum(events, axis=1)], axis=1)
+    index = np.arange(1, events.shape[1] + 1)
+    return cs[:, index] - cs[:, np.clip(index - n_profile, 0, None)]
+
+
+def deconvolution_analysis(df,
+                           prot_length,
+                           suntag_length,
+                           nb_suntag,
+                           fluo_one_suntag,
+                           translation_rate,
+                           retention_time=0,
+                           suntag_pos="begin",
+                           delta_t=0.5,
+                           elongation_rates=None,
+                           method="nnls",
+                           regularisation=1e-2,
+                           n_iter=300,
+                           normalise_intensity=1):
+    """
+    Estimate initiation events of all tracks by deconvolution.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    prot_length : int
+        length of the protein in amino acid
+    suntag_length : int
+        length of the suntag in amino acid
+    nb_suntag : int
+        number of suntag repetition
+    fluo_one_suntag : int
+        fluorescence intensity of one suntag
+    translation_rate : float
+        elongation rate of the protein in aa/sec used for the kernel
+    retention_time : float, default 0
+        length of time the protein remains on the translation site in sec
+    suntag_pos : str, "begin" or "end", default "begin"
+        position of the suntag, before of after the protein
+    delta_t : float
+        time between two time point in sec
+    elongation_rates : list
+        candidate elongation rates in aa/sec. When given, the rate that
+        gives the lowest reconstruction error is kept for each track,
+        default value : None, translation_rate is used
+    method : str
+        "fft" or "nnls", see `deconvolve_tracks`
+    regularisation : float
+        see `deconvolve_tracks`
+    n_iter : int
+        see `deconvolve_tracks`
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+
+    Returns
+    -------
+    results : pd.DataFrame
+        one row per track with the number of events, the initiation rate
+        (in 1/sec, "binding_rate"), the mean time between two initiations
+        ("init_translation_r", same convention as the autocorrelation fit),
+        the elongation rate and the reconstruction error
+    events : pd.DataFrame
+        time and number of initiations of each detected event
+
+    Description
+    -----------
+    Instead of fitting the autocorrelation, the signal is deconvolved with
+    the profile of one protein (`generate_profile`) to recover the
+    initiation events. Intensity need to be in the same unit as
+    fluo_one_suntag.
+    Events are counted on the integral of the deconvolved signal, see
+    `detect_events`, because the regularisation spreads each initiation
+    over neighbouring time points.
+    """
+    ids_track, y, lengths = tracks_to_matrix(df, normalise_intensity)
+    if elongation_rates is None:
+        elongation_rates = [translation_rate]
+    elongation_rates = np.asarray(elongation_rates, dtype=float)
+
+    best_events = None
+    best_residual = np.full(len(ids_track), np.inf)
+    best_rate = np.full(len(ids_track), np.nan)
+    for rate in elongation_rates:
+        kernel = profile_kernel(prot_length,
+                                suntag_length,
+                                nb_suntag,
+                                fluo_one_suntag,
+                                rate,
+                                retention_time,
+                                suntag_pos,
+                                delta_t)
+        events, residual = deconvolve_tracks(y,
+                                             kernel,
+                                             method,
+                                             regularisation,
+                                             n_iter)
+        better = residual < best_residual
+        if best_events is None:
+            best_events = events
+        else:
+            best_events[better] = events[better]
+        best_residual[better] = residual[better]
+        best_rate[better] = rate
+
+    best_events[np.isnan(y)] = 0
+    row, position, counts = detect_events(best_events)
+    n_events = np.bincount(row, weights=counts, minlength=len(ids_track))
+    duration = lengths * delta_t
+    with np.errstate(divide="ignore", invalid="ignore"):
+        binding_rate = n_events / duration
+        init_translation_r = duration / n_events
+
+    results = pd.DataFrame({"id": ids_track,
+                            "n_events": n_events,
+                            "binding_rate": binding_rate,
+                            "init_translation_r": init_translation_r,
+                            "elongation_r": best_rate,
+                            "residual": best_residual,
+                            "dt": delta_t})
+    events = pd.DataFrame({"id": ids_track[row],
+                           "time": position * delta_t,
+                           "n": counts})
+    return results, events
+
+
+def compare_with_ground_truth(events, y_start_prot, n_profile):
+    """
+    Compare deconvolved events of one track with the generator ground truth.
+
+    Parameters
+    ----------
+    events : np.array
+        number of initiations at each time point of the track
+    y_start_prot : np.array
+        number of proteins in translation given by `generate_one_track`,
+        sampled at the same time points as events
+    n_profile : int
+        number of time points of the profile of one protein
+
+    Returns
+    -------
+    dict with the mean number of proteins in translation (estimated and
+    true), the implied initiation rates in 1/time point and the correlation
+    between estimated and true occupancy
+
+    Description
+    -----------
+    `generate_one_track` does not return the initiation times but the
+    number of proteins in translation. The events are therefore compared
+    through the occupancy they imply. The first n_profile points are
+    excluded because proteins started before the track are not
+    recovered.
+    """
+    occupancy = occupancy_from_events(events, n_profile)[0][n_profile:]
+    truth = np.asarray(y_start_prot, dtype=float)[n_profile:]
+    if np.std(occupancy) > 0 and np.std(truth) > 0:
+        correlation = np.corrcoef(occupancy, truth)[0, 1]
+    else:
+        correlation = np.nan
+    return {"mean_occupancy": occupancy.mean(),
+            "mean_occupancy_true": truth.mean(),
+            "binding_rate": occupancy.mean() / n_profile,
+            "binding_rate_true": truth.mean() / n_profile,
+            "correlation": correlation}
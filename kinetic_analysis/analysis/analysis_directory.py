@@ -0,0 +1,235 @@
+import os
+import warnings
+
+from concurrent.futures import (ProcessPoolExecutor,
+                                ThreadPoolExecutor,
+                                as_completed)
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import tracks_analysis
+from kinetic_analysis.utils.memory import WORKER_MEMORY, plan_batch
+from kinetic_analysis.utils.reader import read_trackmate_xml, sniff_csv
+from kinetic_analysis.utils.utils import read_csv_file
+
+EXTENSIONS = (".csv", ".xml")
+# Number of tracks of a file analysed by one task of the process pool
+BATCH_TRACKS = 500
+# Columns of the results of `tracks_analysis`, files with them are not
+# track files
+RESULT_COLUMNS = ["elongation_r", "init_translation_r"]
+
+
+def _is_results_file(path):
+    if not path.lower().endswith(".csv"):
+        return False
+    try:
+        columns = sniff_csv(path)["columns"]
+    except (OSError, ValueError):
+        # Reported when the file is read
+        return False
+    return all(c in columns for c in RESULT_COLUMNS)
+
+
+def list_track_files(directory, extensions=EXTENSIONS):
+    """
+    Sorted paths of the csv and TrackMate xml files of a directory. Results
+    of previous analyses saved in the directory are skipped.
+    """
+    files = [os.path.join(directory, f)
+             for f in sorted(os.listdir(directory))
+             if f.lower().endswith(tuple(extensions))]
+    return [f for f in files if os.path.isfile(f) and
+            not _is_results_file(f)]
+
+
+def read_track_file(path, columns=None, compact=True):
+    """
+    Read the tracks of a csv or TrackMate xml file.
+
+    Parameters
+    ----------
+    path : str
+        csv or xml file
+    columns : dict
+        columns of a csv file and their names in the analysis, see
+        `reader.read_tracks`, default value : None, the file uses the names
+        of the analysis
+    compact : bool
+        see `reader.read_tracks`, default value : True
+
+    Returns
+    -------
+    pd.DataFrame with "TRACK_ID", "FRAME" and "MEAN_INTENSITY_CH1" columns
+    """
+    if path.lower().endswith(".xml"):
+        return read_trackmate_xml(path)
+    if columns is None:
+        columns = {c: c for c in ["TRACK_ID", "FRAME",
+                                  "MEAN_INTENSITY_CH1"]}
+    return read_csv_file(path, columns=columns, compact=compact)
+
+
+def read_directory(directory, columns=None, n_threads=None, progress=None):
+    """
+    Read all track files of a directory in one dataframe.
+
+    Parameters
+    ----------
+    directory : str
+    columns : dict
+        see `read_track_file`
+    n_threads : int
+        number of files read at the same time, default value : None, the
+        default of ThreadPoolExecutor
+    progress : function
+        called with (file name, number of files read, number of files)
+        after each file, default value : None
+
+    Returns
+    -------
+    pd.DataFrame, tracks of all files with a "FILE" column, the name of
+    their file
+
+    Description
+    -----------
+    Files are read on a thread pool, the parsers release the GIL. Tracks
+    are identified by ("FILE", "TRACK_ID").
+    """
+    files = list_track_files(directory)
+    datas = []
+    with ThreadPoolExecutor(n_threads) as executor:
+        futures = {executor.submit(read_track_file, f, columns): f
+                   for f in files}
+        for n_done, future in enumerate(as_completed(futures), 1):
+            name = os.path.basename(futures[future])
+            datas.append(future.result().assign(FILE=name))
+            if progress is not None:
+                progress(name, n_done, len(files))
+    if not datas:
+        return pd.DataFrame(columns=["TRACK_ID", "FRAME",
+                                     "MEAN_INTENSITY_CH1", "FILE"])
+    datas = pd.concat(datas, ignore_index=True)
+    datas["FILE"] = datas["FILE"].astype("category")
+    return datas
+
+
+def _track_batches(df, batch_size):
+    # Tracks of df in batches of batch_size tracks, at least one batch
+    indices = df.groupby("TRACK_ID").indices
+    if len(indices) <= batch_size:
+        yield df
+        return
+    ids = sorted(indices)
+    for first in range(0, len(ids), batch_size):
+        yield df.iloc[np.concatenate([indices[i] for i in
+                                      ids[first:first + batch_size]])]
+
+
+def directory_analysis(directory,
+                       columns=None,
+                       n_jobs=None,
+                       n_threads=None,
+                       progress=None,
+                       batch_size=BATCH_TRACKS,
+                       **kwargs):
+    """
+    Analyse all track files of a directory.
+
+    Parameters
+    ----------
+    directory : str
+    columns : dict
+        see `read_track_file`
+    n_jobs : int
+        number of processes of the analysis, default value : None, all
+        processors, reduced to fit in the memory budget
+    n_threads : int
+        number of files read at the same time, default value : None
+    progress : function
+        called with (file name, status, number of files done, number of
+        files) when a file is read ("read"), analysed ("done") or fails
+        ("error: ..."), default value : None
+    batch_size : int
+        number of tracks analysed by one task, default value : BATCH_TRACKS
+    kwargs : dict
+        parameters given to `tracks_analysis`, e.g. delta_t, protein_size,
+        models or qc_thresholds
+
+    Returns
+    -------
+    pd.DataFrame, results of `tracks_analysis` of all files with a "file"
+    column
+
+    Description
+    -----------
+    Files are read on a thread pool and the tracks of each file are
+    analysed by batches on a process pool as soon as it is read, so reading
+    and analysis overlap and a large file uses all the processes. A file
+    that can not be read or analysed is reported and skipped.
+    """
+    files = list_track_files(directory)
+    largest = max((os.path.getsize(f) for f in files), default=0)
+    _, n_jobs = plan_batch(len(files), 3 * largest, n_jobs, WORKER_MEMORY)
+
+    def report(name, status, n_done):
+        if status.startswith("error"):
+            warnings.warn(name + ": " + status, UserWarning)
+        if progress is not None:
+            progress(name, status, n_done, len(files))
+
+    results = []
+    n_done = 0
+    # Results of the batches of each file being analysed, None once a batch
+    # failed, and number of batches not done
+    parts = {}
+    pending = {}
+    with ThreadPoolExecutor(n_threads) as reader, \
+            ProcessPoolExecutor(n_jobs) as executor:
+        reads = {reader.submit(read_track_file, f, columns): f
+                 for f in files}
+        analyses = {}
+        for future in as_completed(reads):
+            name = os.path.basename(reads[future])
+            try:
+                df = future.result()
+            except Exception as e:
+                n_done += 1
+                report(name, "error: " + str(e), n_done)
+                continue
+            report(name, "read", n_done)
+            parts[name] = []
+            pending[name] = 0
+            for batch in _track_batches(df, batch_size):
+                analyses[executor.submit(tracks_analysis, batch,
+                                         **kwargs)] = name
+                pending[name] += 1
+            del df
+
+        for future in as_completed(analyses):
+            name = analyses.pop(future)
+            pending[name] -= 1
+            try:
+                res = future.result()
+            except Exception as e:
+                if parts[name] is not None:
+                    n_done += 1
+                    report(name, "error: " + str(e), n_done)
+                parts[name] = None
+                continue
+            if parts[name] is None:
+                continue
+            parts[name].append(res)
+            if pending[name] == 0:
+                n_done += 1
+                res = pd.concat(parts.pop(name), ignore_index=True)
+                res.insert(0, "file", name)
+                results.append(res)
+                report(name, "done", n_done)
+
+    if not results:
+        return pd.DataFrame(columns=["file", "elongation_r",
+                                     "init_translation_r", "dt", "id"])
+    return pd.concat(results, ignore_index=True).sort_values(
+        ["file", "id"], ignore_index=True)
@@ -0,0 +1,338 @@
+import json
+import warnings
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import cKDTree
+
+from kinetic_analysis.analysis.analysis_track import fit_function
+from kinetic_analysis.analysis.analysis_population import (tracks_to_matrix,
+                                                           batch_autocorrelation)
+
+# Increase when the model used to build the index changes, saved indexes
+# built with another version need to be rebuilt
+LOOKUP_VERSION = 1
+
+
+def analytic_model(tau, elongation_r, init_translation_r, protein_size,
+                   delta_t=None, track_length=None):
+    """
+    Expected autocorrelation given by `fit_function`.
+
+    Parameters
+    ----------
+    tau : np.array
+        time delays
+    elongation_r : float or np.array
+        elongation rate in aa/sec
+    init_translation_r : float or np.array
+        time between two initiations, same convention as the fit
+    protein_size : int
+        size of the protein (+ suntag) in amino acid
+    delta_t, track_length : not used by this model, kept to have the same
+        signature as other models, e.g. the one of `expected_model`
+
+    Returns
+    -------
+    np.array of shape (broadcast shape of the rates, len(tau)), G(tau)
+    """
+    t = np.asarray(protein_size / np.asarray(elongation_r))[..., None]
+    c = np.asarray(1 / np.asarray(init_translation_r))[..., None]
+    return fit_function(np.asarray(tau), t, c)
+
+
+def feature_lags(delta_t, track_length, n_features=24):
+    """
+    Time delays used to describe an autocorrelation curve in the index.
+
+    Parameters
+    ----------
+    delta_t : float
+        time between two time point in sec
+    track_length : int
+        number of time points of a track
+    n_features : int
+        maximum number of time delays, default value : 24
+
+    Returns
+    -------
+    np.array of time delays, log spaced between delta_t and half the track
+    """
+    max_lag = max(int(track_length / 2 - 1), 2)
+    lags = np.unique(np.round(np.geomspace(1, max_lag, n_features)))
+    return lags * delta_t
+
+
+def curve_features(g_auto):
+    """
+    Reduced features of autocorrelation curves.
+
+    Parameters
+    ----------
+    g_auto : np.array
+        G(tau) at the feature lags, shape (number of curves, number of lags)
+
+    Returns
+    -------
+    np.array, log of the amplitude of the first lag followed by the shape
+    of the curve relative to this first lag. nan when the amplitude is not
+    positive.
+    """
+    g_auto = np.atleast_2d(g_auto)
+    amplitude = g_auto[:, :1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amplitude = np.where(amplitude > 0, amplitude, np.nan)
+        return np.hstack([np.log(amplitude), g_auto[:, 1:] / amplitude])
+
+
+def build_lookup_index(elongation_rates,
+                       init_translation_rates,
+                       protein_sizes,
+                       delta_ts,
+                       track_lengths,
+                       model=analytic_model,
+                       n_features=24):
+    """
+    Build an index of expected autocorrelation curves.
+
+    Parameters
+    ----------
+    elongation_rates : list
+        elongation rates in aa/sec of the grid
+    init_translation_rates : list
+        time between two initiations of the grid
+    protein_sizes : list
+        protein (+ suntag) sizes in amino acid of the grid
+    delta_ts : list
+        time steps in sec of the grid
+    track_lengths : list
+        number of time points of a track of the grid
+    model : function
+        expected autocorrelation, with the same signature as
+        `analytic_model` and vectorized over the rates, default value :
+        `analytic_model`. Use `generator_expected.expected_model` to
+        include the suntag profile, dt and the track length.
+    n_features : int
+        number of time delays used to describe a curve
+
+    Returns
+    -------
+    index : dict
+        one partition per (protein size, dt, track length), each with a
+        KD-tree over the curve features of the (elongation, initiation) grid
+
+    Description
+    -----------
+    Protein size, dt and track length are known for an experiment, so they
+    select a partition of the index. Elongation and initiation rates are
+    then found by a nearest neighbour query on the features of the curve.
+    """
+    params = np.array(list(itertools.product(elongation_rates,
+                                             init_translation_rates)),
+                      dtype=float)
+    partitions = []
+    for protein_size, delta_t, track_length in itertools.product(
+            protein_sizes, delta_ts, track_lengths):
+        tau = feature_lags(delta_t, track_length, n_features)
+        curves = model(tau, params[:, 0], params[:, 1], protein_size,
+                       delta_t, track_length)
+        partitions.append(_make_partition(protein_size, delta_t,
+                                          track_length, tau, params,
+                                          curve_features(curves)))
+    return {"version": LOOKUP_VERSION,
+            "model": getattr(model, "__name__", str(model)),
+            "partitions": partitions}
+
+
+def _make_partition(protein_size, delta_t, track_length, tau, params,
+                    features):
+    keep = np.isfinite(features).all(axis=1)
+    return {"protein_size": float(protein_size),
+            "delta_t": float(delta_t),
+            "track_length": float(track_length),
+            "tau": tau,
+            "params": params[keep],
+            "features": features[keep],
+            "tree": cKDTree(features[keep])}
+
+
+def _select_partition(index, protein_size, delta_t, track_length):
+    keys = np.log([[p["protein_size"], p["delta_t"], p["track_length"]]
+                   for p in index["partitions"]])
+    target = np.log([protein_size, delta_t, track_length])
+    return index["partitions"][np.argmin(np.abs(keys - target).sum(axis=1))]
+
+
+def query_lookup_index(index, x_auto, g_auto, protein_size, delta_t,
+                       track_length, k=4):
+    """
+    Estimate rates of autocorrelation curves from the index.
+
+    Parameters
+    ----------
+    index : dict
+        see `build_lookup_index`
+    x_auto : np.array
+        time delays of the curves
+    g_auto : np.array
+        G(tau) of one curve or of several curves, shape (number of curves,
+        number of lags)
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    delta_t : float
+        time between two time point in sec
+    track_length : int
+        number of time points of the tracks
+    k : int
+        number of neighbours averaged, default value : 4
+
+    Returns
+    -------
+    elongation_r : np.array
+    translation_init_r : np.array
+    distance : np.array
+        distance to the nearest curve of the index, large values mean the
+        curve is outside of the grid
+
+    Description
+    -----------
+    The partition with the closest (protein size, dt, track length) is
+    used. Rates of the k nearest curves are averaged in log space, weighted
+    by the inverse of their distance.
+    """
+    partition = _select_partition(index, protein_size, delta_t,
+                                  track_length)
+    g_auto = np.atleast_2d(g_auto)
+    curves = np.array([np.interp(partition["tau"], x_auto, g,
+                                 right=np.nan) for g in g_auto])
+    features = curve_features(curves)
+    elongation_r = np.full(len(features), np.nan)
+    translation_init_r = np.full(len(features), np.nan)
+    distance = np.full(len(features), np.nan)
+
+    valid = np.isfinite(features).all(axis=1)
+    if valid.any():
+        k = min(k, len(partition["params"]))
+        d, i = partition["tree"].query(features[valid], k=k)
+        d = d.reshape(-1, k)
+        i = i.reshape(-1, k)
+        w = 1 / np.maximum(d, 1e-12)
+        log_params = np.log(partition["params"][i])
+        estimate = np.exp((w[:, :, None] * log_params).sum(axis=1) /
+                          w.sum(axis=1)[:, None])
+        elongation_r[valid] = estimate[:, 0]
+        translation_init_r[valid] = estimate[:, 1]
+        distance[valid] = d[:, 0]
+    return elongation_r, translation_init_r, distance
+
+
+def lookup_tracks_analysis(df, index, delta_t=0.5, protein_size=1500,
+                           normalise_intensity=1, k=4):
+    """
+    Fit free analysis of all tracks of a dataframe with a lookup index.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    index : dict
+        see `build_lookup_index`
+    delta_t : float
+        time between two time point in sec
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+    k : int
+        number of neighbours averaged, default value : 4
+
+    Returns
+    -------
+    pd.DataFrame with one row per track, with the same columns as the
+    results of the analysis tabs and the distance to the index
+    """
+    ids_track, y, lengths = tracks_to_matrix(df, normalise_intensity)
+    x_auto, g_auto, _ = batch_autocorrelation(y, lengths, delta_t)
+    results = []
+    # Tracks of the same length share the partition of the index
+    for track_length in np.unique(lengths):
+        rows = np.where(lengths == track_length)[0]
+        (elongation_r,
+         translation_init_r,
+         distance) = query_lookup_index(index,
+                                        x_auto,
+                                        g_auto[rows],
+                                        protein_size,
+                                        delta_t,
+                                        track_length,
+                                        k)
+        results.append(pd.DataFrame({"elongation_r": elongation_r,
+                                     "init_translation_r": translation_init_r,
+                                     "dt": delta_t,
+                                     "id": ids_track[rows],
+                                     "distance": distance}))
+    return pd.concat(results, ignore_index=True)
+
+
+def save_lookup_index(index, path):
+    """
+    Save a lookup index to a .npz file.
+
+    Parameters
+    ----------
+    index : dict
+        see `build_lookup_index`
+    path : str
+        file name
+    """
+    arrays = {}
+    meta = {"version": index["version"],
+            "model": index["model"],
+            "partitions": []}
+    for i, p in enumerate(index["partitions"]):
+        meta["partitions"].append({"protein_size": p["protein_size"],
+                                   "delta_t": p["delta_t"],
+                                   "track_length": p["track_length"]})
+        arrays["tau_" + str(i)] = p["tau"]
+        arrays["params_" + str(i)] = p["params"]
+        arrays["features_" + str(i)] = p["features"]
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_lookup_index(path):
+    """
+    Load a lookup index saved with `save_lookup_index`.
+
+    Parameters
+    ----------
+    path : str
+        file name
+
+    Returns
+    -------
+    index : dict, see `build_lookup_index`
+
+    Description
+    -----------
+    A warning is raised if the index was built with another version of the
+    model, it should then be rebuilt with `build_lookup_index`.
+    """
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        partitions = [_make_partition(p["protein_size"],
+                                      p["delta_t"],
+                                      p["track_length"],
+                                      f["tau_" + str(i)],
+                                      f["params_" + str(i)],
+                                      f["features_" + str(i)])
+                      for i, p in enumerate(meta["partitions"])]
+    if meta["version"] != LOOKUP_VERSION:
+        warnings.warn("Lookup index built with version " +
+                      str(meta["version"]) + ", current version is " +
+                      str(LOOKUP_VERSION) + ". Rebuild the index.",
+                      UserWarning)
+    return {"version": meta["version"],
+            "model": meta["model"],
+            "partitions": partitions}
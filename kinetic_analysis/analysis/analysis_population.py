@@ -0,0 +1,373 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from scipy import optimize
+
+from kinetic_analysis.analysis.analysis_track import (fit_autocorrelation_linear,
+                                                      fit_function)
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.memory import chunks, plan_batch
+from kinetic_analysis.utils.track_store import TrackStore
+
+
+def _frame_positions(frames, codes, offsets):
+    """
+    Position of each point in the row of its track.
+
+    Parameters
+    ----------
+    frames : np.array
+        frame of each point, sorted by track and frame
+    codes : np.array
+        row of the track of each point
+    offsets : np.array
+        index of the first point of each track
+
+    Returns
+    -------
+    np.array of int, number of frame steps since the first point of the
+    track
+
+    Description
+    -----------
+    The frame step is the smallest step between two points of a track, so
+    the frames of experiments (numbers) and of simulations (times) are both
+    handled. Missing frames leave empty positions.
+    """
+    frames = np.asarray(frames, dtype=float)
+    relative = frames - frames[offsets[codes]]
+    steps = np.diff(relative)[np.diff(codes) == 0]
+    steps = steps[steps > 0]
+    step = steps.min() if len(steps) else 1.
+    return np.rint(relative / step).astype(np.int64)
+
+
+def tracks_to_matrix(df, normalise_intensity=1):
+    """
+    Put the intensity of all tracks in one matrix.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks, with "TRACK_ID",
+        "FRAME" and "MEAN_INTENSITY_CH1" columns
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+
+    Returns
+    -------
+    ids_track : np.array
+        id of each track, one per row of the matrix
+    y : np.array
+        intensity of the tracks, shape (number of tracks, longest track),
+        padded with nan
+    lengths : np.array
+        number of points of each track
+
+    Description
+    -----------
+    Each point is put at its frame since the first frame of its track, see
+    `_frame_positions`, so missing frames are nan and do not shift the
+    following points.
+    """
+    with profiling.stage("index"):
+        if isinstance(df, TrackStore):
+            # Already sorted, only the frame and the intensity are read
+            ids_track, lengths = df.ids, df.lengths
+            codes = np.repeat(np.arange(len(ids_track)), lengths)
+            points = df.to_frame(columns=["FRAME", "MEAN_INTENSITY_CH1"])
+        else:
+            points = df.sort_values(["TRACK_ID", "FRAME"])
+            ids_track, codes, lengths = np.unique(points["TRACK_ID"].values,
+                                                  return_inverse=True,
+                                                  return_counts=True)
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        position = _frame_positions(points["FRAME"].values, codes,
+                                   offsets.astype(np.int64))
+
+        y = np.full((len(ids_track), position.max(initial=-1) + 1), np.nan)
+        y[codes, position] = (points["MEAN_INTENSITY_CH1"].values /
+                              normalise_intensity)
+    return ids_track, y, lengths
+
+
+def batch_autocorrelation(y, lengths, delta_t=0.5, max_lag=None,
+                          normalize=True, memory_budget=None):
+    """
+    Autocorrelation of all tracks of a matrix in one pass.
+
+    Parameters
+    ----------
+    y : np.array
+        intensity of the tracks, shape (number of tracks, longest track),
+        see `tracks_to_matrix`
+    lengths : np.array
+        number of points of each track
+    delta_t : float
+        time between two images
+    max_lag : int
+        last lag (in number of points) of the autocorrelation, default value
+        : half of the longest track
+    normalize : bool
+        normalize the result to the square of the average input signal and
+        the factor N-k; default value : True
+    memory_budget : int or str
+        memory budget of the FFT, default value : None, the budget set with
+        `utils.memory.set_memory_budget`
+
+    Returns
+    -------
+    x_auto : np.array
+        common lag grid of the autocorrelation
+    g_auto : np.array
+        G(tau) of each track on the lag grid, nan when the lag is longer than
+        the track
+    weights : np.array
+        number of pairs of points N-k used for each G(tau)
+
+    Description
+    -----------
+    All tracks are correlated together with a FFT, which gives a linear lag
+    grid shared by all tracks. Each track is mean subtracted like in
+    `autocorrelation`. Under a memory budget, the tracks are correlated by
+    chunks of rows. Missing points (nan inside a track) are left out, the
+    number of pairs of each lag is then counted with a FFT of the valid
+    points.
+    """
+    lengths = np.asarray(lengths)
+    n_points = y.shape[1]
+    if max_lag is None:
+        max_lag = int(n_points / 2 - 1)
+    max_lag = int(min(max_lag, n_points - 1))
+    lags = np.arange(max_lag + 1)
+
+    valid = ~np.isnan(y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.nansum(y, axis=1) / lengths
+    z = np.where(valid, y - mean[:, None], 0.)
+
+    n_fft = 1 << int(np.ceil(np.log2(2 * max(n_points, 1))))
+    # Tracks with missing frames, their pairs are counted
+    gaps = np.any(valid != (np.arange(n_points) < lengths[:, None]))
+    # Padded track, its spectrum and its correlation, twice with gaps
+    chunk_size, _ = plan_batch(len(y), (64 if gaps else 32) * n_fft,
+                               n_jobs=1, budget=memory_budget)
+    num = np.empty((len(y), max_lag + 1))
+    if gaps:
+        weights = np.empty((len(y), max_lag + 1))
+    with profiling.stage("autocorrelation"):
+        for rows in chunks(len(y), chunk_size):
+            fz = np.fft.rfft(z[rows], n=n_fft, axis=1)
+            num[rows] = np.fft.irfft(fz * np.conj(fz), n=n_fft,
+                                     axis=1)[:, :max_lag + 1]
+            if gaps:
+                fv = np.fft.rfft(valid[rows].astype(float), n=n_fft, axis=1)
+                weights[rows] = np.rint(np.fft.irfft(
+                    fv * np.conj(fv), n=n_fft, axis=1)[:, :max_lag + 1])
+
+    if not gaps:
+        weights = np.clip(lengths[:, None] - lags[None, :], 0, None)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g_auto = num / weights
+        if normalize:
+            g_auto = g_auto / mean[:, None] ** 2
+    g_auto[weights == 0] = np.nan
+
+    return lags * delta_t, g_auto, weights
+
+
+def population_autocorrelation(g_auto, weights):
+    """
+    Length weighted mean of the autocorrelation curves of several tracks.
+
+    Parameters
+    ----------
+    g_auto : np.array
+        G(tau) of each track, see `batch_autocorrelation`
+    weights : np.array
+        weight of each G(tau), usually the number of pairs of points N-k
+
+    Returns
+    -------
+    g_mean : np.array
+        weighted mean of G(tau)
+    g_sem : np.array
+        standard error of the weighted mean
+    """
+    weights = np.where(np.isfinite(g_auto), weights, 0).astype(float)
+    g_auto = np.where(weights > 0, g_auto, 0.)
+    w_sum = weights.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g_mean = (weights * g_auto).sum(axis=0) / w_sum
+        g_var = (weights * (g_auto - g_mean) ** 2).sum(axis=0) / w_sum
+        # Effective number of tracks of each lag
+        n_eff = w_sum ** 2 / (weights ** 2).sum(axis=0)
+        g_sem = np.sqrt(g_var / n_eff)
+    return g_mean, g_sem
+
+
+def fit_population_autocorrelation(x, y, sem=None, func_=fit_function,
+                                   method="original", protein_size=1500,
+                                   first_dot=True):
+    """
+    Fit the population autocorrelation curve.
+
+    Parameters
+    ----------
+    x, y : x and y values of autocorrelation curve
+    sem : standard error of y, used as weight of the fit with the "original"
+        method
+    func_  : function to fit
+    method : str
+        choose the method of the analysis, "linear" or "original"
+    protein_size : in aa in order to calculation the elongation rate
+    first_dot : bool, take the account the first dot in the analysis
+
+    Returns
+    -------
+    elongation_r : float
+    translation_init_r : float
+    perr : list
+        error of elongation_r and translation_init_r
+    """
+    keep = np.isfinite(y)
+    if sem is not None:
+        keep &= np.isfinite(sem) & (sem > 0)
+    if not first_dot:
+        keep[0] = False
+    x = x[keep]
+    y = y[keep]
+
+    if method == "linear":
+        return fit_autocorrelation_linear(x, y, protein_size=protein_size)
+    elif method != "original":
+        return np.nan, np.nan, [np.nan, np.nan]
+
+    sigma = None if sem is None else sem[keep]
+    popt, pcov = optimize.curve_fit(func_,
+                                    x,
+                                    y,
+                                    sigma=sigma,
+                                    absolute_sigma=sigma is not None,
+                                    method="lm")
+    perr = np.sqrt(np.diag(pcov))
+    elongation_r = protein_size / popt[0]
+    translation_init_r = 1 / popt[1]
+    # Propagate the error of t and c to the rates
+    return (elongation_r,
+            translation_init_r,
+            [protein_size * perr[0] / popt[0] ** 2,
+             perr[1] / popt[1] ** 2])
+
+
+def pooled_analysis(df,
+                    delta_t=0.5,
+                    protein_size=1500,
+                    group_col=None,
+                    normalise_intensity=1,
+                    normalise_auto=True,
+                    max_lag=None,
+                    method="original",
+                    first_dot=True,
+                    func_=fit_function):
+    """
+    Analysis of the population averaged autocorrelation of all tracks.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    delta_t : float
+        time between two time point in sec
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    group_col : str
+        column of df used to make one fit per condition, default value :
+        None, one fit for all tracks
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+    normalise_auto : bool
+        normalise for the autocorrelation, default value : True
+    max_lag : int
+        last lag (in number of points) of the autocorrelation, default value
+        : None
+    method : str
+        choose the method of the analysis, "linear" or "original"
+    first_dot : bool
+        use the first point in the analysis, default value :True
+    func_ : function
+        function to fit with the "original" method
+
+    Returns
+    -------
+    results : pd.DataFrame
+        one row per group with the number of tracks, the estimated rates
+        and their errors
+    curves : pd.DataFrame
+        mean autocorrelation curve of each group with its standard error
+
+    Description
+    -----------
+    Autocorrelation of all tracks are computed on a common lag grid and
+    averaged, weighted by the number of pairs of points of each lag. The
+    averaged curve is then fitted once per group. Columns names are the same
+    as in `single_track_analysis`.
+    """
+    if group_col is None:
+        groups = [(None, df)]
+    elif isinstance(df, TrackStore):
+        # The group of a track is its first value of group_col
+        values = df.track_values(group_col)
+        groups = [(name, df.select(ids))
+                  for name, ids in values.groupby(values).groups.items()]
+    else:
+        groups = df.groupby(group_col)
+
+    results = []
+    curves = []
+    for name, df_group in groups:
+        ids_track, y, lengths = tracks_to_matrix(df_group,
+                                                 normalise_intensity)
+        x_auto, g_auto, weights = batch_autocorrelation(y,
+                                                        lengths,
+                                                        delta_t,
+                                                        max_lag,
+                                                        normalise_auto)
+        g_mean, g_sem = population_autocorrelation(g_auto, weights)
+        try:
+            (elongation_r,
+             translation_init_r,
+             perr) = fit_population_autocorrelation(x_auto,
+                                                    g_mean,
+                                                    g_sem,
+                                                    func_,
+                                                    method,
+                                                    protein_size,
+                                                    first_dot)
+        except (RuntimeError, ValueError, IndexError) as e:
+            warnings.warn("Pooled fit failed for group " + str(name) + ": "
+                          + str(e), UserWarning)
+            elongation_r, translation_init_r, perr = (np.nan, np.nan,
+                                                      [np.nan, np.nan])
+
+        results.append({"group": name,
+                        "n_tracks": len(ids_track),
+                        "elongation_r": elongation_r,
+                        "init_translation_r": translation_init_r,
+                        "elongation_r_err": perr[0],
+                        "init_translation_r_err": perr[1],
+                        "dt": delta_t})
+        curves.append(pd.DataFrame({"group": name,
+                                    "tau": x_auto,
+                                    "G": g_mean,
+                                    "sem": g_sem,
+                                    "weight": weights.sum(axis=0)}))
+
+    results = pd.DataFrame(results)
+    curves = pd.concat(curves, ignore_index=True)
+    if group_col is not None:
+        results.rename(columns={"group": group_col}, inplace=True)
+        curves.rename(columns={"group": group_col}, inplace=True)
+    return results, curves
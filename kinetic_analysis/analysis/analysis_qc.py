@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.utils.track_store import TrackStore
+
+# Thresholds used to reject tracks before the analysis
+DEFAULT_THRESHOLDS = {
+    "min_length": 10,
+    "min_unique": 2,
+    "min_variance": 0,
+    "max_gap_fraction": 0.2,
+    "min_snr": 0,
+}
+
+
+def track_quality(df, delta_t=0.5, simulation=False):
+    """
+    Quality criteria of all tracks of a dataframe in one pass.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks, a store is read by
+        chunks of tracks
+    delta_t : float
+        time between two time point in sec
+    simulation : bool
+        define if the track come from a simulation (True), FRAME is then
+        a time in sec, or an experiment (False), FRAME is then a frame
+        number, default value : False
+
+    Returns
+    -------
+    pd.DataFrame with one row per track, indexed by TRACK_ID, with
+    - "length", number of points
+    - "unique", number of different intensity values
+    - "variance", variance of the intensity
+    - "gap_fraction", fraction of missing time points between the first
+      and the last point
+    - "snr", mean intensity divided by the noise, estimated from the median
+      absolute difference between consecutive points
+    """
+    if isinstance(df, TrackStore):
+        columns = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+        return pd.concat([track_quality(store.to_frame(columns=columns),
+                                        delta_t, simulation)
+                          for store in df.chunks()])
+    df = df.sort_values(["TRACK_ID", "FRAME"])
+    frame_step = delta_t if simulation else 1
+    grouped = df.groupby("TRACK_ID", sort=False)
+    intensity = grouped["MEAN_INTENSITY_CH1"]
+
+    qc = pd.DataFrame({"length": grouped.size(),
+                       "unique": intensity.nunique(),
+                       "variance": intensity.var(ddof=0),
+                       "mean": intensity.mean()})
+    duration = grouped["FRAME"].max() - grouped["FRAME"].min()
+    expected = np.rint(duration / frame_step) + 1
+    qc["gap_fraction"] = np.clip(1 - qc["length"] / expected, 0, None)
+
+    # Noise of a gaussian white noise from the differences of consecutive
+    # points, robust to the slow fluctuations of the signal
+    diff = grouped["MEAN_INTENSITY_CH1"].diff().abs()
+    noise = diff.groupby(df["TRACK_ID"]).median() / (0.6745 * np.sqrt(2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        qc["snr"] = qc["mean"] / noise
+    return qc.drop(columns="mean")
+
+
+def filter_tracks(qc, thresholds=None):
+    """
+    Reject tracks that can not be analysed.
+
+    Parameters
+    ----------
+    qc : pd.DataFrame
+        see `track_quality`
+    thresholds : dict
+        values of `DEFAULT_THRESHOLDS` to change, default value : None
+
+    Returns
+    -------
+    pd.DataFrame, qc with a "keep" column and a "reason" column that lists
+    the criteria a rejected track does not reach
+    """
+    t = dict(DEFAULT_THRESHOLDS)
+    t.update(thresholds or {})
+    criteria = {"too short": qc["length"] < t["min_length"],
+                "constant": qc["unique"] < t["min_unique"],
+                "low variance": ~(qc["variance"] > t["min_variance"]),
+                "gaps": qc["gap_fraction"] > t["max_gap_fraction"],
+                "low snr": qc["snr"] < t["min_snr"]}
+
+    qc = qc.copy()
+    reason = pd.Series("", index=qc.index)
+    for name, rejected in criteria.items():
+        prefix = (reason + ", ").where(reason != "", "")
+        reason = reason.where(~rejected, prefix + name)
+    qc["keep"] = reason == ""
+    qc["reason"] = reason
+    return qc
+
+
+def prescreen_tracks(df, delta_t=0.5, simulation=False, thresholds=None):
+    """
+    Keep only the tracks that can be analysed.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    delta_t : float
+        time between two time point in sec
+    simulation : bool
+        see `track_quality`
+    thresholds : dict
+        see `filter_tracks`
+
+    Returns
+    -------
+    df : pd.df or TrackStore
+        tracks that pass the quality criteria
+    qc : pd.DataFrame
+        quality criteria and reason of rejection of every track
+    """
+    qc = filter_tracks(track_quality(df, delta_t, simulation), thresholds)
+    if isinstance(df, TrackStore):
+        return df.select(qc.index[qc["keep"]]), qc
+    return df[df["TRACK_ID"].isin(qc.index[qc["keep"]])], qc
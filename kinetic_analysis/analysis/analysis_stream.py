@@ -0,0 +1,93 @@
+import itertools
+
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import tracks_analysis
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.reader import iter_tracks_csv
+
+# Columns read from the file
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+def _batches(tracks, batch_size):
+    tracks = iter(tracks)
+    while True:
+        batch = list(itertools.islice(tracks, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_tracks_analysis(path,
+                           output=None,
+                           columns=None,
+                           chunksize=100000,
+                           sorted_input=True,
+                           batch_size=500,
+                           progress=None,
+                           **kwargs):
+    """
+    Analyse the tracks of a csv file while it is read.
+
+    Parameters
+    ----------
+    path : str
+        csv file of tracks, see `reader.read_tracks`
+    output : str
+        csv file where the results are written after each batch of tracks,
+        default value : None, results are returned
+    columns : dict
+        columns of the file that contain the track id, the frame and the
+        intensity and their names in the analysis, e.g. {"Track ID":
+        "TRACK_ID", "Frame": "FRAME", "Mean ch1": "MEAN_INTENSITY_CH1"},
+        default value : None, the file uses the names of the analysis
+    chunksize : int
+        number of rows read at once, default value : 100000
+    sorted_input : bool
+        the rows of a track are contiguous in the file, see
+        `reader.iter_tracks_csv`, default value : True
+    batch_size : int
+        number of complete tracks analysed together, default value : 500
+    progress : function
+        called with the number of tracks analysed after each batch, default
+        value : None
+    kwargs : dict
+        parameters given to `tracks_analysis`, e.g. delta_t, protein_size,
+        models or qc_thresholds
+
+    Returns
+    -------
+    pd.DataFrame, results of `tracks_analysis` for all tracks, or the
+    number of tracks analysed when output is given
+
+    Description
+    -----------
+    Only the columns used by the analysis are read. Each track is analysed
+    as soon as all its rows are read. With output, results are appended to
+    the file and not kept, so the memory does not depend on the size of the
+    input file.
+    """
+    if columns is None:
+        columns = {c: c for c in COLUMNS}
+    tracks = iter_tracks_csv(path, columns, chunksize, sorted_input)
+    results = []
+    n_tracks = 0
+    for batch in _batches(tracks, batch_size):
+        df = pd.concat([track for _, track in batch], ignore_index=True)
+        res = tracks_analysis(df, **kwargs)
+        if output is None:
+            results.append(res)
+        else:
+            with profiling.stage("write"):
+                res.to_csv(output, mode="a" if n_tracks else "w",
+                           header=n_tracks == 0, index=False)
+        n_tracks += len(batch)
+        if progress is not None:
+            progress(n_tracks)
+
+    if output is not None:
+        return n_tracks
+    if not results:
+        return tracks_analysis(pd.DataFrame(columns=COLUMNS), **kwargs)
+    return pd.concat(results, ignore_index=True)
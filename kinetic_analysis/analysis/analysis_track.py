@@ -1,3 +1,4 @@
+import logging
 import multipletau
 import warnings
 
@@ -9,6 +10,12 @@ from scipy import optimize
 import scipy.signal
 import scipy.io.wavfile
 
+from kinetic_analysis.analysis.analysis_qc import prescreen_tracks
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.diagnostics import logger, record
+from kinetic_analysis.utils.memory import plan_batch
+from kinetic_analysis.utils.track_store import TrackStore
+
 
 def autocorrelation(y, delta_t=0.5, normalize=True, mm=None):
     """
@@ -117,10 +124,18 @@ def fit_autocorrelation_original(x, y, func_=fit_function, method='lm',
         x = x[1:]
         y = y[1:]
     # print("original method")
-    popt, pcov = optimize.curve_fit(func_,
-                                    x,
-                                    y,
-                                    method=method)
+    if profiling.is_profiling():
+        popt, pcov, info, _, _ = optimize.curve_fit(func_,
+                                                    x,
+                                                    y,
+                                                    method=method,
+                                                    full_output=True)
+        profiling.add_nfev("fit", info["nfev"])
+    else:
+        popt, pcov = optimize.curve_fit(func_,
+                                        x,
+                                        y,
+                                        method=method)
 
     elongation_r = protein_size / popt[0]
     translation_init_r = 1 / popt[1]
@@ -129,7 +144,8 @@ def fit_autocorrelation_original(x, y, func_=fit_function, method='lm',
 
 
 # old fit_autocorrelation_v2
-def fit_autocorrelation_linear(x, y, protein_size=1200):
+def fit_autocorrelation_linear(x, y, protein_size=1200, diagnostics=None,
+                               id_track=None):
     """
     Fit autocorrelation using a linear method.
 
@@ -141,6 +157,11 @@ def fit_autocorrelation_linear(x, y, protein_size=1200):
         aucorrelation value
     protein_size : int
         size of the protein in amino acid
+    diagnostics : Diagnostics
+        record of the fit events, see `utils.diagnostics`, default value :
+        None
+    id_track : int
+        id of the track, used in the diagnostics
 
     Returns
     -------
@@ -160,9 +181,10 @@ def fit_autocorrelation_linear(x, y, protein_size=1200):
     signchange[0] = 0
     if len(np.where(signchange == 1)[0]) == 0:
         t_sign = -1
+        record(diagnostics, id_track, "fit", "no sign change of the slope",
+               logging.INFO)
     else:
         t_sign = np.where(signchange == 1)[0][0]
-    print(t_sign)
 
     # find when the curve cross the x axis
     ysignvalue = np.sign(y)
@@ -172,19 +194,153 @@ def fit_autocorrelation_linear(x, y, protein_size=1200):
         t = t_xaxis
     else:
         t = t_sign
-    print(t_xaxis)
-    print(t)
-    print(x[:t])
-    print(y[:t])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("track %s, fit: t_sign %s, t_xaxis %s, t %s, x %s, y %s",
+                     id_track, t_sign, t_xaxis, t, x[:t], y[:t])
 
     elongation_r = protein_size / x[t]
     if len(x[:t]) < 2:
+        record(diagnostics, id_track, "fit",
+               "less than 2 points before the cut, no linear fit",
+               logging.WARNING, t=int(t))
         return -1, -1, [-1, -1]
+    record(diagnostics, id_track, "fit", "linear fit", logging.DEBUG,
+           t_sign=int(t_sign), t_xaxis=int(t_xaxis), t=int(t))
     res_fit = np.polyfit(x[:t], y[:t], 1)
     translation_init_r = (res_fit[1] * x[t])
     return elongation_r, translation_init_r, [-1, -1]
 
 
+def extract_track(df,
+                  id_track=0,
+                  delta_t=0.5,
+                  normalise_intensity=1,
+                  simulation=False):
+    """
+    Extract time points and intensity of one track inside a dataframe.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    id_track : int
+        id of the track that will be extracted
+    delta_t : float
+        time between two time point in sec
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+    simulation : bool
+        define if the track come from a simulation (True) or an experiment
+        (False), default value : False
+
+    Returns
+    -------
+    x : np.array
+        list of time point of the track, starting at 0
+    y : np.array
+        list of fluorescent intensity of the track
+    """
+    with profiling.stage("filter"):
+        if isinstance(df, TrackStore):
+            # Points of a track are contiguous and sorted in a store
+            frames, intensity = df.track(id_track)
+        else:
+            track = df[df["TRACK_ID"] == id_track].sort_values('FRAME')
+            frames = track['FRAME'].values
+            intensity = track['MEAN_INTENSITY_CH1'].values
+    # Extract time point and multiply by delta_t to get the real time of
+    # each frame
+    x = frames - min(frames)
+    if not simulation:
+        x = x * delta_t
+    # Extract intensity value, in float64 when it is stored in float32
+    y = np.asarray(intensity, dtype=float) / normalise_intensity
+    return x, y
+
+
+def track_autocorrelation(df,
+                          id_track=0,
+                          delta_t=0.5,
+                          normalise_intensity=1,
+                          normalise_auto=True,
+                          mm=None,
+                          rtol=1e-4,
+                          force_analysis=False,
+                          simulation=False,
+                          diagnostics=None):
+    """
+    Extract one track, check its continuity and perform its autocorrelation.
+
+    Parameters
+    ----------
+    see `single_track_analysis`
+
+    Returns
+    -------
+    x : np.array
+        list of time point of the track
+    y : np.array
+        list of fluorescent intensity of the track
+    x_auto : np.array
+        list of time point of the autocorrelation, None if the track is not
+        continuous and the analysis is not forced
+    y_auto : np.array
+        list of G(t) of the autocorrelation, None if the track is not
+        continuous and the analysis is not forced
+    """
+
+    x, y = extract_track(df,
+                         id_track,
+                         delta_t=delta_t,
+                         normalise_intensity=normalise_intensity,
+                         simulation=simulation)
+
+    # Check if time is continuous and fix it if gap not too big
+    with profiling.stage("continuity"):
+        continuous = check_continuous_time(x, delta_t, rtol=rtol)
+    if not continuous:
+        record(diagnostics, id_track, "continuity", "time not continuous",
+               logging.INFO)
+        times_diff = np.diff(x)[
+            np.where(np.isclose(np.diff(x), delta_t, rtol=rtol) == False)]
+        if (times_diff < (5 * delta_t)).all():
+            # fix the time difference if it misses less than 5 points
+            record(diagnostics, id_track, "continuity", "gap fixed",
+                   logging.INFO, n_gaps=len(times_diff))
+            i = 0
+            while i < (len(x) - 1):
+                if np.round(x[i] - x[i + 1], decimals=2) > delta_t:
+                    x = x[:i + 1] + [(x[i] + x[i + 1]) / 2] + x[i + 1:]
+                i += 1
+        else:
+            if not force_analysis:
+                record(diagnostics, id_track, "continuity",
+                       "gap too large, track not analysed", logging.WARNING,
+                       n_gaps=len(times_diff))
+                return x, y, None, None
+            else:
+                record(diagnostics, id_track, "continuity",
+                       "gap too large, analysis forced", logging.WARNING,
+                       n_gaps=len(times_diff))
+                warnings.warn("Analysis is forced for track " + str(id_track),
+                              UserWarning)
+
+    # Perform the autocorrelation
+    with profiling.stage("autocorrelation"):
+        x_auto, y_auto = autocorrelation(y, delta_t, normalise_auto, mm)
+
+    return x, y, x_auto, y_auto
+
+
+def _record_fit_warnings(caught, diagnostics, id_track, **details):
+    # Warnings of a fit (e.g. OptimizeWarning when the covariance can not be
+    # estimated) are recorded instead of being printed
+    for w in caught:
+        record(diagnostics, id_track, "fit",
+               "fit warning: " + w.category.__name__, logging.WARNING,
+               message=str(w.message), **details)
+
+
 def single_track_analysis(df,
                           id_track=0,
                           delta_t=0.5,
@@ -197,14 +353,15 @@ def single_track_analysis(df,
                           force_analysis=False,
                           first_dot=True,
                           simulation=False,
-                          func_=fit_function):
+                          func_=fit_function,
+                          diagnostics=None):
     """
     Analysis of one track inside a dataframe.
 
     Parameters
     ----------
-    df : pd.df
-        dataframe that contains tracks
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
     id_track : int
         id of the track that will be analysed
     delta_t : float
@@ -231,6 +388,12 @@ def single_track_analysis(df,
     simulation : bool
         define if the track come from a simulation (True) or an experiment
         (False), default value : False
+    func_ : function
+        function to fit with the "original" method
+    diagnostics : Diagnostics
+        record of the events of the analysis (gap fixes, fallbacks, fit
+        status), see `utils.diagnostics`, default value : None, events are
+        only logged
 
     Returns
     -------
@@ -259,62 +422,55 @@ def single_track_analysis(df,
     - "MEAN_INTENSITY_CH1", correspond to the fluorescence intensity
     if the dataframe doesn't have these names, use rename_columns function
     to rename column(s).
+    Warnings of the fit (e.g. OptimizeWarning) and its failures are recorded
+    in the diagnostics, a failed fit still raises its error.
     """
 
-    #### METTRE CETTE PREMIERE PARTIE DANS UNE FONCTION A PART
-    # Extract time point and multiply by delta_t to get the real time of
-    # each frame
-    x = (df[df["TRACK_ID"] == id_track].sort_values('FRAME')[
-             'FRAME'].values -
-         min(df[df["TRACK_ID"] == id_track].sort_values('FRAME')[
-                 'FRAME'].values))
-    if not simulation:
-        x = x * delta_t
-    # Extract intensity value
-    y = (df[df["TRACK_ID"] == id_track].sort_values('FRAME')[
-             'MEAN_INTENSITY_CH1'].values / normalise_intensity)
-
-    # Check if time is continuous and fix it if gap not too big
-    if not check_continuous_time(x, delta_t, rtol=rtol):
-        print("Time not continuous")
-        times_diff = np.diff(x)[
-            np.where(np.isclose(np.diff(x), delta_t, rtol=rtol) == False)]
-        if (times_diff < (5 * delta_t)).all():
-            # fix the time difference if it misses less than 5 points
-            print("to fix")
-            i = 0
-            while i < (len(x) - 1):
-                if np.round(x[i] - x[i + 1], decimals=2) > delta_t:
-                    x = x[:i + 1] + [(x[i] + x[i + 1]) / 2] + x[i + 1:]
-                i += 1
-        else:
-            print("not fix")
-            if not force_analysis:
-                return np.repeat(np.nan, 7)
-            else:
-                warnings.warn("Analysis is forced for track " + str(id_track),
-                              UserWarning)
-
-    # Perform the autocorrelation
-    x_auto, y_auto = autocorrelation(y, delta_t, normalise_auto, mm)
+    x, y, x_auto, y_auto = track_autocorrelation(df,
+                                                 id_track,
+                                                 delta_t,
+                                                 normalise_intensity,
+                                                 normalise_auto,
+                                                 mm,
+                                                 rtol,
+                                                 force_analysis,
+                                                 simulation,
+                                                 diagnostics)
+    if x_auto is None:
+        return np.repeat(np.nan, 7)
 
     # Apply the method of analysis
-    if method == "original":
-        (elongation_r,
-         translation_init_r,
-         perr) = fit_autocorrelation_original(x_auto,
-                                              y_auto,
-                                              func_,
-                                              protein_size=protein_size,
-                                              first_dot=first_dot)
-    elif method == "linear":
-        (elongation_r,
-         translation_init_r,
-         perr) = fit_autocorrelation_linear(x_auto,
-                                            y_auto,
-                                            protein_size=protein_size)
-    else:
-        (elongation_r, translation_init_r, perr) = np.nan, np.nan, np.nan
+    with profiling.stage("fit"), \
+            warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always", optimize.OptimizeWarning)
+        try:
+            if method == "original":
+                (elongation_r,
+                 translation_init_r,
+                 perr) = fit_autocorrelation_original(
+                    x_auto, y_auto, func_, protein_size=protein_size,
+                    first_dot=first_dot)
+            elif method == "linear":
+                (elongation_r,
+                 translation_init_r,
+                 perr) = fit_autocorrelation_linear(x_auto,
+                                                    y_auto,
+                                                    protein_size=protein_size,
+                                                    diagnostics=diagnostics,
+                                                    id_track=id_track)
+            else:
+                elongation_r, translation_init_r, perr = (np.nan, np.nan,
+                                                          np.nan)
+        except (RuntimeError, ValueError, ZeroDivisionError, IndexError) as e:
+            _record_fit_warnings(caught, diagnostics, id_track, method=method)
+            record(diagnostics, id_track, "fit",
+                   "fit failed: " + type(e).__name__, logging.WARNING,
+                   method=method, message=str(e))
+            raise
+    _record_fit_warnings(caught, diagnostics, id_track, method=method)
+    record(diagnostics, id_track, "fit", "fit done", logging.DEBUG,
+           method=method, elongation_r=elongation_r,
+           init_translation_r=translation_init_r)
 
     return x, y, x_auto, y_auto, elongation_r, translation_init_r, perr
 
@@ -338,3 +494,293 @@ def check_continuous_time(x, dt, rtol=0.001):
     boolean, True if track is continuous, else False
     """
     return np.allclose(np.diff(x), dt, rtol=rtol)
+
+
+def compile_models(models):
+    """
+    Prepare a list of models for `fit_models`.
+
+    Parameters
+    ----------
+    models : list
+        each model can be "original" (`fit_function`), "linear" (linear
+        method), an equation in x, t and c (see `validate_equation`), a
+        function f(x, t, c) or a (name, function) tuple
+
+    Returns
+    -------
+    list of (name, method, function), compiled models are kept as they are
+    """
+    compiled = []
+    for model in models:
+        if isinstance(model, tuple) and len(model) == 3:
+            # Already compiled
+            compiled.append(model)
+        elif isinstance(model, tuple):
+            compiled.append((model[0], "original", model[1]))
+        elif callable(model):
+            compiled.append((model.__name__, "original", model))
+        elif model == "original":
+            compiled.append(("original", "original", fit_function))
+        elif model == "linear":
+            compiled.append(("linear", "linear", fit_function))
+        else:
+            compiled.append((model, "original", fit_function_string(model)))
+    return compiled
+
+
+def fit_models(x, y, models, protein_size=1500, first_dot=True,
+               diagnostics=None, id_track=None):
+    """
+    Fit several models on the same autocorrelation curve.
+
+    Parameters
+    ----------
+    x, y : x and y values of autocorrelation curve
+    models : list
+        models to fit, see `compile_models`
+    protein_size : in aa in order to calculation the elongation rate
+    first_dot : bool, take the account the first dot in the analysis
+    diagnostics : Diagnostics, record of the fit status, default value : None
+    id_track : int, id of the track, used in the diagnostics
+
+    Returns
+    -------
+    list of dict, one per model, with the estimated rates, the error, the
+    residual sum of squares, the AIC and the BIC, all NaN when the fit
+    fails
+
+    Description
+    -----------
+    Residuals of every model are computed on the same points, the ones used
+    by the "original" method. The linear method is compared through the
+    curve of `fit_function` given by its estimated rates.
+    AIC = n log(RSS/n) + 2p and BIC = n log(RSS/n) + p log(n), with p = 2
+    fitted parameters.
+    """
+    models = compile_models(models)
+    x_fit = x if first_dot else x[1:]
+    y_fit = y if first_dot else y[1:]
+    n = len(x_fit)
+
+    fits = []
+    for name, method, func_ in models:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", optimize.OptimizeWarning)
+            try:
+                with profiling.stage("fit"):
+                    if method == "linear":
+                        (elongation_r,
+                         translation_init_r,
+                         perr) = fit_autocorrelation_linear(
+                            x, y, protein_size=protein_size,
+                            diagnostics=diagnostics, id_track=id_track)
+                    else:
+                        (elongation_r,
+                         translation_init_r,
+                         perr) = fit_autocorrelation_original(
+                            x, y, func_, protein_size=protein_size,
+                            first_dot=first_dot)
+                if method == "linear" and not elongation_r > 0:
+                    # -1 when the linear method can not fit the curve, the
+                    # failure is already recorded
+                    elongation_r, translation_init_r = np.nan, np.nan
+                    perr = [np.nan, np.nan]
+                    rss = np.nan
+                else:
+                    y_model = func_(x_fit, protein_size / elongation_r,
+                                    1 / translation_init_r)
+                    rss = np.sum((y_fit - y_model) ** 2)
+            except (RuntimeError, ValueError, ZeroDivisionError,
+                    IndexError) as e:
+                record(diagnostics, id_track, "fit",
+                       "fit failed: " + type(e).__name__, logging.WARNING,
+                       model=name, message=str(e))
+                elongation_r, translation_init_r = np.nan, np.nan
+                perr = [np.nan, np.nan]
+                rss = np.nan
+        _record_fit_warnings(caught, diagnostics, id_track, model=name)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_likelihood = n * np.log(rss / n)
+        fits.append({"model": name,
+                     "elongation_r": elongation_r,
+                     "init_translation_r": translation_init_r,
+                     "perr": perr,
+                     "rss": rss,
+                     "aic": log_likelihood + 2 * 2,
+                     "bic": log_likelihood + 2 * np.log(n)})
+    return fits
+
+
+# Memory used by the analysis of one point of a track: its row, the
+# autocorrelation and the temporary arrays of the fits
+POINT_BYTES = 256
+
+
+def _track_chunks(df):
+    # Tracks grouped in chunks that fit in the memory budget, each chunk is
+    # an iterator of (id, track)
+    columns = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+    if isinstance(df, TrackStore):
+        lengths = df.lengths
+    else:
+        lengths = df["TRACK_ID"].value_counts(sort=False).to_numpy()
+    if len(lengths) == 0:
+        return
+    chunk_size, _ = plan_batch(len(lengths), POINT_BYTES * lengths.max(), 1)
+    if chunk_size >= len(lengths):
+        if isinstance(df, TrackStore):
+            yield df.iter_tracks(columns=columns)
+        else:
+            yield df.groupby("TRACK_ID")
+    elif isinstance(df, TrackStore):
+        for store in df.chunks(chunk_size):
+            yield store.iter_tracks(columns=columns)
+    else:
+        indices = df.groupby("TRACK_ID").indices
+        ids = sorted(indices)
+        for first in range(0, len(ids), chunk_size):
+            rows = np.concatenate([indices[i]
+                                   for i in ids[first:first + chunk_size]])
+            yield df.iloc[rows].groupby("TRACK_ID")
+
+
+def tracks_analysis(df,
+                    ids_track=None,
+                    delta_t=0.5,
+                    protein_size=1500,
+                    models=("original",),
+                    normalise_intensity=1,
+                    normalise_auto=True,
+                    mm=None,
+                    rtol=1e-4,
+                    force_analysis=False,
+                    first_dot=True,
+                    simulation=False,
+                    qc_thresholds=None,
+                    diagnostics=None):
+    """
+    Analysis of all tracks of a dataframe with one or several models.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    ids_track : list
+        ids of the tracks to analyse, default value : all tracks of df
+    delta_t : float
+        time between two time point in sec
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    models : list
+        models to fit on each track, see `compile_models`, default value :
+        ("original",)
+    qc_thresholds : dict
+        when given, tracks are first screened with `prescreen_tracks` and
+        rejected tracks are not analysed, see `analysis_qc.filter_tracks`,
+        default value : None, no screening
+    diagnostics : Diagnostics
+        record of the events of the analysis of every track, rejected
+        tracks included, see `utils.diagnostics`, default value : None
+    other parameters : see `single_track_analysis`
+
+    Returns
+    -------
+    results : pd.DataFrame
+        one row per track and model with the columns "elongation_r",
+        "init_translation_r", "dt", "id", "model", "rss", "aic", "bic"
+        and "best", True for the model with the lowest AIC of the track.
+        With qc_thresholds, rejected tracks have one row with the reason of
+        the rejection in the "qc_reason" column.
+        With diagnostics, the events are also returned as a pd.DataFrame in
+        results.attrs["diagnostics"].
+
+    Description
+    -----------
+    The autocorrelation of each track is computed once and every model is
+    fitted on it, so comparing N models costs one autocorrelation pass.
+    With a memory budget (`memory.set_memory_budget`), tracks are analysed
+    by chunks that fit in it.
+    """
+    models = compile_models(models)
+    if ids_track is not None:
+        if isinstance(df, TrackStore):
+            df = df.select(ids_track)
+        else:
+            df = df[df["TRACK_ID"].isin(ids_track)]
+
+    rows = []
+    if qc_thresholds is not None:
+        with profiling.stage("qc"):
+            df, qc = prescreen_tracks(df, delta_t, simulation,
+                                      qc_thresholds)
+        for i, reason in qc.loc[~qc["keep"], "reason"].items():
+            rows.append({"dt": delta_t, "id": i, "qc_reason": reason})
+            record(diagnostics, i, "qc", "rejected: " + reason,
+                   logging.INFO)
+
+    for tracks in _track_chunks(df):
+        for i, track in tracks:
+            x, y, x_auto, y_auto = track_autocorrelation(track,
+                                                         i,
+                                                         delta_t,
+                                                         normalise_intensity,
+                                                         normalise_auto,
+                                                         mm,
+                                                         rtol,
+                                                         force_analysis,
+                                                         simulation,
+                                                         diagnostics)
+            if x_auto is None:
+                fits = [{"model": name} for name, _, _ in models]
+            else:
+                fits = fit_models(x_auto, y_auto, models, protein_size,
+                                  first_dot, diagnostics, i)
+            for fit in fits:
+                fit.pop("perr", None)
+                rows.append({"dt": delta_t, "id": i, **fit})
+
+    results = pd.DataFrame(rows, columns=["elongation_r",
+                                          "init_translation_r",
+                                          "dt",
+                                          "id",
+                                          "model",
+                                          "rss",
+                                          "aic",
+                                          "bic",
+                                          "qc_reason"])
+    best = results.groupby("id")["aic"].transform("min")
+    results["best"] = results["aic"] == best
+    if qc_thresholds is None:
+        results.drop(columns="qc_reason", inplace=True)
+    else:
+        results["qc_reason"] = results["qc_reason"].fillna("")
+    if diagnostics is not None:
+        results.attrs["diagnostics"] = diagnostics.to_frame()
+    return results
+
+
+def best_models(results, keys=("id",)):
+    """
+    One row per track of the results of `tracks_analysis`.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        results of `tracks_analysis`
+    keys : list
+        columns that identify a track, e.g. ("file", "id") for the results
+        of `analysis_directory.directory_analysis`, default value : ("id",)
+
+    Returns
+    -------
+    pd.DataFrame, the row of the best model of each track, or its first
+    model when no fit succeeded. Tracks rejected by the screening keep
+    their row.
+    """
+    if results.empty:
+        return results
+    keys = list(keys)
+    no_best = ~results.groupby(keys)["best"].transform("any")
+    keep = results["best"] | (no_best & ~results.duplicated(keys))
+    return results[keep].drop_duplicates(keys)
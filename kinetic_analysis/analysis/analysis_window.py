@@ -0,0 +1,250 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import (extract_track,
+                                                      check_continuous_time,
+                                                      fit_autocorrelation_original,
+                                                      fit_autocorrelation_linear,
+                                                      fit_function)
+from kinetic_analysis.utils.track_store import TrackStore
+
+
+def window_autocorrelation(y, window, stride=1, delta_t=0.5, normalize=True,
+                           max_lag=None):
+    """
+    Autocorrelation of every sliding window of a signal.
+
+    Parameters
+    ----------
+    y : list
+        intensity signal
+    window : int
+        number of points inside one window
+    stride : int
+        number of points between the start of two consecutive windows,
+        default value : 1
+    delta_t : float
+        time between two images
+    normalize : bool
+        normalize the result to the square of the average window signal and
+        the factor W-k; default value : True
+    max_lag : int
+        last lag (in number of points) of the autocorrelation, default value
+        : window / 2 - 1
+
+    Returns
+    -------
+    x_auto : np.array
+        list of time delay of the autocorrelation
+    g_auto : np.array
+        G(tau) of each window, shape (number of windows, number of lags)
+    starts : np.array
+        index of the first point of each window
+
+    Description
+    -----------
+    Each window is mean subtracted, like in `autocorrelation`, so
+    G(k) = sum((y_i - m)(y_i+k - m)) / ((W - k) m^2) with m the mean of the
+    window.
+    The lagged products y_i * y_i+k are cumulated once for the whole track,
+    so the correlation sums of a window are obtained from the sums of the
+    previous one in O(1) per lag instead of being recomputed from scratch.
+    Lags are cumulated one after the other, so the memory used is the
+    track and the result.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    window = int(window)
+    stride = int(stride)
+    if window < 2 or window > n:
+        raise ValueError("window must be between 2 and the track length")
+    if stride < 1:
+        raise ValueError("stride must be a positive integer")
+    if max_lag is None:
+        max_lag = int(window / 2 - 1)
+    max_lag = int(min(max_lag, window - 1))
+
+    # Centering on the track mean limits the loss of precision of the
+    # cumulative sums, G(k) itself is invariant to this shift
+    offset = y.mean()
+    yc = y - offset
+
+    lags = np.arange(max_lag + 1)
+    starts = np.arange(0, n - window + 1, stride)
+    ends = starts + window
+
+    # Cumulative sum of the signal, and of the lagged products of one lag
+    # at a time so the memory is O(n) and not O(n * lags)
+    cs = np.concatenate([[0.], np.cumsum(yc)])
+    cp = np.empty(n + 1)
+    cp[0] = 0.
+    m = (cs[ends] - cs[starts]) / window
+    g_auto = np.empty((len(starts), max_lag + 1))
+    for k in lags:
+        np.cumsum(yc[:n - k] * yc[k:], out=cp[1:n - k + 1])
+        s_prod = cp[ends - k] - cp[starts]
+        s_head = cs[ends - k] - cs[starts]
+        s_tail = cs[ends] - cs[starts + k]
+        n_pairs = window - k
+        g_auto[:, k] = (s_prod - m * (s_head + s_tail) +
+                        n_pairs * m ** 2) / n_pairs
+    if normalize:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g_auto = g_auto / (m[:, None] + offset) ** 2
+
+    return lags * delta_t, g_auto, starts
+
+
+def window_track_analysis(df,
+                          id_track=0,
+                          window=200,
+                          stride=50,
+                          delta_t=0.5,
+                          protein_size=1500,
+                          normalise_intensity=1,
+                          normalise_auto=True,
+                          max_lag=None,
+                          rtol=1e-4,
+                          method="original",
+                          force_analysis=False,
+                          first_dot=True,
+                          simulation=False,
+                          func_=fit_function):
+    """
+    Time resolved analysis of one track inside a dataframe.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    id_track : int
+        id of the track that will be analysed
+    window : int
+        number of time points in one window, default value : 200
+    stride : int
+        number of time points between two windows, default value : 50
+    delta_t : float
+        time between two time point in sec
+    protein_size: int
+        size of the protein (+ suntag) in amino acid
+    normalise_intensity : float
+        value used for normalised the intensity, default value : 1
+    normalise_auto : bool
+        normalise for the autocorrelation, default value : True
+    max_lag : int
+        last lag (in number of points) used in the autocorrelation,
+        default value : None
+    rtol : float
+        to check if time is continuous , default value : 1e-4
+    method : str
+        choose the method of the analysis, "linear" or "original"
+    force_analysis : bool
+        force the analysis even if time is not continuous, default value :
+        False
+    first_dot : bool
+        use the first point in the analysis, default value :True
+    simulation : bool
+        define if the track come from a simulation (True) or an experiment
+        (False), default value : False
+    func_ : function
+        function to fit with the "original" method
+
+    Returns
+    -------
+    results : pd.DataFrame
+        one row per window with the columns "id", "window_start",
+        "window_center", "elongation_r" and "init_translation_r"
+
+    Description
+    -----------
+    Same analysis as `single_track_analysis`, repeated on a window that
+    slides along the track. It gives the evolution of the elongation and
+    initiation rates over time.
+    Windows are taken in number of points, so the track needs to be
+    continuous in time.
+    """
+    columns = ["id", "window_start", "window_center", "elongation_r",
+               "init_translation_r"]
+    x, y = extract_track(df,
+                         id_track,
+                         delta_t=delta_t,
+                         normalise_intensity=normalise_intensity,
+                         simulation=simulation)
+    if len(y) < window:
+        return pd.DataFrame(columns=columns)
+
+    if not check_continuous_time(x, delta_t, rtol=rtol):
+        if not force_analysis:
+            return pd.DataFrame(columns=columns)
+        warnings.warn("Analysis is forced for track " + str(id_track),
+                      UserWarning)
+
+    x_auto, g_auto, starts = window_autocorrelation(y,
+                                                    window,
+                                                    stride,
+                                                    delta_t,
+                                                    normalise_auto,
+                                                    max_lag)
+
+    elongation_r = np.full(len(starts), np.nan)
+    translation_init_r = np.full(len(starts), np.nan)
+    for i in range(len(starts)):
+        try:
+            if method == "original":
+                (elongation_r[i],
+                 translation_init_r[i],
+                 _) = fit_autocorrelation_original(x_auto,
+                                                   g_auto[i],
+                                                   func_,
+                                                   protein_size=protein_size,
+                                                   first_dot=first_dot)
+            elif method == "linear":
+                (elongation_r[i],
+                 translation_init_r[i],
+                 _) = fit_autocorrelation_linear(x_auto,
+                                                 g_auto[i],
+                                                 protein_size=protein_size)
+        except (RuntimeError, ValueError, IndexError):
+            # The fit did not converge on this window
+            continue
+
+    return pd.DataFrame({"id": id_track,
+                         "window_start": x[starts],
+                         "window_center": x[starts + int(window / 2)],
+                         "elongation_r": elongation_r,
+                         "init_translation_r": translation_init_r,
+                         }, columns=columns)
+
+
+def window_tracks_analysis(df, ids_track=None, **kwargs):
+    """
+    Time resolved analysis of several tracks inside a dataframe.
+
+    Parameters
+    ----------
+    df : pd.df or TrackStore
+        dataframe or track store that contains tracks
+    ids_track : list
+        ids of the tracks to analyse, default value : all tracks of df
+    kwargs : dict
+        parameters given to `window_track_analysis`
+
+    Returns
+    -------
+    results : pd.DataFrame
+        rate time series of all tracks, see `window_track_analysis`
+    """
+    if isinstance(df, TrackStore):
+        tracks = df.iter_tracks(ids_track)
+    else:
+        if ids_track is not None:
+            df = df[df["TRACK_ID"].isin(ids_track)]
+        tracks = df.groupby("TRACK_ID")
+    results = [window_track_analysis(track, i, **kwargs)
+               for i, track in tracks]
+    if len(results) == 0:
+        return pd.DataFrame(columns=["id", "window_start", "window_center",
+                                     "elongation_r", "init_translation_r"])
+    return pd.concat(results, ignore_index=True)
@@ -1,6 +1,8 @@
 import os
 import time
 import threading
+import multiprocessing
+import multiprocess
 import webview
 import requests
 
@@ -31,10 +33,17 @@ from kinetic_analysis.tabs.tab_analyse_invivo import register_callbacks as tab3_
 from kinetic_analysis.tabs.tab_analyse_one_invivo import layout as tab4_layout
 from kinetic_analysis.tabs.tab_analyse_one_invivo import register_callbacks as tab4_callbacks
 
+from kinetic_analysis.tabs.tab_performance import layout as tab5_layout
+from kinetic_analysis.tabs.tab_performance import register_callbacks as tab5_callbacks
+
+from kinetic_analysis.tabs.app_function import background_manager
+
 from kinetic_analysis.analysis.analysis_track import fit_function
 
 FONT_AWESOME = "https://use.fontawesome.com/releases/v5.10.2/css/all.css"
+# Generation and analysis run as background jobs, with progress and cancel
 app = Dash(__name__, external_stylesheets=[dbc.themes.FLATLY, FONT_AWESOME],
+           background_callback_manager=background_manager(),
            )
 app.title = "Kinetic analysis app"
 
@@ -59,6 +68,7 @@ app.layout = dbc.Container([
     html.Li("Track analysis simulation : analyse tracks from simulation"),
     html.Li("Track analysis in vivo : analyse tracks from in vivo "
             "experiments"),
+    html.Li("Performance : time spent in each stage of the analysis"),
     html.Br(),
 
     dbc.Tabs(children=[
@@ -66,6 +76,7 @@ app.layout = dbc.Container([
         dbc.Tab(label="Analyse tracks simu", tab_id="tab-2"),
         dbc.Tab(label="Analyse tracks in vivo", tab_id="tab-3"),
         dbc.Tab(label="Analyse one track in vivo - display", tab_id="tab-4"),
+        dbc.Tab(label="Performance", tab_id="tab-5"),
     ],
         id='tabs',
         active_tab='tab-4'),
@@ -86,6 +97,8 @@ def render_content(tab):
         return tab3_layout()
     elif tab == 'tab-4':
         return tab4_layout()
+    elif tab == 'tab-5':
+        return tab5_layout()
 
 
 # Register callbacks
@@ -93,6 +106,7 @@ tab1_callbacks(app)
 tab2_callbacks(app)
 tab3_callbacks(app)
 tab4_callbacks(app)
+tab5_callbacks(app)
 
 
 def run_app():
@@ -110,6 +124,10 @@ def wait_until_server_is_ready(url, timeout=10):
     return False
 
 if __name__ == '__main__':
+    # Background jobs and process pools start new processes, in a frozen
+    # app they run the executable again and must not start the app
+    multiprocessing.freeze_support()
+    multiprocess.freeze_support()
     # app.run_server(debug=True, port=8080)
     t = Thread(target=run_app)
     t.daemon = True
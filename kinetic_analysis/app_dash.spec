@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=['diskcache', 'multiprocess', 'psutil'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -11,7 +11,7 @@ a = Analysis(
 	    ("/Library/Frameworks/Python.framework/Versions/3.11/lib/python3.11/site-packages/dash_bootstrap_components", "dash_bootstrap_components"),
 	    ("/Library/Frameworks/Python.framework/Versions/3.11/lib/python3.11/site-packages/dash_spinner", "dash_spinner"),
 	    ("/Library/Frameworks/Python.framework/Versions/3.11/lib/python3.11/site-packages/dash_table", "dash_table"),],
-    hiddenimports=[],
+    hiddenimports=['diskcache', 'multiprocess', 'psutil'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -11,7 +11,7 @@ a = Analysis(
 	    ("/opt/hostedtoolcache/Python/3.11.10/x64/lib/python3.11/site-packages/dash_bootstrap_components", "dash_bootstrap_components"),
 	    ("/opt/hostedtoolcache/Python/3.11.10/x64/lib/python3.11/site-packages/dash_spinner", "dash_spinner"),
 	    ("/opt/hostedtoolcache/Python/3.11.10/x64/lib/python3.11/site-packages/dash_table", "dash_table"),],
-    hiddenimports=[],
+    hiddenimports=['diskcache', 'multiprocess', 'psutil'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
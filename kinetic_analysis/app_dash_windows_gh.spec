@@ -11,7 +11,7 @@ a = Analysis(
 	    ("c:/hostedtoolcache/windows/python/3.11.9/x64/lib/site-packages/dash_bootstrap_components", "dash_bootstrap_components"),
 	    ("c:/hostedtoolcache/windows/python/3.11.9/x64/lib/site-packages/dash_spinner", "dash_spinner"),
 	    ("c:/hostedtoolcache/windows/python/3.11.9/x64/lib/site-packages/dash_table", "dash_table"),],
-    hiddenimports=[],
+    hiddenimports=['diskcache', 'multiprocess', 'psutil'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,155 @@
+import os
+import json
+import numbers
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.generator.generator_track import (generate_tracks,
+                                                        GENERATOR_VERSION)
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.cache import DEFAULT_MAX_SIZE, evict_cache
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "KINETIC_ANALYSIS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "kinetic_analysis",
+                 "datasets"))
+COLUMNS = ["FRAME", "MEAN_INTENSITY_CH1", "TRACK_ID", "RETENTION_TIME"]
+
+
+def _normalise(value):
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return value
+    if float(value) == value:
+        return float(value)
+    return value
+
+
+def dataset_key(params):
+    """
+    Key of a synthetic dataset.
+
+    Parameters
+    ----------
+    params : dict
+        all parameters of `generate_tracks`, seed included
+
+    Returns
+    -------
+    str, hash of the parameters and of the generator version
+
+    Description
+    -----------
+    Numbers are hashed as floats, so length=24 and length=24.0 give the
+    same key. Integers that a float can not hold (e.g. large seeds) are
+    kept as they are.
+    """
+    content = {"params": {k: _normalise(v) for k, v in params.items()},
+               "version": GENERATOR_VERSION}
+    return hashlib.sha256(json.dumps(content,
+                                     sort_keys=True,
+                                     default=float).encode()).hexdigest()
+
+
+def _load_dataset(path):
+    # Accessing an entry makes it the most recently used one
+    os.utime(path)
+    # Columns are ndarray views of the memory maps, the frame is the same
+    # as a generated one and the file is still only read when it is used
+    with profiling.stage("load"):
+        return pd.DataFrame({c: np.asarray(np.load(os.path.join(path,
+                                                                c + ".npy"),
+                                                   mmap_mode="r"))
+                             for c in COLUMNS}, copy=False)
+
+
+def _save_dataset(datas, params, path):
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written in a temporary directory first, so a dataset is never seen
+    # half written
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp")
+    try:
+        with profiling.stage("write"):
+            for c in COLUMNS:
+                np.save(os.path.join(tmp, c + ".npy"), datas[c].to_numpy())
+            with open(os.path.join(tmp, "params.json"), "w") as f:
+                json.dump({"params": params, "version": GENERATOR_VERSION},
+                          f, default=float)
+            os.replace(tmp, path)
+    except OSError:
+        # Another process wrote the same dataset
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def cached_generate_tracks(n,
+                           prot_length,
+                           suntag_length,
+                           nb_suntag,
+                           fluo_one_suntag,
+                           translation_rate,
+                           binding_rate,
+                           retention_time=0,
+                           suntag_pos="begin",
+                           noise=False,
+                           noise_std=0,
+                           step=0.1,
+                           length=6000,
+                           seed=None,
+                           cache_dir=DEFAULT_CACHE_DIR,
+                           max_size=DEFAULT_MAX_SIZE):
+    """
+    Generate n tracks, or load them if they were already generated.
+
+    Parameters
+    ----------
+    n, prot_length, suntag_length, nb_suntag, fluo_one_suntag,
+    translation_rate, binding_rate, retention_time, suntag_pos, noise,
+    noise_std, step, length, seed : see `generate_tracks`
+    cache_dir : str
+        directory of the cache, default value : ~/.cache/kinetic_analysis/
+        datasets or the KINETIC_ANALYSIS_CACHE environment variable
+    max_size : int
+        maximum size of the cache in bytes, default value : 2 GB
+
+    Returns
+    -------
+    pd.DataFrame, same as `generate_tracks`
+
+    Description
+    -----------
+    Datasets are stored by a hash of all parameters, the seed and the
+    generator version. An identical request loads the dataset from memory
+    mapped .npy files instead of simulating it again. Least recently used
+    datasets are removed when the cache is larger than max_size.
+    Without seed the tracks are random, so they are neither cached nor
+    loaded.
+    """
+    params = {"n": n,
+              "prot_length": prot_length,
+              "suntag_length": suntag_length,
+              "nb_suntag": nb_suntag,
+              "fluo_one_suntag": fluo_one_suntag,
+              "translation_rate": translation_rate,
+              "binding_rate": binding_rate,
+              "retention_time": retention_time,
+              "suntag_pos": suntag_pos,
+              "noise": noise,
+              "noise_std": noise_std,
+              "step": step,
+              "length": length,
+              "seed": seed}
+    if seed is None:
+        return generate_tracks(**params)
+
+    path = os.path.join(cache_dir, dataset_key(params))
+    if os.path.isdir(path):
+        return _load_dataset(path)
+
+    datas = generate_tracks(**params)
+    _save_dataset(datas, params, path)
+    evict_cache(cache_dir, max_size)
+    return datas
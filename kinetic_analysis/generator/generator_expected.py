@@ -0,0 +1,228 @@
+import numpy as np
+
+
+def profile_matrix(prot_length,
+                   suntag_length,
+                   nb_suntag,
+                   fluo_one_suntag,
+                   translation_rate,
+                   retention_time=0,
+                   suntag_pos="begin",
+                   step=0.1):
+    """
+    Fluorescence profiles of one protein for a grid of parameters.
+
+    Parameters
+    ----------
+    same parameters as `generate_profile`, all of them except step can be
+    arrays, they are broadcast together
+
+    Returns
+    -------
+    h : np.array
+        profiles, shape (number of parameter sets, longest profile), padded
+        with 0
+    shape : tuple
+        shape of the broadcast parameters
+
+    Description
+    -----------
+    Same profile as `generate_profile` without noise, computed for all
+    parameter sets at once.
+    """
+    (prot_length,
+     suntag_length,
+     nb_suntag,
+     fluo_one_suntag,
+     translation_rate,
+     retention_time,
+     suntag_pos) = np.broadcast_arrays(prot_length,
+                                       suntag_length,
+                                       nb_suntag,
+                                       fluo_one_suntag,
+                                       translation_rate,
+                                       retention_time,
+                                       suntag_pos)
+    shape = prot_length.shape
+    if not np.isin(suntag_pos, ["begin", "end"]).all():
+        raise ValueError("suntag_pos value can only be \"begin\" or \"end\"")
+
+    suntag_time = (suntag_length / translation_rate).ravel()
+    total_time = ((prot_length + suntag_length) / translation_rate +
+                  retention_time).ravel()
+    # Same number of points as np.arange in generate_profile
+    n_total = np.ceil(total_time / step).astype(int)
+    n_ramp = np.ceil(suntag_time / step).astype(int)
+    slope = ((nb_suntag * fluo_one_suntag).ravel() / suntag_time)
+
+    j = np.arange(n_total.max(initial=1))[None, :]
+    begin = (suntag_pos == "begin").ravel()[:, None]
+    # Position inside the suntag ramp
+    ramp_pos = np.where(begin, np.minimum(j, n_ramp[:, None] - 1),
+                        j - (n_total - n_ramp)[:, None])
+    h = slope[:, None] * ramp_pos * step
+    h[ramp_pos < 0] = 0
+    h[j >= n_total[:, None]] = 0
+    return h, shape
+
+
+def expected_autocorrelation(tau,
+                             prot_length,
+                             suntag_length,
+                             nb_suntag,
+                             fluo_one_suntag,
+                             translation_rate,
+                             binding_rate,
+                             retention_time=0,
+                             suntag_pos="begin",
+                             step=0.1,
+                             delta_t=None,
+                             track_length=None,
+                             normalize=True):
+    """
+    Expected autocorrelation of the tracks made by `generate_tracks`.
+
+    Parameters
+    ----------
+    tau : np.array
+        time delays in sec, multiples of delta_t
+    prot_length : int
+        length of the protein in amino acid
+    suntag_length : int
+        length of the suntag in amino acid
+    nb_suntag : int
+        number of suntag repetition
+    fluo_one_suntag : int
+        fluorescence intensity of one suntag
+    translation_rate : int
+        translation rate of the protein in aa/sec
+    binding_rate : float
+        probability to start a new protein in 1/sec
+    retention_time : float, default 0
+        length of time the protein remains on the translation site in sec
+    suntag_pos : str, "begin" or "end", default "begin"
+        position of the suntag, before of after the protein
+    step : float, default 0.1
+        time step used to generate the tracks in sec
+    delta_t : float
+        time between two time point of the analysed track, default value :
+        step
+    track_length : int
+        number of time points of the analysed track. When given, the bias
+        due to the subtraction of the mean of a finite track is included,
+        default value : None
+    normalize : bool
+        normalize to the square of the average signal, like
+        `autocorrelation`, default value : True
+
+    Returns
+    -------
+    np.array of shape (broadcast shape of the parameters, len(tau)), G(tau)
+
+    Description
+    -----------
+    The generator starts a protein at each time step with a probability
+    p = binding_rate * step, so the signal is a discrete shot noise. Its
+    mean is p sum(h) and its autocovariance is
+    C(k) = p (1 - p) sum_j h_j h_j+k, with h the profile of one protein
+    (`generate_profile`). Sampling the track every delta_t keeps C at
+    the lags multiple of delta_t.
+    For a track of N points, the mean subtraction lowers the estimate by
+    Var(mean) = 1/N sum_|r|<N (1 - |r|/N) C(r delta_t).
+    All parameters except step are broadcast together, so a whole grid of
+    curves is computed in one pass with FFT.
+    """
+    if delta_t is None:
+        delta_t = step
+    tau = np.asarray(tau, dtype=float)
+    shape = np.broadcast(prot_length, suntag_length, nb_suntag,
+                         fluo_one_suntag, translation_rate, binding_rate,
+                         retention_time, suntag_pos, delta_t,
+                         0 if track_length is None else track_length).shape
+    h, shape = profile_matrix(np.broadcast_to(prot_length, shape),
+                              suntag_length,
+                              nb_suntag,
+                              fluo_one_suntag,
+                              translation_rate,
+                              retention_time,
+                              suntag_pos,
+                              step)
+    binding_rate = np.broadcast_to(binding_rate, shape)
+    delta_t = np.broadcast_to(delta_t, shape)
+    p = (binding_rate * step).ravel()[:, None]
+
+    n_profile = h.shape[1]
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_profile)))
+    fh = np.fft.rfft(h, n=n_fft, axis=1)
+    acf = np.fft.irfft(np.abs(fh) ** 2, n=n_fft, axis=1)[:, :n_profile]
+    cov = p * (1 - p) * acf
+    mean = p[:, 0] * h.sum(axis=1)
+
+    def cov_at(k):
+        k = np.rint(k).astype(int)
+        inside = k < n_profile
+        return np.where(inside,
+                        np.take_along_axis(cov,
+                                           np.where(inside, k, 0),
+                                           axis=1),
+                        0.)
+
+    g = cov_at(np.broadcast_to(tau[None, :] / step, (len(cov), len(tau))))
+
+    if track_length is not None:
+        n = np.broadcast_to(track_length, shape).ravel()[:, None]
+        m = np.rint(delta_t.ravel() / step)[:, None]
+        r = np.arange(int(np.ceil(n_profile / m.min())) + 1)[None, :]
+        weight = np.where(r < n, 1 - r / n, 0.)
+        weight[:, 1:] *= 2
+        var_mean = (weight * cov_at(r * m)).sum(axis=1) / n[:, 0]
+        g = g - var_mean[:, None]
+
+    if normalize:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g = g / mean[:, None] ** 2
+
+    return g.reshape(shape + (len(tau),))
+
+
+def expected_model(suntag_length=796,
+                   nb_suntag=32,
+                   fluo_one_suntag=4,
+                   retention_time=0,
+                   suntag_pos="begin",
+                   step=0.1,
+                   finite_track=True):
+    """
+    Expected autocorrelation as a model of `build_lookup_index`.
+
+    Parameters
+    ----------
+    suntag_length, nb_suntag, fluo_one_suntag, retention_time, suntag_pos,
+    step : see `expected_autocorrelation`
+    finite_track : bool
+        include the bias of finite tracks, default value : True
+
+    Returns
+    -------
+    function with the signature of `analytic_model`, protein_size is the
+    protein + suntag size and init_translation_r the time between two
+    initiations
+    """
+    def model(tau, elongation_r, init_translation_r, protein_size,
+              delta_t=step, track_length=None):
+        return expected_autocorrelation(
+            tau,
+            np.asarray(protein_size) - suntag_length,
+            suntag_length,
+            nb_suntag,
+            fluo_one_suntag,
+            elongation_r,
+            1 / np.asarray(init_translation_r),
+            retention_time,
+            suntag_pos,
+            step,
+            delta_t,
+            track_length if finite_track else None)
+
+    model.__name__ = "expected_model"
+    return model
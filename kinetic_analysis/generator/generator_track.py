@@ -3,6 +3,13 @@ import warnings
 import numpy as np
 import pandas as pd
 
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.memory import plan_batch
+
+# Increase when a change of the generator gives different tracks for the
+# same parameters and seed, it invalidates the cached datasets
+GENERATOR_VERSION = 1
+
 
 def generate_profile(prot_length,
                      suntag_length,
@@ -13,7 +20,8 @@ def generate_profile(prot_length,
                      suntag_pos="begin",
                      step=0.1,
                      noise=False,
-                     noise_std=0):
+                     noise_std=0,
+                     rng=None):
     """
     Generate fluorescence profile of one protein.
 
@@ -39,6 +47,8 @@ def generate_profile(prot_length,
         add noise to the signal
     noise_std : float, default 1
         std of the normal distribution
+    rng : np.random.Generator, default None
+        random generator, use the global numpy random state if None
 
     Returns
     -------
@@ -83,7 +93,9 @@ def generate_profile(prot_length,
         y_prim = np.repeat(0, len(x) - len(y))
         y = np.concatenate([y_prim, y])
     if noise:
-        n = np.random.normal(0, noise_std, len(x))
+        if rng is None:
+            rng = np.random
+        n = rng.normal(0, noise_std, len(x))
         y = y + n
 
     return x, y
@@ -101,6 +113,7 @@ def generate_one_track(prot_length,
                        noise_std=0,
                        step=0.1,
                        length=6000,
+                       rng=None,
                        ):
     """
     Generate track according to one protein translation dynamics
@@ -131,6 +144,8 @@ def generate_one_track(prot_length,
         time step between two point in sec
     length : int
         length of the track in sec
+    rng : np.random.Generator, default None
+        random generator, use the global numpy random state if None
 
     Returns
     -------
@@ -145,6 +160,8 @@ def generate_one_track(prot_length,
     It is based on one protein translation profile.
 
     """
+    if rng is None:
+        rng = np.random
     x, y = generate_profile(prot_length,
                             suntag_length,
                             nb_suntag,
@@ -154,7 +171,8 @@ def generate_one_track(prot_length,
                             suntag_pos,
                             step,
                             noise,
-                            noise_std
+                            noise_std,
+                            rng
                             )
 
     # global signal
@@ -162,7 +180,7 @@ def generate_one_track(prot_length,
     y_global = np.zeros(len(x_global))
     y_start_prot = np.zeros(len(x_global))
 
-    n_rand = np.random.rand(len(x_global))
+    n_rand = rng.random(len(x_global))
     for i in range(len(x_global)):
         # random number between 0 and 1
         if n_rand[i] < (binding_rate * step):
@@ -193,7 +211,8 @@ def generate_tracks(n,
                     noise=False,
                     noise_std=0,
                     step=0.1,
-                    length=6000):
+                    length=6000,
+                    seed=None):
     """
     Generate n tracks according to one protein translation dynamics
 
@@ -225,6 +244,9 @@ def generate_tracks(n,
         time step between two point in sec
     length : int
         length of the track in sec
+    seed : int, default None
+        seed of the random generator, use the global numpy random state if
+        None
 
     Returns
     -------
@@ -239,35 +261,89 @@ def generate_tracks(n,
     It is based on one protein translation profile.
 
     """
-    first_time = True
-
-    for i in range(n):
-        x_global, y_global, y_start_prot = generate_one_track(prot_length,
-                                                              suntag_length,
-                                                              nb_suntag,
-                                                              fluo_one_suntag,
-                                                              translation_rate,
-                                                              binding_rate,
-                                                              retention_time,
-                                                              suntag_pos,
-                                                              noise,
-                                                              noise_std,
-                                                              step,
-                                                              length)
-        if first_time:
-            datas = pd.DataFrame({"FRAME": x_global,
-                                  "MEAN_INTENSITY_CH1": y_global,
-                                  "TRACK_ID": i,
-                                  "RETENTION_TIME": retention_time,
-                                  })
-            first_time = False
-        else:
-            datas = pd.concat([datas,
-                               pd.DataFrame({"FRAME": x_global,
-                                             "MEAN_INTENSITY_CH1": y_global,
-                                             "TRACK_ID": i,
-                                             "RETENTION_TIME": retention_time
-                                             })],
-                              ignore_index=True)
-
-    return datas
\ No newline at end of file
+    params = {"prot_length": prot_length,
+              "suntag_length": suntag_length,
+              "nb_suntag": nb_suntag,
+              "fluo_one_suntag": fluo_one_suntag,
+              "translation_rate": translation_rate,
+              "binding_rate": binding_rate,
+              "retention_time": retention_time,
+              "suntag_pos": suntag_pos,
+              "noise": noise,
+              "noise_std": noise_std,
+              "step": step,
+              "length": length}
+    # Tracks are generated by chunks that fit in the memory budget and
+    # copied in the columns of the whole set, so the memory is the size of
+    # the set and of one chunk
+    columns = None
+    n_rows = 0
+    for datas in iter_generate_tracks(n, seed=seed, **params):
+        if columns is None:
+            if len(datas) == 0 or datas["TRACK_ID"].iloc[-1] == n - 1:
+                # One chunk
+                return datas
+            # All tracks have the same number of points
+            size = len(datas) // (datas["TRACK_ID"].iloc[-1] + 1) * n
+            columns = {c: np.empty(size, dtype=datas[c].dtype)
+                       for c in datas.columns}
+        for c, values in columns.items():
+            values[n_rows:n_rows + len(datas)] = datas[c].to_numpy()
+        n_rows += len(datas)
+    if columns is None:
+        return pd.DataFrame(columns=["FRAME", "MEAN_INTENSITY_CH1",
+                                     "TRACK_ID", "RETENTION_TIME"])
+    return pd.DataFrame(columns, copy=False)
+
+
+def track_bytes(step=0.1, length=6000):
+    """
+    Memory needed to generate one track, its columns and the temporary
+    arrays of `generate_one_track`.
+    """
+    return 8 * 8 * int(length / step)
+
+
+def iter_generate_tracks(n, seed=None, chunk_size=None, **params):
+    """
+    Generate n tracks by chunks.
+
+    Parameters
+    ----------
+    n, seed : see `generate_tracks`
+    chunk_size : int
+        number of tracks of each chunk, default value : None, the number of
+        tracks that fit in the memory budget, see `memory.plan_batch`
+    params : dict
+        other parameters of `generate_tracks`
+
+    Returns
+    -------
+    generator of pd.DataFrame, same columns as `generate_tracks`, with the
+    ids of the tracks in the whole set
+
+    Description
+    -----------
+    All chunks are generated with the same random generator, so the tracks
+    are the same as those of `generate_tracks` with the same seed, whatever
+    the chunk size.
+    """
+    rng = None if seed is None else np.random.default_rng(seed)
+    if chunk_size is None:
+        chunk_size, _ = plan_batch(n, track_bytes(params.get("step", 0.1),
+                                                  params.get("length", 6000)),
+                                   1)
+    for first in range(0, n, chunk_size):
+        tracks = []
+        with profiling.stage("generate"):
+            for i in range(first, min(first + chunk_size, n)):
+                x_global, y_global, y_start_prot = generate_one_track(
+                    rng=rng, **params)
+                tracks.append(pd.DataFrame({
+                    "FRAME": x_global,
+                    "MEAN_INTENSITY_CH1": y_global,
+                    "TRACK_ID": i,
+                    "RETENTION_TIME": params.get("retention_time", 0),
+                }))
+            datas = pd.concat(tracks, ignore_index=True)
+        yield datas
@@ -11,7 +11,7 @@ a = Analysis(
 	    ("/home/u2175049/anaconda3/lib/python3.11/site-packages/dash_bootstrap_components", "dash_bootstrap_components"),
 	    ("/home/u2175049/anaconda3/lib/python3.11/site-packages/dash_spinner", "dash_spinner"),
 	    ("/home/u2175049/anaconda3/lib/python3.11/site-packages/dash_table", "dash_table"),],
-    hiddenimports=[],
+    hiddenimports=['diskcache', 'multiprocess', 'psutil'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,363 @@
+import json
+import time
+import sqlite3
+import hashlib
+import itertools
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import single_track_analysis
+from kinetic_analysis.generator.generator_cache import cached_generate_tracks
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.memory import WORKER_MEMORY, plan_batch
+
+# Parameters of one cell of a sweep, values of the grid replace them
+DEFAULT_PARAMETERS = {
+    # generator
+    "n": 100,
+    "prot_length": 390,
+    "suntag_length": 796,
+    "nb_suntag": 32,
+    "fluo_one_suntag": 4,
+    "translation_rate": 24,
+    "binding_rate": 0.05,
+    "retention_time": 0,
+    "suntag_pos": "begin",
+    "noise_std": 0,
+    "step": 0.1,
+    "length": 6000,
+    # analysis
+    "dt": 0.1,
+    "long_track": None,
+    "method": "linear",
+    "seed": 0,
+}
+
+
+def sweep_cells(grid, fixed=None, seeds=(0,)):
+    """
+    List the cells of a sweep.
+
+    Parameters
+    ----------
+    grid : dict
+        parameter name and list of values to sweep
+    fixed : dict
+        parameters that are the same for all cells, default value : None
+    seeds : list
+        seeds of the random generator, each cell is repeated for each seed
+
+    Returns
+    -------
+    list of dict, parameters of each cell, completed with
+    `DEFAULT_PARAMETERS`
+    """
+    names = list(grid) + ["seed"]
+    cells = []
+    for values in itertools.product(*grid.values(), seeds):
+        params = dict(DEFAULT_PARAMETERS)
+        params.update(fixed or {})
+        params.update(zip(names, values))
+        cells.append(params)
+    return cells
+
+
+def cell_key(params):
+    """
+    Unique key of a cell, hash of its parameters and seed.
+    """
+    return hashlib.sha1(json.dumps(params,
+                                   sort_keys=True,
+                                   default=float).encode()).hexdigest()
+
+
+def cell_memory(params):
+    """
+    Estimated memory needed by `run_cell` in bytes.
+
+    Description
+    -----------
+    The generated tracks (4 columns of 8 bytes) are held about three times:
+    the dataset, the track being analysed and the copies made by pandas.
+    """
+    n_points = params["n"] * params["length"] / params["step"]
+    return int(3 * 4 * 8 * n_points)
+
+
+def run_cell(params):
+    """
+    Generate and analyse the tracks of one cell of a sweep.
+
+    Parameters
+    ----------
+    params : dict
+        parameters of the cell, see `DEFAULT_PARAMETERS`
+
+    Returns
+    -------
+    pd.DataFrame with one row per analysed track
+
+    Description
+    -----------
+    Tracks are generated with `generate_tracks`, subsampled every dt, cut
+    to long_track points and analysed with `single_track_analysis`, like
+    in the delta_t and track length notebooks. Generated tracks are cached,
+    cells that only differ by their analysis parameters share them.
+    """
+    datas = cached_generate_tracks(n=int(params["n"]),
+                                   prot_length=params["prot_length"],
+                                   suntag_length=params["suntag_length"],
+                                   nb_suntag=params["nb_suntag"],
+                                   fluo_one_suntag=params["fluo_one_suntag"],
+                                   translation_rate=params["translation_rate"],
+                                   binding_rate=params["binding_rate"],
+                                   retention_time=params["retention_time"],
+                                   suntag_pos=params["suntag_pos"],
+                                   noise=params["noise_std"] > 0,
+                                   noise_std=params["noise_std"],
+                                   step=params["step"],
+                                   length=params["length"],
+                                   seed=params["seed"])
+    t = int(np.rint(params["dt"] / params["step"]))
+    protein_size = params["prot_length"] + params["suntag_length"]
+
+    results = []
+    for i, track in datas.groupby("TRACK_ID"):
+        track = track[::t]
+        if params["long_track"] is not None:
+            track = track[:int(params["long_track"])]
+        if len(np.unique(track["MEAN_INTENSITY_CH1"])) <= 1:
+            continue
+        try:
+            (_, _, _, _,
+             elongation_r,
+             translation_init_r,
+             _) = single_track_analysis(track,
+                                        i,
+                                        delta_t=params["dt"],
+                                        protein_size=protein_size,
+                                        rtol=1e-1,
+                                        method=params["method"],
+                                        force_analysis=True,
+                                        simulation=True)
+        except (RuntimeError, ValueError, IndexError):
+            elongation_r, translation_init_r = np.nan, np.nan
+        results.append({"id": i,
+                        "elongation_r": elongation_r,
+                        "init_translation_r": translation_init_r})
+    return pd.DataFrame(results, columns=["id", "elongation_r",
+                                          "init_translation_r"])
+
+
+def _connect(db_path, read_only=False):
+    if read_only:
+        con = sqlite3.connect("file:" + str(db_path) + "?mode=ro", uri=True)
+    else:
+        con = sqlite3.connect(str(db_path))
+        # WAL lets the results be read while the sweep is writing
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS cells ("
+                    "key TEXT PRIMARY KEY, params TEXT, status TEXT, "
+                    "duration REAL, error TEXT)")
+    return con
+
+
+def _add_columns(con, columns):
+    # The results table has the columns of every grid written to it, a
+    # later grid with other parameters adds its columns to the table
+    existing = [row[1] for row in
+                con.execute("PRAGMA table_info(results)").fetchall()]
+    if not existing:
+        con.execute("CREATE TABLE results ({})".format(
+            ", ".join('"{}"'.format(c) for c in columns)))
+    for c in columns:
+        if c not in existing:
+            con.execute('ALTER TABLE results ADD COLUMN "{}"'.format(c))
+    con.commit()
+
+
+def _completed_keys(con):
+    # Rows of a cell interrupted between its results and its status are
+    # removed, the cell is computed again
+    if con.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                   "AND name = 'results'").fetchone():
+        con.execute("DELETE FROM results WHERE key NOT IN "
+                    "(SELECT key FROM cells WHERE status = 'done')")
+        con.commit()
+    return {row[0] for row in
+            con.execute("SELECT key FROM cells WHERE status = 'done'")}
+
+
+def _write_cell(con, key, params, results, duration, error=None):
+    with profiling.stage("write"):
+        if results is not None and len(results) > 0:
+            results = results.assign(key=key,
+                                     **{k: v for k, v in params.items()
+                                        if k not in results.columns})
+            _add_columns(con, list(results.columns))
+            results.to_sql("results", con, if_exists="append", index=False)
+        con.execute("INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?)",
+                    (key,
+                     json.dumps(params, sort_keys=True, default=float),
+                     "done" if error is None else "error",
+                     duration,
+                     error))
+        con.commit()
+
+
+def _timed_cell(cell_function, params):
+    start = time.perf_counter()
+    results = cell_function(params)
+    return results, time.perf_counter() - start
+
+
+def run_sweep(grid,
+              db_path,
+              fixed=None,
+              seeds=(0,),
+              cell_function=run_cell,
+              n_jobs=None,
+              progress=None,
+              memory_budget=None):
+    """
+    Run a parameter sweep on a process pool and store it in SQLite.
+
+    Parameters
+    ----------
+    grid : dict
+        parameter name and list of values to sweep, e.g.
+        {"dt": [0.1, 1, 3], "long_track": [100, 500]}
+    db_path : str
+        SQLite file where results are stored
+    fixed : dict
+        parameters that are the same for all cells, default value : None
+    seeds : list
+        seeds of the random generator, default value : (0,)
+    cell_function : function
+        function that computes one cell from its parameters and returns a
+        pd.DataFrame, it needs to be picklable, default value : `run_cell`
+    n_jobs : int
+        number of processes, default value : None, all processors
+    progress : function
+        called with (number of cells done, number of cells) after each
+        cell, default value : None
+    memory_budget : int or str
+        memory budget of the sweep, the number of processes is reduced so
+        that the largest cell fits in each process, see `cell_memory`,
+        default value : None, the budget set with
+        `utils.memory.set_memory_budget`
+
+    Returns
+    -------
+    int, number of cells computed by this call
+
+    Description
+    -----------
+    Each finished cell is written to the "results" table, with its
+    parameters and its key (hash of parameters and seed), and is marked as
+    done in the "cells" table. Cells already done are skipped, so a sweep
+    that crashed restarts where it stopped. Results can be read with
+    `load_sweep_results` while the sweep is running.
+    """
+    cells = sweep_cells(grid, fixed, seeds)
+    con = _connect(db_path)
+    # Schema from the parameters of all cells, results of cells with
+    # different parameters are appended to the same table
+    _add_columns(con, ["key"] + list(dict.fromkeys(
+        k for p in cells for k in p)))
+    done = _completed_keys(con)
+    todo = [(cell_key(p), p) for p in cells if cell_key(p) not in done]
+    n_done = len(cells) - len(todo)
+    try:
+        largest = max((cell_memory(p) for _, p in todo), default=0)
+    except KeyError:
+        # cell_function with other parameters
+        largest = 0
+    _, n_jobs = plan_batch(len(todo), largest, n_jobs, WORKER_MEMORY,
+                           memory_budget)
+
+    try:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(_timed_cell, cell_function, p): (k, p)
+                       for k, p in todo}
+            for future in as_completed(futures):
+                key, params = futures[future]
+                try:
+                    results, duration = future.result()
+                    _write_cell(con, key, params, results, duration)
+                except Exception as e:
+                    _write_cell(con, key, params, None, np.nan, str(e))
+                n_done += 1
+                if progress is not None:
+                    progress(n_done, len(cells))
+    finally:
+        con.close()
+    return len(todo)
+
+
+def load_sweep_results(db_path, query=None):
+    """
+    Read the results of a sweep, also while it is running.
+
+    Parameters
+    ----------
+    db_path : str
+        SQLite file of the sweep
+    query : str
+        SQL query, default value : None, the whole results table
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    con = _connect(db_path, read_only=True)
+    try:
+        return pd.read_sql_query(query or "SELECT * FROM results", con)
+    finally:
+        con.close()
+
+
+def summarise_sweep(db_path, by=("dt", "long_track"),
+                    columns=("elongation_r", "init_translation_r")):
+    """
+    Mean and standard deviation of the estimates of each group of a sweep.
+
+    Parameters
+    ----------
+    db_path : str
+        SQLite file of the sweep
+    by : list
+        columns that define the groups
+    columns : list
+        columns to summarise
+
+    Returns
+    -------
+    pd.DataFrame with one row per group, "n" is the number of tracks and
+    "<column>_n" the number of valid estimates
+
+    Description
+    -----------
+    Failed estimates (-1 with the linear method, NaN stored as NULL) are
+    not included in the mean and standard deviation.
+    """
+    by = list(by)
+    columns = list(columns)
+    valid = "CASE WHEN {0} != -1 THEN {0} END"
+    select = ", ".join(by + ["COUNT(*) AS n"] +
+                       ["COUNT({1}) AS {0}_n".format(c, valid.format(c))
+                        for c in columns] +
+                       ["AVG({1}) AS {0}".format(c, valid.format(c))
+                        for c in columns] +
+                       ["AVG(({1}) * ({1})) AS {0}_sq".format(
+                           c, valid.format(c)) for c in columns])
+    table = load_sweep_results(db_path,
+                               "SELECT " + select + " FROM results "
+                               "GROUP BY " + ", ".join(by))
+    for c in columns:
+        table[c + "_std"] = np.sqrt(np.clip(table.pop(c + "_sq") -
+                                            table[c] ** 2, 0, None))
+    return table
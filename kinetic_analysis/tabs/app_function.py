@@ -1,5 +1,10 @@
 import os
+import json
 import time
+import glob
+import shutil
+import hashlib
+import contextlib
 import threading
 import webview
 
@@ -10,7 +15,8 @@ import pandas as pd
 import tkinter as tk
 from tkinter import filedialog
 
-from dash import Dash, html, dcc, Input, Output, State, dash_table
+from dash import (Dash, html, dcc, Input, Output, State, dash_table,
+                  DiskcacheManager)
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_spinner
@@ -18,6 +24,20 @@ import dash_spinner
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.manifest import directory_manifest, file_preview
+
+# Directory of the state of background jobs
+JOBS_CACHE_DIR = os.environ.get(
+    "KINETIC_ANALYSIS_JOBS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "kinetic_analysis",
+                 "jobs"))
+# Profiling settings of the background jobs and the reports they write
+PROFILES_DIR = os.path.join(JOBS_CACHE_DIR, "profiles")
+# Number of tracks generated or analysed between two progress updates
+GENERATION_BATCH = 10
+ANALYSIS_BATCH = 200
+
 
 def browse_directory(n_clicks, col_name, app):
     if n_clicks:
@@ -34,6 +54,15 @@ def browse_directory(n_clicks, col_name, app):
         return f"Directory chosen: {app.data[col_name]}"
 
 
+def column_mapping(col_track, col_time, col_intensity):
+    """
+    Columns of a file given in the tabs and their names in the analysis.
+    """
+    return {col_track: "TRACK_ID",
+            col_time: "FRAME",
+            col_intensity: "MEAN_INTENSITY_CH1"}
+
+
 def list_csv_files(directory, col_name, app):
     """
     List csv files inside the directory.
@@ -48,10 +77,212 @@ def list_csv_files(directory, col_name, app):
     :rtype:
     """
     if app.data[col_name]:
+        # Files are described in the background, see `directory_manifest`
+        manifest = directory_manifest(app.data[col_name])
         app.data['csv_files'] = [
-            {'label': file, 'value': file}
-            for file in os.listdir(app.data[col_name]) if
-            file.endswith('.csv')
+            {'label': file, 'value': file} for file in manifest
         ]
         return app.data['csv_files']
     return []
+
+
+def preview_table(directory, filename):
+    """
+    Message and table of the first rows of a file, from the manifest of
+    its directory.
+    """
+    preview, entry = file_preview(directory, filename)
+    message = f"You selected: {filename}"
+    if entry.get("n_rows") is not None:
+        message += f" ({entry['n_rows']} rows"
+        if entry.get("n_tracks") is not None:
+            message += f", {entry['n_tracks']} tracks"
+        message += ")"
+    return message, dash_table.DataTable(
+        data=preview.to_dict('records'),
+        columns=[{"name": i, "id": i} for i in preview.columns])
+
+
+def background_manager(cache_dir=JOBS_CACHE_DIR):
+    """
+    Manager of the background callbacks of the app. Jobs run in their own
+    process and their state is kept in a diskcache in cache_dir.
+    """
+    import diskcache
+    return DiskcacheManager(diskcache.Cache(cache_dir))
+
+
+def job_controls(name):
+    """
+    Progress bar, cancel button and download of the partial results of a
+    background job, with ids prefixed by name.
+    """
+    return html.Div([
+        dbc.Progress(id=f"{name}-progress", value=0, max=1,
+                     style={"margin-top": "10px"}),
+        html.Div(id=f"{name}-progress-text"),
+        dbc.Button('Cancel', id=f"{name}-cancel-btn", className="mr-2",
+                   disabled=True, style={"width": "150px"}),
+        dbc.Button('Download results', id=f"{name}-download-btn",
+                   className="mr-2", style={"width": "150px"}),
+        dcc.Download(id=f"{name}-download"),
+    ])
+
+
+def job_callback_options(name, start_button):
+    """
+    Options of a background callback that uses `job_controls`: progress
+    outputs, cancel input and buttons disabled while it runs.
+    """
+    return {"background": True,
+            "progress": [Output(f"{name}-progress", "value"),
+                         Output(f"{name}-progress", "max"),
+                         Output(f"{name}-progress-text", "children")],
+            "cancel": [Input(f"{name}-cancel-btn", "n_clicks")],
+            "running": [(Output(start_button, "disabled"), True, False),
+                        (Output(f"{name}-cancel-btn", "disabled"), False,
+                         True)],
+            "prevent_initial_call": True}
+
+
+def _profiling_settings():
+    try:
+        with open(os.path.join(PROFILES_DIR, "settings.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def set_job_profiling(enabled, memory=False):
+    """
+    Enable or disable the profiling of the next background jobs. The
+    reports of the previous jobs are removed.
+
+    Description
+    -----------
+    Jobs run in their own process, where the profiler of the app is not
+    seen. The settings are shared in PROFILES_DIR, and each job profiled
+    writes its report there when it ends, see `job_profiling`.
+    """
+    shutil.rmtree(PROFILES_DIR, ignore_errors=True)
+    if enabled:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        with open(os.path.join(PROFILES_DIR, "settings.json"), "w") as f:
+            json.dump({"run": time.time_ns(), "memory": memory}, f)
+
+
+@contextlib.contextmanager
+def job_profiling():
+    """
+    Profile a background job if profiling is enabled, see
+    `set_job_profiling`.
+
+    Description
+    -----------
+    The report is written when the job ends, a job that is cancelled or
+    fails is not reported. It is dropped if profiling was reset or
+    disabled while the job ran.
+    """
+    settings = _profiling_settings()
+    if settings is None:
+        yield
+        return
+    with profiling.profiling(memory=settings["memory"]) as profiler:
+        yield
+    if _profiling_settings() == settings:
+        report = os.path.join(PROFILES_DIR, "job-{}-{}.json".format(
+            os.getpid(), time.time_ns()))
+        profiler.to_json(report + ".tmp")
+        os.replace(report + ".tmp", report)
+
+
+def job_profiles():
+    """
+    Stages of the reports of the background jobs profiled, see
+    `profiling.merge_stages`.
+    """
+    stages = []
+    for report in glob.glob(os.path.join(PROFILES_DIR, "job-*.json")):
+        try:
+            with open(report) as f:
+                stages.append(json.load(f)["stages"])
+        except (OSError, ValueError, KeyError):
+            # Removed by a reset or still being written
+            continue
+    return stages
+
+
+def progress_text(n_done, n_total, start, unit="tracks"):
+    """
+    Number of items done and throughput since start (time.time()).
+    """
+    rate = n_done / max(time.time() - start, 1e-9)
+    return f"{n_done} / {n_total} {unit} ({rate:.1f} {unit}/sec)"
+
+
+def partial_path(path):
+    """
+    File where the results of a job are written while it runs. It is kept
+    in the jobs cache, not in the directory of the results, so it is never
+    listed as an input file.
+    """
+    key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(JOBS_CACHE_DIR, "partial",
+                        key + "-" + os.path.basename(path))
+
+
+def start_partial(path):
+    """
+    Remove the partial results of a previous job that wrote path.
+    """
+    partial = partial_path(path)
+    os.makedirs(os.path.dirname(partial), exist_ok=True)
+    if os.path.isfile(partial):
+        os.remove(partial)
+    return partial
+
+
+def finish_partial(path):
+    """
+    Move the results of a job that is done to path.
+    """
+    shutil.move(partial_path(path), path)
+
+
+def append_csv(datas, path, first_row):
+    """
+    Write datas at the end of a csv file, with the rows numbered in the
+    whole file as index, like the file written by `DataFrame.to_csv` in one
+    go. The file is created with its header when first_row is 0.
+    """
+    datas = datas.set_axis(pd.RangeIndex(first_row, first_row + len(datas)))
+    datas.to_csv(path, mode="w" if first_row == 0 else "a",
+                 header=first_row == 0)
+
+
+def send_results(directory, filename):
+    """
+    Results of a job for a dcc.Download: the most recent of the results
+    written so far by a running or cancelled job and of the final file.
+    """
+    if not directory or not filename:
+        raise PreventUpdate
+    path = os.path.join(directory, filename + ".csv")
+    files = [f for f in [partial_path(path), path] if os.path.isfile(f)]
+    if not files:
+        raise PreventUpdate
+    return dcc.send_file(max(files, key=os.path.getmtime),
+                         filename=filename + ".csv")
+
+
+def directory_store(app, store_id, output_id, col_name):
+    """
+    Copy the chosen directory in a dcc.Store, background jobs run in
+    another process and can not read app.data.
+    """
+    @app.callback(
+        Output(store_id, 'data'),
+        Input(output_id, 'children'),
+    )
+    def store_directory(message):
+        return app.data[col_name]
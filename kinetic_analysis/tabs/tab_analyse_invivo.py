@@ -18,13 +18,32 @@ import dash_spinner
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 
-from kinetic_analysis.analysis.analysis_track import (single_track_analysis,
-                                     validate_equation)
+from kinetic_analysis.analysis.analysis_directory import directory_analysis
+from kinetic_analysis.analysis.analysis_track import (best_models,
+                                                      tracks_analysis,
+                                                      validate_equation)
 
-from kinetic_analysis.utils.utils import read_csv_file
+from kinetic_analysis.utils.dataset_cache import dataset_store
 
 from .app_function import (list_csv_files,
-                           browse_directory)
+                           preview_table,
+                           browse_directory,
+                           column_mapping,
+                           directory_store,
+                           job_controls,
+                           job_callback_options,
+                           progress_text,
+                           start_partial,
+                           finish_partial,
+                           append_csv,
+                           job_profiling,
+                           send_results,
+                           ANALYSIS_BATCH)
+
+# Columns of the results files, the rates are the ones of the best model of
+# each track, see `best_models`
+RESULT_COLUMNS = ["elongation_r", "init_translation_r", "dt", "id", "model",
+                  "qc_reason"]
 
 
 def layout():
@@ -43,6 +62,7 @@ def layout():
                                style={"width": "150px"}, ),
                     html.Div(id='directory-analyze-output-vivo', style={
                         'margin-top': '10px'}),
+                    dcc.Store(id='directory-analysis-vivo-store'),
                     html.Br(),
                     # Select a file inside the directory
                     dcc.Dropdown(id='file-dropdown-vivo', options=[],
@@ -138,6 +158,11 @@ def layout():
                              elongation rate. 
                             ''',
                               mathjax=True),
+                 html.P("Tracks are analysed with the linear method and "
+                        "with the equation when one is validated. The "
+                        "results file has one row per track with the rates "
+                        "of the model of lowest AIC, named in the \"model\" "
+                        "column."),
                  html.Div([
                      html.P(["Equation ",
                              html.Span(className="fas fa-question-circle",
@@ -230,6 +255,29 @@ def layout():
                 )
             ], width="auto"),
             html.Div(id='analyze-output-vivo'),
+            job_controls('analyze-vivo'),
+        ]),
+        # Analysis of all files of the directory
+        dbc.Row([
+            html.Br(),
+            dbc.Col([
+                dbc.Button('Analyse All Files',
+                           id='start-analyze-all-btn-vivo',
+                           className="mr-2",
+                           style={"width": "300px"}, ),
+            ], width="auto"),
+
+            dbc.Col([
+                dbc.Spinner(
+                    children=[html.Div(id="loading_analysis_all_vivo")],
+                    size="sm",
+                    color="primary",
+                    type="border",
+                    spinner_style={"margin-left": "10px"}
+                )
+            ], width="auto"),
+            html.Div(id='analyze-all-output-vivo'),
+            job_controls('analyze-all-vivo'),
         ])
 
     )
@@ -243,6 +291,9 @@ def register_callbacks(app):
     def browse_directory_analyze_vivo(n_clicks):
         return browse_directory(n_clicks, 'directory_analysis_vivo', app)
 
+    directory_store(app, 'directory-analysis-vivo-store',
+                    'directory-analyze-output-vivo', 'directory_analysis_vivo')
+
     @app.callback(
         Output('file-dropdown-vivo', 'options'),
         Input('directory-analyze-output-vivo', 'children')
@@ -260,18 +311,10 @@ def register_callbacks(app):
     def select_file(n_clicks, selected_file):
         if n_clicks and selected_file:
             app.data['selected_file_vivo'] = selected_file
-            df = read_csv_file(
-                os.path.join(app.data['directory_analysis_vivo'],
-                             app.data['selected_file_vivo']),)
-
-            first_10_rows = df.head(10)
-
-            return (f"You selected: {selected_file}",
-                    dash_table.DataTable(
-                        data=first_10_rows.to_dict('records'),
-                        columns=[{"name": i, "id": i} for i in
-                                 first_10_rows.columns]
-                    ), None)
+            message, table = preview_table(
+                app.data['directory_analysis_vivo'],
+                app.data['selected_file_vivo'])
+            return message, table, None
         raise PreventUpdate
 
     @app.callback(
@@ -284,7 +327,7 @@ def register_callbacks(app):
         if n_clicks :
             if not value :
                 return False, False
-            v_bool, v_message = validate_equation(value)
+            v_bool, v_message, func_ = validate_equation(value)
             if value and v_bool:
                 return True, False
             else:
@@ -295,6 +338,7 @@ def register_callbacks(app):
         Output('analyze-output-vivo', 'children'),
         Output('loading_analysis_vivo', 'children'),
         Input('start-analyze-btn-vivo', 'n_clicks'),
+        State('directory-analysis-vivo-store', 'data'),
         State('file-dropdown-vivo', 'value'),
         State('col_track', 'value'),
         State('col_time', 'value'),
@@ -303,68 +347,154 @@ def register_callbacks(app):
         State('prot-length-param-vivo', 'value'),
         State('save-results-name-vivo', 'value'),
         State('equation', 'value'),
+        **job_callback_options('analyze-vivo', 'start-analyze-btn-vivo'),
     )
-    def start_analyze_tracks(n_clicks, filename, *params):
+    def start_analyze_tracks(set_progress, n_clicks, directory, filename,
+                             *params):
+        # Analyse all tracks in a background job. Results are saved by
+        # batch of tracks, so they can be downloaded while the job runs.
         if n_clicks:
             try:
-                # Read csv file
-                df = read_csv_file(os.path.join(app.data[
-                                                     'directory_analysis_vivo'],
-                                                 filename))
-                df.rename(columns={params[0]: 'TRACK_ID',
-                                   params[1]: 'FRAME',
-                                   params[2]: 'MEAN_INTENSITY_CH1',
-                                  },
-                         inplace=True)
+                # Read only the columns used by the analysis, once per
+                # file and mapping. The job runs in its own process, so the
+                # tracks are kept in a store in ~/.cache/kinetic_analysis/
+                # stores that the next jobs map instead of parsing the file.
+                df = dataset_store(os.path.join(directory, filename),
+                                   columns=column_mapping(*params[:3]))
                 dt = float(params[3])
-                t = dt / 0.1
                 prot_length = float(params[4])
-                ids_track = np.unique(df["TRACK_ID"])
-
-                first_time = True
-                # Analyse all tracks and save it
-                for i in ids_track:
-                    datas2 = df[(df["TRACK_ID"] == i)]
-                    (x,
-                     y,
-                     x_auto,
-                     y_auto,
-                     elongation_r,
-                     translation_init_r,
-                     perr) = single_track_analysis(datas2,
-                                                   i,
-                                                   delta_t=dt,
-                                                   protein_size=prot_length,
-                                                   normalise_intensity=1,
-                                                   normalise_auto=True,
-                                                   mm=None,
-                                                   rtol=1e-1,
-                                                   method="linear",
-                                                   force_analysis=True,
-                                                   first_dot=True,
-                                                   simulation=False,)
-                    if first_time:
-                        results = pd.DataFrame({"elongation_r": elongation_r,
-                                                "init_translation_r": translation_init_r,
-                                                "dt": dt,
-                                                "id": i, },
-                                               index=[0])
-                        first_time = False
 
-                    else:
-                        results = pd.concat([results,
-                                             pd.DataFrame(
-                                                 {"elongation_r": elongation_r,
-                                                  "init_translation_r": translation_init_r,
-                                                  "dt": dt,
-                                                  "id": i, }, index=[0])
-                                             ], ignore_index=True)
+                # The custom equation is fitted on the same autocorrelation
+                # as the linear method
+                models = ["linear"]
+                if params[6] and validate_equation(params[6])[0]:
+                    models.append(params[6])
 
-                results.to_csv(
-                    os.path.join(app.data['directory_analysis_vivo'],
-                                 params[5] + ".csv"))
+                # Analyse all tracks and save it. Constant and too short
+                # tracks are rejected first, tracks with gaps are forced.
+                path = os.path.join(directory, params[5] + ".csv")
+                n = len(df)
+                n_done = 0
+                n_rows = 0
+                partial = start_partial(path)
+                start = time.time()
+                set_progress((0, n, progress_text(0, n, start)))
+                with job_profiling():
+                    for tracks in df.chunks(ANALYSIS_BATCH):
+                        results = tracks_analysis(tracks,
+                                                  delta_t=dt,
+                                                  protein_size=prot_length,
+                                                  models=models,
+                                                  normalise_intensity=1,
+                                                  normalise_auto=True,
+                                                  mm=None,
+                                                  rtol=1e-1,
+                                                  force_analysis=True,
+                                                  first_dot=True,
+                                                  simulation=False,
+                                                  qc_thresholds={
+                                                      "max_gap_fraction": 1})
+                        # One row per track, as without model comparison
+                        results = best_models(results)[RESULT_COLUMNS]
+                        append_csv(results, partial, n_rows)
+                        n_rows += len(results)
+                        n_done += len(tracks)
+                        set_progress((n_done, n,
+                                      progress_text(n_done, n, start)))
+                finish_partial(path)
 
                 return "Analysis completed and saved successfully!", None
             except Exception as e:
                 return f"Error: {str(e)}", None
         raise PreventUpdate
+
+    @app.callback(
+        Output('analyze-vivo-download', 'data'),
+        Input('analyze-vivo-download-btn', 'n_clicks'),
+        State('directory-analysis-vivo-store', 'data'),
+        State('save-results-name-vivo', 'value'),
+        prevent_initial_call=True,
+    )
+    def download_results(n_clicks, directory, filename):
+        return send_results(directory, filename)
+
+    @app.callback(
+        Output('analyze-all-output-vivo', 'children'),
+        Output('loading_analysis_all_vivo', 'children'),
+        Input('start-analyze-all-btn-vivo', 'n_clicks'),
+        State('directory-analysis-vivo-store', 'data'),
+        State('col_track', 'value'),
+        State('col_time', 'value'),
+        State('col_intensity', 'value'),
+        State('dt-param-vivo', 'value'),
+        State('prot-length-param-vivo', 'value'),
+        State('save-results-name-vivo', 'value'),
+        State('equation', 'value'),
+        **job_callback_options('analyze-all-vivo',
+                               'start-analyze-all-btn-vivo'),
+    )
+    def start_analyze_all_tracks(set_progress, n_clicks, directory,
+                                 *params):
+        # Analyse all files in a background job, the progress is updated
+        # each time a file is done
+        if n_clicks:
+            try:
+                models = ["linear"]
+                if params[6] and validate_equation(params[6])[0]:
+                    models.append(params[6])
+
+                # Status of each file, in the order they finish
+                status = {}
+                start = time.time()
+
+                def progress(name, state, n_done, n_files):
+                    status[name] = state
+                    set_progress((n_done, n_files,
+                                  progress_text(n_done, n_files, start,
+                                                unit="files")))
+
+                with job_profiling():
+                    results = directory_analysis(
+                        directory,
+                        columns=column_mapping(*params[:3]),
+                        progress=progress,
+                        delta_t=float(params[3]),
+                        protein_size=float(params[4]),
+                        models=models,
+                        normalise_intensity=1,
+                        normalise_auto=True,
+                        mm=None,
+                        rtol=1e-1,
+                        force_analysis=True,
+                        first_dot=True,
+                        simulation=False,
+                        qc_thresholds={"max_gap_fraction": 1})
+
+                # Saved outside of the directory of the tracks, so the
+                # next analysis of the directory does not read it
+                output = os.path.join(directory, "results")
+                os.makedirs(output, exist_ok=True)
+                results = best_models(results, ["file", "id"]).reindex(
+                    columns=["file"] + RESULT_COLUMNS)
+                results.to_csv(os.path.join(output, params[5] + ".csv"))
+
+                return html.Div(
+                    [html.P(f"{results['file'].nunique()} files analysed "
+                            f"and saved successfully in {output}!")] +
+                    [html.P(f"{name}: {state}")
+                     for name, state in status.items()]), None
+            except Exception as e:
+                return f"Error: {str(e)}", None
+        raise PreventUpdate
+
+    @app.callback(
+        Output('analyze-all-vivo-download', 'data'),
+        Input('analyze-all-vivo-download-btn', 'n_clicks'),
+        State('directory-analysis-vivo-store', 'data'),
+        State('save-results-name-vivo', 'value'),
+        prevent_initial_call=True,
+    )
+    def download_all_results(n_clicks, directory, filename):
+        if not directory:
+            raise PreventUpdate
+        return send_results(os.path.join(directory, "results"), filename)
@@ -21,9 +21,12 @@ from plotly.subplots import make_subplots
 from kinetic_analysis.analysis.analysis_track import (single_track_analysis,
                                      validate_equation,
                                      fit_function)
-from kinetic_analysis.utils.utils import read_csv_file
+from kinetic_analysis.utils.dataset_cache import load_dataset
+from kinetic_analysis.utils.diagnostics import logger
 from .app_function import (list_csv_files,
-                           browse_directory)
+                           preview_table,
+                           browse_directory,
+                           column_mapping)
 
 
 def layout():
@@ -262,17 +265,10 @@ def register_callbacks(app):
     def select_file2(n_clicks, selected_file):
         if n_clicks and selected_file:
             app.data['selected_file_vivo'] = selected_file
-            df = read_csv_file(
-                os.path.join(app.data['directory_analysis_vivo'],
-                             app.data['selected_file_vivo']))
-            first_10_rows = df.head(10)
-
-            return (f"You selected: {selected_file}",
-                    dash_table.DataTable(
-                        data=first_10_rows.to_dict('records'),
-                        columns=[{"name": i, "id": i} for i in
-                                 first_10_rows.columns]
-                    ), None)
+            message, table = preview_table(
+                app.data['directory_analysis_vivo'],
+                app.data['selected_file_vivo'])
+            return message, table, None
         raise PreventUpdate
 
     @app.callback(
@@ -320,19 +316,17 @@ def register_callbacks(app):
                 ## AJOUTER LA VERIFICATION QUE LA TRACK EXISTE,
                 # SINON AFFICHER UN MESSAGE D'ERREUR
 
-                # Read csv file
-                df = read_csv_file(os.path.join(app.data[
-                                                     'directory_analysis_vivo'],
-                                                 filename))
-
-                df.rename(columns={params[0]: 'TRACK_ID',
-                                      params[1]: 'FRAME',
-                                      params[2]: 'MEAN_INTENSITY_CH1',
-                                      },
-                             inplace=True)
+                # The file is parsed once, then tracks are read from the
+                # dataset cache. The app keeps a sidecar of the file in
+                # ~/.cache/kinetic_analysis/files to reopen it quickly.
+                store = load_dataset(os.path.join(app.data[
+                                                      'directory_analysis_vivo'],
+                                                  filename),
+                                     columns=column_mapping(*params[:3]),
+                                     cache=True)
                 dt = float(params[3])
                 prot_length = float(params[4])
-                datas2 = df[(df["TRACK_ID"] == int(params[5]))]
+                datas2 = store.select([int(params[5])])
                 (x,
                  y,
                  x_auto,
@@ -394,7 +388,7 @@ def register_callbacks(app):
 
                 return figure, str_output1, str_output2, None
             except Exception as e:
-                print(e)
+                logger.exception("analysis of track %s failed", params[5])
                 return {
                     'data': [],
                     'layout': go.Layout(title='Error', xaxis={'title': 'Time'},
@@ -21,8 +21,19 @@ from plotly.subplots import make_subplots
 from kinetic_analysis.generator.generator_track import (generate_one_track,
                                        generate_tracks,
                                        generate_profile)
+from kinetic_analysis.utils.diagnostics import logger
 
-from .app_function import (browse_directory)
+from .app_function import (browse_directory,
+                           directory_store,
+                           job_controls,
+                           job_callback_options,
+                           progress_text,
+                           start_partial,
+                           finish_partial,
+                           append_csv,
+                           job_profiling,
+                           send_results,
+                           GENERATION_BATCH)
 
 
 def layout():
@@ -49,6 +60,7 @@ def layout():
                        className="mr-2",
                        style={"width": "150px"}, ),
             html.Div(id='directory-output', style={'margin-top': '10px'}),
+            dcc.Store(id='directory-generation-store'),
             html.Br(),
         ]),
         # Define parameter of the simulation
@@ -259,6 +271,7 @@ def layout():
                     ], width="auto"),
                 ], align="center", style={"margin-top": "10px"}),
                 html.Div(id='gen-tracks-output'),
+                job_controls('gen-tracks'),
             ], width=3),
 
             # Show plot profile
@@ -285,6 +298,9 @@ def register_callbacks(app):
         """
         return browse_directory(n_clicks, 'directory_generation', app)
 
+    directory_store(app, 'directory-generation-store', 'directory-output',
+                    'directory_generation')
+
     @app.callback(
         Output('profile-plot', 'figure'),
         Input('show-profile-btn', 'n_clicks'),
@@ -374,8 +390,8 @@ def register_callbacks(app):
                 figure.update_layout(width=1000, height=800, )
                 return figure
 
-            except Exception as e:
-                print(e)
+            except Exception:
+                logger.exception("profile plot failed")
                 return {
                     'data': [],
                     'layout': go.Layout(title='Error', xaxis={'title': 'Time'},
@@ -387,6 +403,7 @@ def register_callbacks(app):
         Output('gen-tracks-output', 'children'),
         Output('loading_generate', 'children'),
         Input('start-gen-tracks-btn', 'n_clicks'),
+        State('directory-generation-store', 'data'),
         State('param_prot_length', 'value'),
         State('param_suntag_length', 'value'),
         State('param_nb_suntag', 'value'),
@@ -400,32 +417,59 @@ def register_callbacks(app):
         State('param_length', 'value'),
         State('param_nb_tracks', 'value'),
         State('param_filename', 'value'),
+        **job_callback_options('gen-tracks', 'start-gen-tracks-btn'),
     )
-    def start_generate_tracks(n_clicks, *params):
-        # Generate all tracks and save it
+    def start_generate_tracks(set_progress, n_clicks, directory, *params):
+        # Generate all tracks in a background job. Tracks are saved by
+        # batch, so they can be downloaded while the job runs.
         if n_clicks:
             try:
                 noise = False
                 if params[8] > 0:
                     noise = True
-                datas = generate_tracks(n=int(params[11]),
-                                        prot_length=float(params[0]),
-                                        suntag_length=float(params[1]),
-                                        nb_suntag=float(params[2]),
-                                        fluo_one_suntag=float(params[3]),
-                                        translation_rate=float(params[4]),
-                                        binding_rate=float(params[5]),
-                                        retention_time=float(params[6]),
-                                        suntag_pos=params[7],
-                                        noise=noise,
-                                        noise_std=float(params[8]),
-                                        step=float(params[9]),
-                                        length=float(params[10]),
-                                        )
-                datas.to_csv(os.path.join(app.data['directory_generation'],
-                                          params[12] + ".csv"))
+                n = int(params[11])
+                path = os.path.join(directory, params[12] + ".csv")
+                partial = start_partial(path)
+                n_rows = 0
+                start = time.time()
+                with job_profiling():
+                    for first in range(0, n, GENERATION_BATCH):
+                        datas = generate_tracks(
+                            n=min(GENERATION_BATCH, n - first),
+                            prot_length=float(params[0]),
+                            suntag_length=float(params[1]),
+                            nb_suntag=float(params[2]),
+                            fluo_one_suntag=float(params[3]),
+                            translation_rate=float(params[4]),
+                            binding_rate=float(params[5]),
+                            retention_time=float(params[6]),
+                            suntag_pos=params[7],
+                            noise=noise,
+                            noise_std=float(params[8]),
+                            step=float(params[9]),
+                            length=float(params[10]),
+                        )
+                        datas["TRACK_ID"] += first
+                        # Same file as the one written at once, the first
+                        # column is the row number read back as index
+                        append_csv(datas, partial, n_rows)
+                        n_rows += len(datas)
+                        n_done = min(first + GENERATION_BATCH, n)
+                        set_progress((n_done, n,
+                                      progress_text(n_done, n, start)))
+                finish_partial(path)
 
                 return "Tracks generated and saved successfully!", None
             except Exception as e:
                 return f"Error: {str(e)}", None
         raise PreventUpdate
+
+    @app.callback(
+        Output('gen-tracks-download', 'data'),
+        Input('gen-tracks-download-btn', 'n_clicks'),
+        State('directory-generation-store', 'data'),
+        State('param_filename', 'value'),
+        prevent_initial_call=True,
+    )
+    def download_generated_tracks(n_clicks, directory, filename):
+        return send_results(directory, filename)
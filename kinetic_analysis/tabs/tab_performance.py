@@ -0,0 +1,84 @@
+from dash import html, Input, Output, dash_table, ctx
+import dash_bootstrap_components as dbc
+
+from kinetic_analysis.utils import profiling
+
+from .app_function import job_profiles, set_job_profiling
+
+
+def layout():
+    return (html.Div([
+        dbc.Row([
+            html.P([
+                "Time spent in each stage of the analysis (DataFrame "
+                "filtering, continuity check, autocorrelation, fit). ",
+                html.Br(),
+                "Memory measures the peak resident memory and the peak "
+                "python allocations of each stage (in MB), it slows the "
+                "analysis down.",
+                html.Br(),
+                "Enable profiling, run an analysis in another tab and "
+                "refresh the table.",
+                html.Br(),
+                "Background jobs (track generation, analysis of a file) "
+                "are added to the table when they finish, cancelled jobs "
+                "are not. The worker processes of the analysis of all "
+                "files are not measured."]),
+            html.Br(),
+        ]),
+        dbc.Row([
+            dbc.Col([
+                dbc.Switch(id="profiling-switch",
+                           label="Enable profiling",
+                           value=profiling.is_profiling()),
+            ], width="auto"),
+            dbc.Col([
+                dbc.Switch(id="profiling-memory-switch",
+                           label="Measure memory",
+                           value=False),
+            ], width="auto"),
+            dbc.Col([
+                dbc.Button("Refresh", id="profiling-refresh-btn",
+                           className="mr-2",
+                           style={"width": "150px"}, ),
+            ], width="auto"),
+            dbc.Col([
+                dbc.Button("Reset", id="profiling-reset-btn",
+                           className="mr-2",
+                           style={"width": "150px"}, ),
+            ], width="auto"),
+        ], align="center"),
+        html.Br(),
+        html.Div(id="profiling-table"),
+    ]),
+    )
+
+
+def _profile_table():
+    # Stages of the app and of the background jobs, which run in their own
+    # process
+    table = profiling.get_profile(job_profiles()).round(4)
+    return dash_table.DataTable(data=table.to_dict('records'),
+                                columns=[{"name": i, "id": i} for i in
+                                         table.columns])
+
+
+def register_callbacks(app):
+    @app.callback(
+        Output("profiling-table", "children"),
+        Input("profiling-switch", "value"),
+        Input("profiling-memory-switch", "value"),
+        Input("profiling-refresh-btn", "n_clicks"),
+        Input("profiling-reset-btn", "n_clicks"),
+    )
+    def update_profiling(enabled, memory, n_refresh, n_reset):
+        if not enabled:
+            profiling.disable_profiling()
+            set_job_profiling(False)
+        elif (not profiling.is_profiling() or
+              ctx.triggered_id in ["profiling-reset-btn",
+                                   "profiling-memory-switch"]):
+            # Start a new run
+            profiling.enable_profiling(memory=memory)
+            set_job_profiling(True, memory=memory)
+        return _profile_table()
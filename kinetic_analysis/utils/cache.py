@@ -0,0 +1,37 @@
+import os
+import shutil
+
+# Maximum size of each cache directory in bytes
+DEFAULT_MAX_SIZE = 2 * 1024 ** 3
+
+
+def entry_size(path):
+    """
+    Size in bytes of the files of a cache entry (a directory).
+    """
+    return sum(os.path.getsize(os.path.join(path, f))
+               for f in os.listdir(path))
+
+
+def evict_cache(cache_dir, max_size=DEFAULT_MAX_SIZE):
+    """
+    Remove the least recently used entries of a cache directory until it
+    fits in max_size bytes.
+
+    Description
+    -----------
+    Entries are the directories of cache_dir, their modification time is
+    their last use. Hidden entries, written at the moment, are kept.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)
+               if not d.startswith(".")]
+    entries = sorted(entries, key=os.path.getmtime)
+    sizes = [entry_size(e) for e in entries]
+    total = sum(sizes)
+    for entry, size in zip(entries, sizes):
+        if total <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from kinetic_analysis.utils.cache import DEFAULT_MAX_SIZE, evict_cache
+from kinetic_analysis.utils.memory import parse_size
+from kinetic_analysis.utils.reader import DEFAULT_FILE_CACHE_DIR
+from kinetic_analysis.utils.track_store import TrackStore
+from kinetic_analysis.utils.utils import read_csv_file
+
+# Memory used by the datasets kept by the process
+DEFAULT_MAX_BYTES = parse_size(
+    os.environ.get("KINETIC_ANALYSIS_DATASET_CACHE") or "1GB")
+
+# Track stores of the datasets, shared by the processes
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(DEFAULT_FILE_CACHE_DIR),
+                                 "stores")
+
+# Datasets from the least to the most recently used, by key
+_DATASETS = OrderedDict()
+_LOCK = threading.Lock()
+_MAX_BYTES = DEFAULT_MAX_BYTES
+
+
+def set_dataset_cache_size(max_bytes):
+    """
+    Set the memory of the dataset cache, as a number of bytes or a string
+    such as "512MB". Datasets are removed until the cache fits.
+    """
+    global _MAX_BYTES
+    _MAX_BYTES = parse_size(max_bytes)
+    with _LOCK:
+        _evict()
+
+
+def dataset_key(path, columns=None):
+    """
+    Key of a dataset, it changes when the file is modified.
+
+    Parameters
+    ----------
+    path : str
+        csv file
+    columns : dict
+        columns of the file and their names in the analysis, see
+        `column_mapping`
+    """
+    stat = os.stat(path)
+    mapping = None if columns is None else tuple(sorted(columns.items()))
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size, mapping
+
+
+def _evict():
+    total = sum(store.nbytes for store in _DATASETS.values())
+    # The last dataset is kept even if it is larger than the cache
+    while total > _MAX_BYTES and len(_DATASETS) > 1:
+        _, store = _DATASETS.popitem(last=False)
+        total -= store.nbytes
+
+
+def load_dataset(path, columns=None, cache=False):
+    """
+    Tracks of a csv file, parsed once per process.
+
+    Parameters
+    ----------
+    path : str
+        csv file
+    columns : dict
+        columns of the file that contain the track id, the frame and the
+        intensity and their names in the analysis, default value : None,
+        the file uses the names of the analysis
+    cache : bool
+        also keep a sidecar of the file on disk, see `read_csv_file`,
+        default value : False
+
+    Returns
+    -------
+    TrackStore kept in memory, see `TrackStore.in_memory`
+
+    Description
+    -----------
+    Datasets are kept in a least recently used cache bounded by the memory
+    set with `set_dataset_cache_size` (KINETIC_ANALYSIS_DATASET_CACHE,
+    default 1GB). A dataset is read again when the file or the column
+    mapping changes. Tracks are indexed, so reading one track does not
+    scan the dataset.
+    """
+    key = dataset_key(path, columns)
+    with _LOCK:
+        if key in _DATASETS:
+            _DATASETS.move_to_end(key)
+            return _DATASETS[key]
+
+    if columns is None:
+        columns = {c: c for c in ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]}
+    df = read_csv_file(path, cache=cache, columns=columns, compact=True)
+    store = TrackStore.in_memory(df, source=os.path.abspath(path))
+
+    with _LOCK:
+        # Older versions of the file are not used anymore
+        for old in [k for k in _DATASETS
+                    if k[0] == key[0] and k[1:3] != key[1:3]]:
+            del _DATASETS[old]
+        _DATASETS[key] = store
+        _evict()
+    return store
+
+
+def clear_dataset_cache():
+    with _LOCK:
+        _DATASETS.clear()
+
+
+def dataset_store(path,
+                  columns=None,
+                  cache_dir=DEFAULT_STORE_DIR,
+                  max_size=DEFAULT_MAX_SIZE):
+    """
+    Tracks of a csv file in a track store on disk, written once for all
+    processes.
+
+    Parameters
+    ----------
+    path, columns : see `load_dataset`
+    cache_dir : str
+        directory of the stores, default value : ~/.cache/kinetic_analysis/
+        stores
+    max_size : int
+        maximum size of the stores in bytes, default value : 2 GB
+
+    Returns
+    -------
+    TrackStore, memory mapped
+
+    Description
+    -----------
+    Background jobs run in new processes, the dataset cache of
+    `load_dataset` does not live longer than the job. The store is keyed by
+    `dataset_key`, so the first job parses the file and the next ones only
+    map the store.
+    """
+    key = hashlib.sha256(json.dumps(dataset_key(path, columns)).encode())
+    store_path = os.path.join(cache_dir, key.hexdigest())
+    if os.path.isdir(store_path):
+        # Accessing an entry makes it the most recently used one
+        os.utime(store_path)
+        return TrackStore(store_path)
+    store = load_dataset(path, columns).save(store_path)
+    evict_cache(cache_dir, max_size)
+    return store
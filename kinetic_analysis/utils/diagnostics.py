@@ -0,0 +1,90 @@
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger("kinetic_analysis")
+
+
+class Diagnostics:
+    """
+    In-memory record of the events of the analysis of each track.
+
+    Parameters
+    ----------
+    level : int
+        logging level from which events are also sent to the
+        "kinetic_analysis" logger, default value : logging.WARNING
+    keep_arrays : bool
+        keep array details (e.g. the points used by a fit) in the record,
+        default value : False, arrays are dropped
+
+    Description
+    -----------
+    Events are stored as plain values. Nothing is formatted unless the
+    logger emits the event, and arrays are never formatted.
+    """
+
+    def __init__(self, level=logging.WARNING, keep_arrays=False):
+        self.level = level
+        self.keep_arrays = keep_arrays
+        self.events = []
+
+    def add(self, id_track, stage, event, level=logging.INFO, **details):
+        if not self.keep_arrays:
+            details = {k: v for k, v in details.items()
+                       if not hasattr(v, "__len__") or isinstance(v, str)}
+        self.events.append({"id": id_track,
+                            "stage": stage,
+                            "event": event,
+                            "level": logging.getLevelName(level),
+                            **details})
+        if level >= self.level:
+            _log(id_track, stage, event, level)
+
+    def to_frame(self):
+        """
+        Events as a pd.DataFrame, one row per event.
+        """
+        return pd.DataFrame(self.events,
+                            columns=None if self.events else
+                            ["id", "stage", "event", "level"])
+
+    def summary(self):
+        """
+        Number of events of each kind.
+        """
+        table = self.to_frame()
+        return table.groupby(["stage", "event", "level"]).size().rename(
+            "count").reset_index()
+
+
+def _log(id_track, stage, event, level):
+    if logger.isEnabledFor(level):
+        logger.log(level, "track %s, %s: %s", id_track, stage, event)
+
+
+def record(diagnostics, id_track, stage, event, level=logging.INFO,
+           **details):
+    """
+    Record an event of the analysis of a track.
+
+    Parameters
+    ----------
+    diagnostics : Diagnostics
+        record where the event is stored, if None the event is only sent to
+        the logger
+    id_track : int
+        id of the track
+    stage : str
+        stage of the analysis, e.g. "continuity" or "fit"
+    event : str
+        short description of the event
+    level : int
+        logging level of the event, default value : logging.INFO
+    details : dict
+        values attached to the event
+    """
+    if diagnostics is None:
+        _log(id_track, stage, event, level)
+    else:
+        diagnostics.add(id_track, stage, event, level, **details)
@@ -0,0 +1,228 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import warnings
+
+import pandas as pd
+
+from kinetic_analysis.utils.reader import (DEFAULT_FILE_CACHE_DIR,
+                                           count_rows,
+                                           read_preview,
+                                           read_tracks,
+                                           sniff_csv)
+
+# Increase when the content of the entries changes, it invalidates the
+# manifests
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_DIR = os.environ.get(
+    "KINETIC_ANALYSIS_MANIFEST_CACHE",
+    os.path.join(os.path.dirname(DEFAULT_FILE_CACHE_DIR), "manifests"))
+PREVIEW_ROWS = 10
+
+# Manifests in memory and directories being scanned, by directory
+_MANIFESTS = {}
+_SCANS = {}
+_LOCK = threading.Lock()
+
+
+def manifest_path(directory, manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    File of the manifest of a directory. Manifests are kept in the cache,
+    not in the directory, which may be read only.
+    """
+    key = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()
+    return os.path.join(manifest_dir, key + ".json")
+
+
+def _load_manifest(directory, manifest_dir):
+    try:
+        with open(manifest_path(directory, manifest_dir)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest["files"]
+
+
+def _save_manifest(directory, files, manifest_dir):
+    path = manifest_path(directory, manifest_dir)
+    try:
+        os.makedirs(manifest_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=manifest_dir, prefix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": MANIFEST_VERSION,
+                       "directory": os.path.abspath(directory),
+                       "files": files}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        # The manifest is rebuilt next time
+        warnings.warn("Manifest of " + directory + " not saved: " + str(e),
+                      ResourceWarning)
+
+
+def file_entry(path, n_rows=PREVIEW_ROWS):
+    """
+    Description of a csv file of tracks.
+
+    Returns
+    -------
+    dict with
+    - "size" and "mtime" of the file, the entry is valid while they do not
+      change
+    - "sep", "columns" and "skiprows", layout found by `sniff_csv`
+    - "n_rows", number of rows of data
+    - "n_tracks", number of tracks, None without "TRACK_ID" column
+    - "preview", first n_rows rows as records
+    - "error", message when the file can not be read, other keys are then
+      missing
+    """
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+    try:
+        layout = sniff_csv(path)
+        entry.update({"sep": layout["sep"],
+                      "columns": layout["columns"],
+                      "skiprows": layout["skiprows"]})
+        preview = read_preview(path, n_rows)
+        entry["preview"] = json.loads(preview.to_json(orient="records"))
+        if "TRACK_ID" in layout["columns"]:
+            # Only the track column is parsed
+            tracks = read_tracks(path, columns=["TRACK_ID"])["TRACK_ID"]
+            entry["n_rows"] = len(tracks)
+            entry["n_tracks"] = int(tracks.nunique())
+        else:
+            entry["n_rows"] = count_rows(path, layout["skiprows"])
+            entry["n_tracks"] = None
+    except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+        entry["error"] = str(e)
+    return entry
+
+
+def _is_fresh(entry, stat):
+    return (entry.get("size") == stat.st_size and
+            entry.get("mtime") == stat.st_mtime)
+
+
+def _list_files(directory, extension):
+    files = {}
+    for f in sorted(os.listdir(directory)):
+        path = os.path.join(directory, f)
+        if f.endswith(extension) and os.path.isfile(path):
+            files[f] = os.stat(path)
+    return files
+
+
+def directory_manifest(directory,
+                       extension=".csv",
+                       background=True,
+                       manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    Manifest of the csv files of a directory.
+
+    Parameters
+    ----------
+    directory : str
+    extension : str
+        extension of the files listed, default value : ".csv"
+    background : bool
+        describe new and modified files in a background thread, otherwise
+        before returning, default value : True
+    manifest_dir : str
+        directory where manifests are saved
+
+    Returns
+    -------
+    dict, entry of each file by name, see `file_entry`. With background,
+    the entries of new and modified files only have "size" and "mtime"
+    until the scan is done.
+
+    Description
+    -----------
+    Listing a directory only needs stat calls: entries of files whose size
+    and modification time did not change are reused, the others are
+    described again in the background and saved in the manifest after each
+    file.
+    """
+    directory = os.path.abspath(directory)
+    files = _list_files(directory, extension)
+    with _LOCK:
+        entries = _MANIFESTS.get(directory)
+        if entries is None:
+            entries = _load_manifest(directory, manifest_dir)
+        entries = {f: (entries[f] if f in entries and
+                       _is_fresh(entries[f], stat) else
+                       {"size": stat.st_size, "mtime": stat.st_mtime})
+                   for f, stat in files.items()}
+        _MANIFESTS[directory] = entries
+        todo = [f for f, e in entries.items() if "preview" not in e and
+                "error" not in e]
+        if not todo:
+            return dict(entries)
+        if background:
+            scan = _SCANS.get(directory)
+            if scan is None or not scan.is_alive():
+                scan = threading.Thread(target=update_manifest,
+                                        args=(directory, manifest_dir),
+                                        daemon=True)
+                _SCANS[directory] = scan
+                scan.start()
+            return dict(entries)
+    update_manifest(directory, manifest_dir)
+    return dict(_MANIFESTS[directory])
+
+
+def update_manifest(directory, manifest_dir=DEFAULT_MANIFEST_DIR):
+    """
+    Describe the files of the manifest of a directory that are not
+    described yet, see `directory_manifest`.
+    """
+    directory = os.path.abspath(directory)
+    while True:
+        with _LOCK:
+            entries = _MANIFESTS.get(directory, {})
+            todo = [f for f, e in entries.items() if "preview" not in e and
+                    "error" not in e]
+        if not todo:
+            return
+        path = os.path.join(directory, todo[0])
+        try:
+            entry = file_entry(path)
+        except OSError:
+            # Removed since it was listed
+            entry = None
+        with _LOCK:
+            entries = _MANIFESTS.get(directory, {})
+            if entry is None:
+                entries.pop(todo[0], None)
+            elif todo[0] in entries:
+                entries[todo[0]] = entry
+            snapshot = dict(entries)
+        _save_manifest(directory, snapshot, manifest_dir)
+
+
+def file_preview(directory, name, n_rows=PREVIEW_ROWS):
+    """
+    First rows of a file of a directory, from its manifest when it is up
+    to date, otherwise read from the beginning of the file.
+
+    Returns
+    -------
+    preview : pd.DataFrame
+    entry : dict
+        entry of the file in the manifest, see `file_entry`, only "size"
+        and "mtime" when the file is not described yet
+    """
+    directory = os.path.abspath(directory)
+    path = os.path.join(directory, name)
+    stat = os.stat(path)
+    with _LOCK:
+        entry = _MANIFESTS.get(directory, {}).get(name)
+    if entry is not None and _is_fresh(entry, stat) and "preview" in entry:
+        preview = pd.DataFrame.from_records(entry["preview"],
+                                            columns=entry["columns"])
+        return preview.head(n_rows), entry
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+    return read_preview(path, n_rows), entry
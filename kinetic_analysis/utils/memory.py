@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import warnings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Memory budget of batch analysis and generation in bytes, None when there
+# is no limit
+_BUDGET = None
+# Memory of a python process with the libraries loaded, used for the
+# workers of process pools
+WORKER_MEMORY = 200 * 1024 ** 2
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3,
+          "T": 1024 ** 4}
+
+
+def parse_size(size):
+    """
+    Size in bytes of a number or a string such as "512MB" or "4 GB".
+    """
+    if size is None or isinstance(size, (int, float)):
+        return None if size is None else int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)I?B?\s*", size.upper())
+    if match is None:
+        raise ValueError("Invalid size " + size)
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def set_memory_budget(budget):
+    """
+    Set the memory budget of batch analysis and generation.
+
+    Parameters
+    ----------
+    budget : int or str
+        budget in bytes or as a string such as "4GB", None to remove the
+        limit
+
+    Description
+    -----------
+    The default budget is read from the KINETIC_ANALYSIS_MEMORY_BUDGET
+    environment variable.
+    """
+    global _BUDGET
+    _BUDGET = parse_size(budget)
+
+
+def get_memory_budget():
+    return _BUDGET
+
+
+def current_rss():
+    """
+    Resident memory of the process in bytes, None if it is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def reset_peak_rss():
+    """
+    Reset the highest resident memory of the process to its current
+    resident memory, so `peak_rss` measures from now on.
+
+    Returns
+    -------
+    bool, False when the system can not reset it (only Linux can)
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """
+    Highest resident memory of the process in bytes since its start or
+    since the last `reset_peak_rss`, None if it is not available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def plan_batch(n_items, item_bytes, n_jobs=None, base_bytes=0, budget=None):
+    """
+    Chunk size and number of workers that fit in the memory budget.
+
+    Parameters
+    ----------
+    n_items : int
+        number of items to process (tracks, groups, cells)
+    item_bytes : int
+        memory needed by one item
+    n_jobs : int
+        maximum number of workers, default value : None, all processors
+    base_bytes : int
+        memory needed by a worker whatever the number of items, default
+        value : 0
+    budget : int or str
+        memory budget, default value : None, the budget set with
+        `set_memory_budget`
+
+    Returns
+    -------
+    chunk_size : int
+        number of items processed at once by a worker
+    n_workers : int
+
+    Description
+    -----------
+    Without budget, all items are processed at once by n_jobs workers.
+    Otherwise the number of workers is reduced until one item fits in the
+    share of the budget of each worker, then the chunks fill that share.
+    """
+    n_items = max(int(n_items), 1)
+    n_workers = n_jobs or os.cpu_count() or 1
+    n_workers = max(min(n_workers, n_items), 1)
+    budget = _BUDGET if budget is None else parse_size(budget)
+    if budget is None:
+        return n_items, n_workers
+
+    n_workers = int(min(n_workers,
+                        max(budget // max(base_bytes + item_bytes, 1), 1)))
+    chunk_size = (budget / n_workers - base_bytes) // max(item_bytes, 1)
+    if chunk_size < 1:
+        warnings.warn("One item needs more memory than the budget, it is "
+                      "processed anyway", ResourceWarning)
+    return int(min(max(chunk_size, 1), n_items)), n_workers
+
+
+def chunks(n_items, chunk_size):
+    """
+    Slices of consecutive items of at most chunk_size items.
+    """
+    return [slice(i, min(i + chunk_size, n_items))
+            for i in range(0, n_items, chunk_size)]
+
+
+set_memory_budget(os.environ.get("KINETIC_ANALYSIS_MEMORY_BUDGET") or None)
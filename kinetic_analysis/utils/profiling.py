@@ -0,0 +1,304 @@
+import json
+import time
+import contextlib
+import tracemalloc
+
+import pandas as pd
+
+from kinetic_analysis.utils.memory import (current_rss,
+                                           peak_rss,
+                                           reset_peak_rss)
+
+# Profiler in use, None when profiling is disabled
+_PROFILER = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Wall time, number of calls and fit evaluations of each pipeline stage.
+
+    Parameters
+    ----------
+    memory : bool
+        also measure the memory of each stage, default value : False
+    snapshots : int
+        number of allocation sites kept for each stage, default value : 0
+
+    Description
+    -----------
+    With memory, each stage gets
+    - "rss_peak", highest resident memory of the process during a call of
+      the stage, in MB
+    - "rss_increase", largest increase of the resident memory during one
+      call, from its start to that highest value, in MB
+    - "traced_peak", largest peak of the python allocations during one
+      call, measured with tracemalloc, in MB
+    With snapshots, the largest allocation sites still held at the end of
+    the call with the highest traced peak are kept in `snapshots`.
+    tracemalloc slows the allocations down, times are then overestimated.
+    The highest resident memory of the process is reset at the start of
+    each stage on Linux. Elsewhere it can not be reset, the resident
+    memory at the end of the call is used instead, and traced_peak is the
+    reliable peak.
+    """
+
+    def __init__(self, memory=False, snapshots=0):
+        self.stages = {}
+        self.memory = memory or snapshots > 0
+        self.n_snapshots = snapshots
+        self.snapshots = {}
+        # Highest traced peak of each stage in progress, tracemalloc has a
+        # single peak which is reset at the start of each stage
+        self._peaks = []
+        # Same for the resident memory
+        self._rss_peaks = []
+        self._rss_reset = self.memory and reset_peak_rss()
+        self._tracing = self.memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+
+    def close(self):
+        """
+        Stop tracemalloc if it was started by the profiler.
+        """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def _stage(self, name):
+        stage = self.stages.setdefault(name, {"calls": 0,
+                                              "time": 0.,
+                                              "nfev": 0})
+        if self.memory:
+            for k in ["rss_peak", "rss_increase", "traced_peak"]:
+                stage.setdefault(k, 0.)
+        return stage
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.memory:
+            rss_start = current_rss() or 0
+            if self._rss_peaks:
+                self._rss_peaks[-1] = max(self._rss_peaks[-1], self._rss())
+            if self._rss_reset:
+                reset_peak_rss()
+            self._rss_peaks.append(rss_start)
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1],
+                                      tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._peaks.append(0)
+            traced_start = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            s = self._stage(name)
+            s["calls"] += 1
+            s["time"] += time.perf_counter() - start
+            if self.memory:
+                self._end_memory(name, s, rss_start, traced_start)
+
+    def _end_memory(self, name, s, rss_start, traced_start):
+        peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        traced = (peak - traced_start) / 1024 ** 2
+        rss_peak = max(self._rss_peaks.pop(), self._rss())
+        if self._rss_peaks:
+            self._rss_peaks[-1] = max(self._rss_peaks[-1], rss_peak)
+        s["rss_peak"] = max(s["rss_peak"], rss_peak / 1024 ** 2)
+        s["rss_increase"] = max(s["rss_increase"],
+                                (rss_peak - rss_start) / 1024 ** 2)
+        if traced >= s["traced_peak"]:
+            s["traced_peak"] = traced
+            if self.n_snapshots:
+                stats = tracemalloc.take_snapshot().statistics("lineno")
+                self.snapshots[name] = [
+                    (str(st.traceback), st.size / 1024 ** 2, st.count)
+                    for st in stats[:self.n_snapshots]]
+
+    def _rss(self):
+        # Highest resident memory since the last reset, or the current one
+        if self._rss_reset:
+            return peak_rss() or 0
+        return current_rss() or 0
+
+    def add_nfev(self, name, nfev):
+        self._stage(name)["nfev"] += int(nfev)
+
+    def report(self):
+        """
+        Aggregated stages as a pd.DataFrame, sorted by total time.
+        """
+        return _report(self.stages, self.memory,
+                       time.perf_counter() - self.start)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"total_time": time.perf_counter() - self.start,
+                       "stages": self.stages,
+                       "snapshots": self.snapshots}, f, indent=2)
+
+
+def _report(stages, memory, total_time):
+    columns = ["calls", "time", "nfev"]
+    if memory:
+        columns += ["rss_peak", "rss_increase", "traced_peak"]
+    table = pd.DataFrame.from_dict(stages, orient="index", columns=columns)
+    table.index.name = "stage"
+    table["time_per_call"] = table["time"] / table["calls"].clip(lower=1)
+    table["fraction"] = table["time"] / max(total_time, 1e-12)
+    return table.sort_values("time", ascending=False).reset_index()
+
+
+def merge_stages(stages, other):
+    """
+    Add the stages of another profiling run to stages.
+
+    Parameters
+    ----------
+    stages : dict
+        stages of a run, see `Profiler.stages`, modified in place
+    other : dict
+        stages of the other run, e.g. the "stages" of a report written by
+        `Profiler.to_json` in another process
+
+    Returns
+    -------
+    dict, stages
+
+    Description
+    -----------
+    Calls, times and fit evaluations are summed, memory measures keep the
+    highest value.
+    """
+    for name, s in other.items():
+        stage = stages.setdefault(name, {})
+        for k, v in s.items():
+            if k in ["calls", "time", "nfev"]:
+                stage[k] = stage.get(k, 0) + v
+            else:
+                stage[k] = max(stage.get(k, 0.), v)
+    return stages
+
+
+def stage(name):
+    """
+    Context manager that times a stage of the pipeline.
+
+    Description
+    -----------
+    When profiling is disabled, a shared no-op context is returned, so the
+    instrumentation costs one global lookup.
+    """
+    if _PROFILER is None:
+        return _NULL_STAGE
+    return _PROFILER.stage(name)
+
+
+def add_nfev(name, nfev):
+    """
+    Add a number of function evaluations of a fit to a stage.
+    """
+    if _PROFILER is not None:
+        _PROFILER.add_nfev(name, nfev)
+
+
+def is_profiling():
+    return _PROFILER is not None
+
+
+def enable_profiling(memory=False, snapshots=0):
+    """
+    Start a new profiling run.
+
+    Parameters
+    ----------
+    memory, snapshots : see `Profiler`
+
+    Returns
+    -------
+    Profiler
+    """
+    global _PROFILER
+    if _PROFILER is not None:
+        _PROFILER.close()
+    _PROFILER = Profiler(memory, snapshots)
+    return _PROFILER
+
+
+def disable_profiling():
+    """
+    Stop profiling.
+
+    Returns
+    -------
+    Profiler of the run that stops, None if profiling was disabled
+    """
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def get_profile(others=None):
+    """
+    Report of the current profiling run.
+
+    Parameters
+    ----------
+    others : list of dict
+        stages of runs of other processes added to the report, see
+        `merge_stages`, default value : None
+
+    Returns
+    -------
+    pd.DataFrame, see `Profiler.report`, empty if profiling is disabled.
+    The fraction is relative to the wall time of the current run, stages
+    of processes that run at the same time can add up to more than 1.
+    """
+    if _PROFILER is None:
+        return pd.DataFrame(columns=["stage", "calls", "time", "nfev",
+                                     "time_per_call", "fraction"])
+    if not others:
+        return _PROFILER.report()
+    stages = {name: dict(s) for name, s in _PROFILER.stages.items()}
+    for other in others:
+        merge_stages(stages, other)
+    return _report(stages, _PROFILER.memory,
+                   time.perf_counter() - _PROFILER.start)
+
+
+@contextlib.contextmanager
+def profiling(report=None, memory=False, snapshots=0):
+    """
+    Profile a block of code.
+
+    Parameters
+    ----------
+    report : str
+        json file where the report is written at the end of the block,
+        default value : None
+    memory, snapshots : see `Profiler`
+
+    Examples
+    --------
+    >>> with profiling("profile.json") as profiler:
+    ...     tracks_analysis(df)
+    >>> profiler.report()
+    """
+    global _PROFILER
+    previous = _PROFILER
+    profiler = Profiler(memory, snapshots)
+    _PROFILER = profiler
+    try:
+        yield profiler
+    finally:
+        _PROFILER = previous
+        profiler.close()
+        if report is not None:
+            profiler.to_json(report)
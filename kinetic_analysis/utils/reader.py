@@ -0,0 +1,650 @@
+import os
+import csv
+import json
+import shutil
+import hashlib
+import tempfile
+
+from array import array
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.utils import profiling
+from kinetic_analysis.utils.cache import DEFAULT_MAX_SIZE, evict_cache
+from kinetic_analysis.utils.track_store import write_track_store
+
+# Increase when a change of the reader gives different tables for the same
+# file, it invalidates the sidecars
+READER_VERSION = 2
+DEFAULT_FILE_CACHE_DIR = os.environ.get(
+    "KINETIC_ANALYSIS_FILE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "kinetic_analysis",
+                 "files"))
+
+# Size of the beginning of the file used to find its layout
+SNIFF_SIZE = 64 * 1024
+DELIMITERS = ",;\t"
+NA_VALUES = ["None"]
+
+# Types of the TrackMate columns, other columns are inferred by the parser
+TEXT_COLUMNS = ["LABEL", "MANUAL_SPOT_COLOR", "NAME"]
+INTEGER_COLUMNS = ["ID", "TRACK_ID", "FRAME", "VISIBILITY"]
+TIME_COLUMNS = ["FRAME", "POSITION_T"]
+FLOAT_PREFIXES = ("POSITION_", "MEAN_", "MEDIAN_", "MIN_", "MAX_", "TOTAL_",
+                  "STD_", "CONTRAST_", "SNR_", "ELLIPSE_", "AREA",
+                  "PERIMETER", "CIRCULARITY", "SOLIDITY", "SHAPE_INDEX",
+                  "QUALITY", "RADIUS")
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_data_row(row):
+    values = [v for v in row if v.strip() != ""]
+    n_numbers = sum(_is_number(v) for v in values)
+    return n_numbers > 0 and 2 * n_numbers >= len(values)
+
+
+def _unique_names(names):
+    # Same names as pandas for empty and duplicated columns
+    unique = []
+    for i, name in enumerate(names):
+        name = name.strip() or "Unnamed: " + str(i)
+        new, k = name, 0
+        while new in unique:
+            k += 1
+            new = name + "." + str(k)
+        unique.append(new)
+    return unique
+
+
+def sniff_csv(path, n_bytes=SNIFF_SIZE):
+    """
+    Find the delimiter and the header of a csv file from its beginning.
+
+    Parameters
+    ----------
+    path : str
+        csv file
+    n_bytes : int
+        number of bytes read, default value : 64 kB
+
+    Returns
+    -------
+    dict with
+    - "sep", delimiter
+    - "columns", names of the columns, from the first line
+    - "header", all header lines, split in fields. TrackMate exports have
+      3 more lines after the names: long names, short names and units.
+    - "skiprows", number of lines before the first line of data
+
+    Description
+    -----------
+    The first line that contains mostly numbers is the first line of data,
+    all lines before it are header lines.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(n_bytes)
+    lines = sample.decode("utf-8-sig", errors="replace").splitlines()
+    if len(sample) == n_bytes:
+        # The last line may be cut
+        lines = lines[:-1]
+    if not lines or lines[0].strip() == "":
+        raise ValueError("No header in " + str(path))
+
+    try:
+        sep = csv.Sniffer().sniff("\n".join(lines[:20]),
+                                  delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        sep = max(DELIMITERS, key=lines[0].count)
+
+    rows = list(csv.reader(lines, delimiter=sep))
+    skiprows = next((i for i, row in enumerate(rows) if i > 0 and
+                     _is_data_row(row)), 1)
+    return {"sep": sep,
+            "columns": _unique_names(rows[0]),
+            "header": rows[:skiprows],
+            "skiprows": skiprows}
+
+
+def column_dtypes(columns):
+    """
+    Types used to parse the known TrackMate columns.
+
+    Description
+    -----------
+    Integer columns are parsed as float, because TrackMate writes "None"
+    for the spots without track, and are converted back to integers after
+    the parsing when they have no missing value.
+    """
+    dtypes = {}
+    for c in columns:
+        if c in TEXT_COLUMNS:
+            dtypes[c] = "str"
+        elif c in INTEGER_COLUMNS or c.startswith(FLOAT_PREFIXES):
+            dtypes[c] = "float64"
+    return dtypes
+
+
+def _default_engine():
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        return "c"
+
+
+def _is_integer(values):
+    return (values.dtype.kind == "f" and not np.isnan(values).any()
+            and np.array_equal(values, np.floor(values)))
+
+
+def _integer_columns(datas):
+    for c in INTEGER_COLUMNS:
+        if c in datas.columns and _is_integer(datas[c].to_numpy()):
+            datas[c] = datas[c].to_numpy().astype(np.int64)
+    return datas
+
+
+def compact_dtypes(datas):
+    """
+    Smallest types that keep the values of the columns.
+
+    Description
+    -----------
+    Integer columns (and float columns of integers, such as frames) use the
+    smallest integer type, other float columns use float32, except the
+    times of simulations (FRAME, POSITION_T) that keep float64. Text
+    columns are unchanged.
+    """
+    for c in datas.columns:
+        values = datas[c].to_numpy()
+        if values.dtype.kind in "iu" or _is_integer(values):
+            datas[c] = pd.to_numeric(values.astype(np.int64),
+                                     downcast="integer")
+        elif values.dtype == np.float64 and c not in TIME_COLUMNS:
+            datas[c] = values.astype(np.float32)
+    return datas
+
+
+def _read_options(path, columns=None):
+    # Options of pd.read_csv for the layout of the file, the columns to
+    # read and their new names
+    layout = sniff_csv(path)
+    names = layout["columns"]
+    rename = None
+    if isinstance(columns, dict):
+        rename = {k: v for k, v in columns.items() if k != v}
+    if columns is not None:
+        missing = [c for c in columns if c not in names]
+        if missing:
+            raise KeyError("Columns not found in " + str(path) + ": " +
+                           ", ".join(map(str, missing)))
+        columns = list(columns)
+    dtypes = {c: t for c, t in column_dtypes(names).items()
+              if columns is None or c in columns}
+    return columns, rename, {"sep": layout["sep"],
+                             "header": None,
+                             "names": names,
+                             "skiprows": layout["skiprows"],
+                             "usecols": columns,
+                             "dtype": dtypes,
+                             "na_values": NA_VALUES}
+
+
+def _pyarrow_options(kwargs):
+    # The pyarrow engine does not find columns asked by name when the names
+    # are given, they are asked by position with the names of those columns
+    if kwargs["usecols"] is None:
+        return kwargs
+    names = kwargs["names"]
+    positions = sorted(names.index(c) for c in kwargs["usecols"])
+    return dict(kwargs, names=[names[i] for i in positions],
+                usecols=positions)
+
+
+def _project(datas, columns, rename):
+    # Columns in the order asked, with their new names
+    if columns is not None:
+        datas = datas.reindex(columns=columns)
+    if rename:
+        datas = datas.rename(columns=rename)
+    return _integer_columns(datas)
+
+
+def read_tracks(path, columns=None, engine=None, compact=False):
+    """
+    Read a csv file of tracks with a fast parser.
+
+    Parameters
+    ----------
+    path : str
+        csv file, with any delimiter and with one header line or the four
+        header lines of TrackMate
+    columns : list or dict
+        columns to read, or dict of the columns to read and their new names,
+        e.g. {"Track ID": "TRACK_ID"}, default value : None, all columns
+    engine : str
+        parser of pandas, "pyarrow" or "c", default value : None, pyarrow if
+        it is installed
+    compact : bool
+        use the smallest types, see `compact_dtypes`, default value : False
+
+    Returns
+    -------
+    pd.DataFrame
+
+    Description
+    -----------
+    The layout of the file is found from its first kB with `sniff_csv`,
+    so the whole file is parsed by a compiled parser instead of the python
+    one needed by pd.read_csv(sep=None). Known TrackMate columns are parsed
+    with the types of `column_dtypes`. Columns that are not asked are
+    skipped by the parser.
+    """
+    columns, rename, kwargs = _read_options(path, columns)
+    engine = engine or _default_engine()
+    with profiling.stage("load"):
+        if engine == "pyarrow":
+            try:
+                datas = pd.read_csv(path, engine="pyarrow",
+                                    **_pyarrow_options(kwargs))
+            except (ValueError, TypeError, KeyError):
+                # Options or content not supported by pyarrow
+                engine = "c"
+        if engine != "pyarrow":
+            datas = pd.read_csv(path, engine=engine,
+                                encoding_errors="replace", **kwargs)
+        datas = _project(datas, columns, rename)
+        if compact:
+            datas = compact_dtypes(datas)
+    return datas
+
+
+def read_preview(path, n_rows=10, columns=None):
+    """
+    First rows of a csv file of tracks, without parsing the rest of the
+    file.
+
+    Parameters
+    ----------
+    path : str
+        csv file, see `read_tracks`
+    n_rows : int
+        number of rows read, default value : 10
+    columns : list or dict
+        see `read_tracks`, default value : None, all columns
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    columns, rename, kwargs = _read_options(path, columns)
+    datas = pd.read_csv(path, engine="c", encoding_errors="replace",
+                        nrows=n_rows, **kwargs)
+    return _project(datas, columns, rename)
+
+
+def count_rows(path, skiprows=0, block_size=1024 ** 2):
+    """
+    Number of lines of data of a file, counted without parsing it.
+    """
+    n_lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            n_lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        # Last line without end of line
+        n_lines += 1
+    return max(n_lines - skiprows, 0)
+
+
+def file_key(path, columns=None, compact=False):
+    """
+    Key of a csv file in the cache, hash of its path, size, modification
+    time, the columns read, their names and types, and the reader version.
+    """
+    stat = os.stat(path)
+    if isinstance(columns, dict):
+        columns = list(columns.items())
+    elif columns is not None:
+        columns = list(columns)
+    content = {"path": os.path.abspath(path),
+               "size": stat.st_size,
+               "mtime": stat.st_mtime_ns,
+               "columns": columns,
+               "compact": compact,
+               "version": READER_VERSION}
+    return hashlib.sha256(json.dumps(content,
+                                     sort_keys=True).encode()).hexdigest()
+
+
+def _save_sidecar(datas, path, source):
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written in a temporary directory first, so a sidecar is never seen
+    # half written
+    tmp = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp")
+    try:
+        text = []
+        for i, c in enumerate(datas.columns):
+            values = datas[c]
+            if (pd.api.types.is_object_dtype(values) or
+                    pd.api.types.is_string_dtype(values) or
+                    isinstance(values.dtype, pd.CategoricalDtype)):
+                # Text is stored as the codes of its categories, -1 when it
+                # is missing, and the categories as fixed width unicode, so
+                # no pickle is needed and only the categories are turned
+                # into python objects when the sidecar is loaded
+                values = pd.Categorical(values)
+                np.save(os.path.join(tmp, str(i) + "_categories.npy"),
+                        np.asarray(values.categories, dtype=str))
+                values = values.codes
+                text.append(c)
+            np.save(os.path.join(tmp, str(i) + ".npy"), np.asarray(values))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"source": os.path.abspath(source),
+                       "columns": list(datas.columns),
+                       "text": text,
+                       "version": READER_VERSION}, f)
+        os.replace(tmp, path)
+    except OSError:
+        # Another process wrote the same sidecar or the disk is full
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _load_sidecar(path):
+    # Accessing an entry makes it the most recently used one
+    os.utime(path)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    datas = {}
+    for i, c in enumerate(meta["columns"]):
+        # ndarray view of the memory map, same frame as `read_tracks`
+        values = np.asarray(np.load(os.path.join(path, str(i) + ".npy"),
+                                    mmap_mode="r"))
+        if c in meta["text"]:
+            categories = np.load(os.path.join(path,
+                                              str(i) + "_categories.npy"))
+            values = pd.Categorical.from_codes(values,
+                                               categories.astype(object))
+        datas[c] = values
+    return pd.DataFrame(datas, columns=meta["columns"], copy=False)
+
+
+def cached_read_tracks(path,
+                       columns=None,
+                       engine=None,
+                       compact=False,
+                       cache_dir=DEFAULT_FILE_CACHE_DIR,
+                       max_size=DEFAULT_MAX_SIZE):
+    """
+    Read a csv file of tracks, or load it from its sidecar if it was
+    already read.
+
+    Parameters
+    ----------
+    path, columns, engine, compact : see `read_tracks`
+    cache_dir : str
+        directory of the sidecars, default value : ~/.cache/
+        kinetic_analysis/files or the KINETIC_ANALYSIS_FILE_CACHE
+        environment variable
+    max_size : int
+        maximum size of the sidecars in bytes, default value : 2 GB
+
+    Returns
+    -------
+    pd.DataFrame, same as `read_tracks`
+
+    Description
+    -----------
+    At the first read, each column is saved as a .npy file in a directory
+    named by `file_key`. A file that changes (size or modification time)
+    gets a new key and is read again. Numeric columns of the sidecar are
+    memory mapped, so reopening a large file only reads the pages that are
+    used. Text columns (e.g. LABEL, MANUAL_SPOT_COLOR) are stored as
+    categories and loaded as pd.Categorical. Least recently used sidecars
+    are removed when the cache is larger than max_size.
+    """
+    sidecar = os.path.join(cache_dir, file_key(path, columns, compact))
+    if os.path.isdir(sidecar):
+        with profiling.stage("load"):
+            return _load_sidecar(sidecar)
+
+    datas = read_tracks(path, columns, engine, compact)
+    with profiling.stage("write"):
+        _save_sidecar(datas, sidecar, path)
+    evict_cache(cache_dir, max_size)
+    return datas
+
+
+def _read_chunks(path, columns, chunksize):
+    columns, rename, kwargs = _read_options(path, columns)
+    with pd.read_csv(path, engine="c", encoding_errors="replace",
+                     chunksize=chunksize, **kwargs) as reader:
+        for chunk in reader:
+            with profiling.stage("load"):
+                chunk = _project(chunk, columns, rename)
+                chunk = chunk[chunk["TRACK_ID"].notna()]
+            yield chunk
+
+
+def _iter_sorted_tracks(chunks):
+    done = set()
+    rest = None
+    for chunk in chunks:
+        if rest is not None:
+            chunk = pd.concat([rest, chunk], ignore_index=True)
+        if len(chunk) == 0:
+            continue
+        # The last track of the chunk may continue in the next chunk
+        last = chunk["TRACK_ID"].iloc[-1]
+        is_last = (chunk["TRACK_ID"] == last).to_numpy()
+        rest = chunk[is_last]
+        for i, track in chunk[~is_last].groupby("TRACK_ID", sort=False):
+            if i in done:
+                raise ValueError("Track " + str(i) + " is not contiguous, "
+                                 "the file is not sorted by track, use "
+                                 "sorted_input=False")
+            done.add(i)
+            yield i, track
+    if rest is not None and len(rest) > 0:
+        i = rest["TRACK_ID"].iloc[0]
+        if i in done:
+            raise ValueError("Track " + str(i) + " is not contiguous, the "
+                             "file is not sorted by track, use "
+                             "sorted_input=False")
+        yield i, rest
+
+
+def _iter_spilled_tracks(chunks, n_buckets, spill_dir):
+    tmp = tempfile.mkdtemp(dir=spill_dir, prefix="kinetic_analysis_spill")
+    try:
+        # Each track goes to one bucket file, a bucket then fits in memory
+        with profiling.stage("write"):
+            for chunk in chunks:
+                bucket = pd.util.hash_array(
+                    chunk["TRACK_ID"].to_numpy()) % n_buckets
+                for b, rows in chunk.groupby(bucket, sort=False):
+                    f = os.path.join(tmp, str(b) + ".csv")
+                    rows.to_csv(f, mode="a", header=not os.path.exists(f),
+                                index=False)
+        for f in sorted(os.listdir(tmp)):
+            with profiling.stage("load"):
+                rows = pd.read_csv(os.path.join(tmp, f))
+            for i, track in rows.groupby("TRACK_ID", sort=False):
+                yield i, track
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def iter_tracks_csv(path,
+                    columns=None,
+                    chunksize=100000,
+                    sorted_input=True,
+                    n_buckets=64,
+                    spill_dir=None):
+    """
+    Read a csv file of tracks by chunks and give each track as soon as all
+    its rows are read.
+
+    Parameters
+    ----------
+    path, columns : see `read_tracks`, columns can rename the columns
+    chunksize : int
+        number of rows read at once, default value : 100000
+    sorted_input : bool
+        the rows of a track are contiguous in the file, as in TrackMate
+        exports, default value : True
+    n_buckets : int
+        number of bucket files used when the input is not sorted, default
+        value : 64
+    spill_dir : str
+        directory of the bucket files, default value : None, the temporary
+        directory of the system
+
+    Returns
+    -------
+    iterator of (id, pd.DataFrame), like a groupby on "TRACK_ID"
+
+    Description
+    -----------
+    With sorted input, a track is complete when the next track starts, the
+    memory is bounded by the chunk size and the longest track. A ValueError
+    is raised if a track appears twice.
+    Otherwise the rows are first written to n_buckets files by a hash of
+    their track, then each bucket is read and grouped; the memory is then
+    bounded by the chunk size and the size of a bucket.
+    """
+    chunks = _read_chunks(path, columns, chunksize)
+    if sorted_input:
+        return _iter_sorted_tracks(chunks)
+    return _iter_spilled_tracks(chunks, n_buckets, spill_dir)
+
+
+def _local_name(tag):
+    # Tag without namespace
+    return tag.rsplit("}", 1)[-1]
+
+
+def read_trackmate_xml(path, store_path=None, channels=None,
+                       filtered_only=True):
+    """
+    Read the tracks of a TrackMate xml file.
+
+    Parameters
+    ----------
+    path : str
+        TrackMate xml file
+    store_path : str
+        directory of the track store where the tracks are written, default
+        value : None, tracks are returned as a pd.DataFrame
+    channels : list
+        channels whose mean intensity is read, e.g. [1, 2], default value :
+        None, all channels
+    filtered_only : bool
+        keep only the tracks visible in TrackMate (FilteredTracks), as in
+        the csv exports, default value : True
+
+    Returns
+    -------
+    TrackStore, or pd.DataFrame with "TRACK_ID", "FRAME" and
+    "MEAN_INTENSITY_CH<n>" columns when store_path is None
+
+    Description
+    -----------
+    The file is read with iterparse and every element is cleared once
+    read, so the xml tree is never in memory. Only the id, frame and mean
+    intensities of the spots and the edges of the tracks are kept, in
+    compact arrays of 8 bytes per value.
+    The memory is still proportional to the number of spots: the track of
+    a spot is only known from the edges, written after all spots, so every
+    spot is kept until the end of the file, about 8 * (2 + number of
+    channels) bytes per spot and 16 bytes per edge, then the index and the
+    sorted columns of the tracks (e.g. 10 million spots with one channel
+    need about 1 GB). The store only bounds the memory used after reading.
+    """
+    spot_ids = array("q")
+    frames = array("d")
+    intensities = None
+    edge_spots = array("q")
+    edge_tracks = array("q")
+    filtered = set()
+    has_filter = False
+
+    with profiling.stage("load"):
+        track_id = None
+        for event, elem in ElementTree.iterparse(path,
+                                                 events=("start", "end")):
+            tag = _local_name(elem.tag)
+            if event == "start":
+                if tag == "Track":
+                    track_id = int(elem.get("TRACK_ID"))
+                elif tag == "FilteredTracks":
+                    has_filter = True
+                continue
+
+            if tag == "Spot":
+                if intensities is None:
+                    if channels is None:
+                        channels = sorted(
+                            int(k[len("MEAN_INTENSITY_CH"):])
+                            for k in elem.keys()
+                            if k.startswith("MEAN_INTENSITY_CH"))
+                    intensities = {c: array("d") for c in channels}
+                spot_ids.append(int(elem.get("ID")))
+                frames.append(float(elem.get("FRAME")))
+                for c, values in intensities.items():
+                    values.append(float(elem.get("MEAN_INTENSITY_CH" +
+                                                 str(c), "nan")))
+                elem.clear()
+            elif tag == "Edge":
+                for k in ["SPOT_SOURCE_ID", "SPOT_TARGET_ID"]:
+                    edge_spots.append(int(elem.get(k)))
+                    edge_tracks.append(track_id)
+                elem.clear()
+            elif tag == "TrackID":
+                filtered.add(int(elem.get("TRACK_ID")))
+                elem.clear()
+            elif tag in ["SpotsInFrame", "Track", "AllSpots", "AllTracks",
+                         "FeatureDeclarations", "Settings", "Log",
+                         "GUIState", "DisplaySettings"]:
+                elem.clear()
+
+    with profiling.stage("index"):
+        spot_ids = np.frombuffer(spot_ids, dtype=np.int64)
+        edge_spots = np.frombuffer(edge_spots, dtype=np.int64)
+        edge_tracks = np.frombuffer(edge_tracks, dtype=np.int64)
+        if filtered_only and has_filter:
+            keep = np.isin(edge_tracks, np.fromiter(filtered, np.int64))
+            edge_spots, edge_tracks = edge_spots[keep], edge_tracks[keep]
+
+        # Track of each spot, nan for the spots without track
+        order = np.argsort(spot_ids)
+        position = order[np.searchsorted(spot_ids[order], edge_spots)]
+        tracks = np.full(len(spot_ids), np.nan)
+        tracks[position] = edge_tracks
+        in_track = ~np.isnan(tracks)
+        datas = {"TRACK_ID": tracks[in_track],
+                 "FRAME": np.frombuffer(frames, dtype=np.float64)[in_track]}
+        for c, values in (intensities or {}).items():
+            datas["MEAN_INTENSITY_CH" + str(c)] = np.frombuffer(
+                values, dtype=np.float64)[in_track]
+        datas.setdefault("MEAN_INTENSITY_CH1",
+                         np.full(in_track.sum(), np.nan))
+        datas = _integer_columns(pd.DataFrame(datas))
+
+    if store_path is None:
+        return datas.sort_values(["TRACK_ID", "FRAME"],
+                                 ignore_index=True)
+    return write_track_store(datas, store_path,
+                             columns=list(datas.columns), source=path)
@@ -0,0 +1,272 @@
+import os
+import json
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.utils import profiling
+
+# Increase when the layout of the store changes
+STORE_VERSION = 1
+# Columns of every store, other numeric columns can be added
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+def write_track_store(df, path, columns=None, source=None):
+    """
+    Write tracks in a track store.
+
+    Parameters
+    ----------
+    df : pd.df
+        dataframe that contains tracks, with "TRACK_ID", "FRAME" and
+        "MEAN_INTENSITY_CH1" columns
+    path : str
+        directory of the store, replaced if it exists
+    columns : list
+        other numeric columns of df to store, default value : None
+    source : str
+        file the tracks come from, kept in the metadata, default value :
+        None
+
+    Description
+    -----------
+    A store is a directory with
+    - one .npy file per column, rows sorted by track and frame, so the
+      points of a track are contiguous
+    - "ids.npy", sorted ids of the tracks, and "offsets.npy", first row of
+      each track followed by the number of rows
+    - "meta.json", version, size, columns and types of the store
+    Rows without track are dropped.
+    """
+    arrays, ids, offsets = _index_tracks(df, columns)
+    _save_store(path, arrays, ids, offsets, source)
+    return TrackStore(path)
+
+
+def _index_tracks(df, columns=None):
+    # Columns sorted by track and frame, ids of the tracks and their offsets
+    columns = COLUMNS + [c for c in (columns or []) if c not in COLUMNS]
+    df = df[df["TRACK_ID"].notna()]
+    order = np.lexsort((df["FRAME"].to_numpy(), df["TRACK_ID"].to_numpy()))
+    arrays = {c: df[c].to_numpy()[order] for c in columns}
+    ids, starts = np.unique(arrays["TRACK_ID"], return_index=True)
+    offsets = np.append(starts, len(order)).astype(np.int64)
+    return arrays, ids, offsets
+
+
+def _meta(arrays, ids, offsets, source=None):
+    return {"version": STORE_VERSION,
+            "n_tracks": len(ids),
+            "n_points": int(offsets[-1]),
+            "columns": list(arrays),
+            "dtypes": {c: str(v.dtype) for c, v in arrays.items()},
+            "source": source}
+
+
+def _save_store(path, arrays, ids, offsets, source=None):
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    # Written in a temporary directory first, so a store is never seen
+    # half written
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp")
+    try:
+        with profiling.stage("write"):
+            for c, values in arrays.items():
+                np.save(os.path.join(tmp, c + ".npy"), values)
+            np.save(os.path.join(tmp, "ids.npy"), ids)
+            np.save(os.path.join(tmp, "offsets.npy"),
+                    np.asarray(offsets, dtype=np.int64))
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(_meta(arrays, ids, offsets, source), f, indent=2)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class TrackStore:
+    """
+    Tracks stored on disk and read with memory mapping.
+
+    Parameters
+    ----------
+    path : str
+        directory of the store, see `write_track_store`
+
+    Description
+    -----------
+    Columns are memory mapped, only the pages of the tracks that are read
+    are loaded in memory. A store can be given instead of a dataframe to
+    `single_track_analysis`, `tracks_analysis` and the batch analysers.
+
+    Examples
+    --------
+    >>> store = TrackStore.from_dataframe(read_csv_file(f), "tracks.store")
+    >>> store = TrackStore("tracks.store")
+    >>> x, y = store.track(12)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError("Track store version " +
+                             str(self.meta["version"]) + " is not supported")
+        self.arrays = {c: np.load(os.path.join(path, c + ".npy"),
+                                  mmap_mode="r")
+                       for c in self.meta["columns"]}
+        self._ids = np.load(os.path.join(path, "ids.npy"))
+        self._offsets = np.load(os.path.join(path, "offsets.npy"))
+        # Tracks of the store that are used, all of them unless `select`
+        self._positions = np.arange(len(self._ids))
+
+    @classmethod
+    def from_dataframe(cls, df, path, columns=None, source=None):
+        return write_track_store(df, path, columns, source)
+
+    @classmethod
+    def in_memory(cls, df, columns=None, source=None):
+        """
+        Store of the tracks of a dataframe kept in memory, nothing is
+        written. Tracks are indexed as in a store on disk.
+        """
+        store = object.__new__(cls)
+        arrays, ids, offsets = _index_tracks(df, columns)
+        store.path = None
+        store.meta = _meta(arrays, ids, offsets, source)
+        store.arrays = arrays
+        store._ids = ids
+        store._offsets = offsets
+        store._positions = np.arange(len(ids))
+        return store
+
+    def save(self, path):
+        """
+        Write the tracks of the store, e.g. of a store in memory, in a
+        store on disk and open it.
+        """
+        if len(self) == len(self._ids):
+            _save_store(path, self.arrays, self._ids, self._offsets,
+                        self.meta["source"])
+            return TrackStore(path)
+        return write_track_store(self.to_frame(), path, self.columns,
+                                 self.meta["source"])
+
+    @property
+    def nbytes(self):
+        """
+        Memory used by the columns and the index, whole columns are counted
+        for a memory mapped store.
+        """
+        return (sum(v.nbytes for v in self.arrays.values()) +
+                self._ids.nbytes + self._offsets.nbytes)
+
+    @property
+    def columns(self):
+        return list(self.arrays)
+
+    @property
+    def ids(self):
+        return self._ids[self._positions]
+
+    @property
+    def lengths(self):
+        return (self._offsets[self._positions + 1] -
+                self._offsets[self._positions])
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, id_track):
+        i = np.searchsorted(self._ids, id_track)
+        return i < len(self._ids) and self._ids[i] == id_track
+
+    def _position(self, id_track):
+        if id_track not in self:
+            raise KeyError("Track " + str(id_track) + " not in the store")
+        return np.searchsorted(self._ids, id_track)
+
+    def _rows(self, positions):
+        # Rows of several tracks, concatenated
+        starts = self._offsets[positions]
+        lengths = self._offsets[positions + 1] - starts
+        shift = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.arange(lengths.sum()) + shift
+
+    def track(self, id_track, column="MEAN_INTENSITY_CH1"):
+        """
+        Frames and values of one track.
+
+        Returns
+        -------
+        frames : np.array
+        values : np.array
+            values of column, default value : "MEAN_INTENSITY_CH1"
+        """
+        i = self._position(id_track)
+        rows = slice(self._offsets[i], self._offsets[i + 1])
+        return self.arrays["FRAME"][rows], self.arrays[column][rows]
+
+    def select(self, ids_track):
+        """
+        Store restricted to some tracks, it shares the memory of the
+        store.
+        """
+        selection = object.__new__(TrackStore)
+        selection.__dict__.update(self.__dict__)
+        ids_track = np.intersect1d(self.ids, np.asarray(ids_track))
+        selection._positions = np.searchsorted(self._ids, ids_track)
+        return selection
+
+    def to_frame(self, ids_track=None, columns=None):
+        """
+        Tracks as a pd.DataFrame.
+
+        Parameters
+        ----------
+        ids_track : list
+            tracks to read, default value : None, all tracks of the store
+        columns : list
+            columns to read, default value : None, all columns
+        """
+        store = self if ids_track is None else self.select(ids_track)
+        rows = store._rows(store._positions)
+        return pd.DataFrame({c: self.arrays[c][rows]
+                             for c in (columns or self.columns)})
+
+    def iter_tracks(self, ids_track=None, columns=None):
+        """
+        Tracks one by one, as (id, pd.DataFrame), like a groupby on
+        "TRACK_ID".
+        """
+        store = self if ids_track is None else self.select(ids_track)
+        for i in store._positions:
+            rows = slice(self._offsets[i], self._offsets[i + 1])
+            yield self._ids[i], pd.DataFrame(
+                {c: self.arrays[c][rows] for c in (columns or self.columns)})
+
+    def chunks(self, n_tracks=1000):
+        """
+        Stores of at most n_tracks tracks that cover the store.
+        """
+        ids = self.ids
+        for i in range(0, len(ids), n_tracks):
+            yield self.select(ids[i:i + n_tracks])
+
+    def track_values(self, column):
+        """
+        First value of a column for each track, e.g. a condition.
+
+        Returns
+        -------
+        pd.Series indexed by the id of the tracks
+        """
+        return pd.Series(self.arrays[column][self._offsets[self._positions]],
+                         index=self.ids)
@@ -7,16 +7,31 @@ from scipy import optimize
 import scipy.signal
 import scipy.io.wavfile
 
-def read_csv_file(f):
+from kinetic_analysis.utils.reader import (cached_read_tracks,
+                                           read_tracks,
+                                           sniff_csv)
+
+def read_csv_file(f, cache=False, columns=None, compact=False):
     """
     Read csv file of trajectories.
-    Drop first lines.
-    Switch some type columns (turn it into numeric values)
+    The first column is used as index, unless columns are given.
+    TrackMate extra header lines are dropped, see `reader.read_tracks`.
+    With cache, a sidecar of the file is written in ~/.cache/
+    kinetic_analysis/files (KINETIC_ANALYSIS_FILE_CACHE) at the first read
+    and the file is loaded from it afterwards, see
+    `reader.cached_read_tracks`. Text columns are then categorical.
+    columns (list, or dict of the new names) and compact are given to
+    `reader.read_tracks`, only these columns are read.
     """
-    datas = pd.read_csv(f,
-                        sep=None,
-                        engine="python",
-                        index_col=0)
+    if cache:
+        datas = cached_read_tracks(f, columns, compact=compact)
+    else:
+        datas = read_tracks(f, columns, compact=compact)
+    if columns is not None:
+        return datas
+    datas = datas.set_index(datas.columns[0])
+    if str(datas.index.name).startswith("Unnamed: "):
+        datas.index.name = None
     return datas
 
 
@@ -27,7 +42,7 @@ def read_csv_file_v1(f):
     Switch some type columns (turn it into numeric values)
     """
 
-    datas = pd.read_csv(f, sep=None, engine="python")
+    datas = read_tracks(f)
     # datas.drop(index=[0, 1, 2], inplace=True)
     datas['FRAME'] = pd.to_numeric(datas["FRAME"])
     datas['POSITION_X'] = pd.to_numeric(datas["POSITION_X"])
@@ -47,15 +62,18 @@ def read_csv_file_v1(f):
 def read_csv_file_v2(f):
     """
     Read csv file of trajectories.
-    Drop first lines.
+    Columns are named after the second header line of TrackMate (e.g.
+    "TRACK ID"), the other header lines are dropped.
     Switch some type columns (turn it into numeric values)
+    As the original version, the first three rows of data are dropped and
+    the "index" column keeps the row numbers of the original frame.
     """
 
-    datas = pd.read_csv(f, sep=None, engine="python")
-    datas.columns = datas.iloc[0]
-    datas.columns = [x.upper() for x in datas.columns]
-    datas.drop([0, 1, 2], axis=0, inplace=True)
-    datas.reset_index(inplace=True)
+    header = sniff_csv(f)["header"]
+    datas = read_tracks(f)
+    if len(header) > 1:
+        datas.columns = [x.upper() for x in header[1]]
+    datas.insert(0, "index", datas.index + 3)
     datas.drop(index=[0, 1, 2], inplace=True)
     datas['FRAME'] = pd.to_numeric(datas["FRAME"])
     datas['X'] = pd.to_numeric(datas["X"])
@@ -83,6 +101,6 @@ def rename_columns(df, old_columns, new_columns):
         list of columns new name used to be replaced
     """
     if len(old_columns) != len(new_columns):
-        raise "lengths of old_columns is different of new_columns"
-    for i in range(len(old_columns)):
-        df.rename(columns={old_columns[i]: new_columns[i]}, inplace=True)
+        raise ValueError("lengths of old_columns is different of "
+                         "new_columns")
+    df.rename(columns=dict(zip(old_columns, new_columns)), inplace=True)
@@ -17,6 +17,23 @@ DOWNLOAD_URL = 'https://github.com/sophietheis/KineticAnalysis.git'
 
 files = ['notebooks/*.*', 'data/*.*']
 
+INSTALL_REQUIRES = ['numpy',
+                    'pandas',
+                    'scipy',
+                    'sympy',
+                    'multipletau',
+                    'plotly',
+                    'dash>=2.6',
+                    'dash-bootstrap-components',
+                    'dash-spinner',
+                    # Background jobs of the app
+                    'diskcache>=5.2.1',
+                    'multiprocess>=0.70.14',
+                    'psutil>=5.8.0',
+                    'pywebview',
+                    'requests',
+                    ]
+
 ## Version management copied form numpy
 ## Thanks to them!
 MAJOR               = 1
@@ -121,6 +138,7 @@ if __name__ == "__main__":
                      ],
 
         packages=find_packages(),
+        install_requires=INSTALL_REQUIRES,
         package_data={'KineticAnalysis': files},
         include_package_data=True,
         zip_safe=False
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kinetic_analysis.analysis.analysis_deconvolution import (
+    compare_with_ground_truth,
+    deconvolution_analysis,
+    deconvolve_tracks,
+    detect_events,
+    profile_kernel)
+from kinetic_analysis.generator.generator_track import generate_one_track
+
+PROFILE = {"prot_length": 490,
+           "suntag_length": 796,
+           "nb_suntag": 32,
+           "fluo_one_suntag": 4,
+           "translation_rate": 24}
+DELTA_T = 0.5
+# Largest relative error of the estimated initiation rate
+RATE_TOLERANCE = 0.1
+
+
+def simulated_tracks(binding_rate, n_tracks=10, length=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    tracks, occupancy = [], []
+    for i in range(n_tracks):
+        _, y, y_start_prot = generate_one_track(**PROFILE,
+                                                binding_rate=binding_rate,
+                                                step=DELTA_T,
+                                                length=length,
+                                                rng=rng)
+        tracks.append(pd.DataFrame({"TRACK_ID": i,
+                                    "FRAME": np.arange(len(y)),
+                                    "MEAN_INTENSITY_CH1": y}))
+        occupancy.append(y_start_prot)
+    return pd.concat(tracks, ignore_index=True), occupancy
+
+
+def test_detect_events_integrates_spread_peaks():
+    # One initiation spread over 4 points, and two over 3 points
+    events = np.array([[0, 0.25, 0.25, 0.25, 0.25, 0, 0, 0.6, 0.8, 0.6, 0]])
+    row, position, counts = detect_events(events)
+    np.testing.assert_array_equal(row, [0, 0])
+    np.testing.assert_allclose(position, [2.5, 8])
+    np.testing.assert_array_equal(counts, [1, 2])
+
+
+@pytest.mark.parametrize("binding_rate", [0.05, 0.2])
+def test_initiation_rate_within_tolerance(binding_rate):
+    df, _ = simulated_tracks(binding_rate)
+    results, events = deconvolution_analysis(df, **PROFILE, delta_t=DELTA_T)
+    rate = results["binding_rate"].mean()
+    assert abs(rate - binding_rate) / binding_rate < RATE_TOLERANCE
+    np.testing.assert_allclose(
+        events.groupby("id")["n"].sum().reindex(results["id"], fill_value=0),
+        results["n_events"])
+
+
+def test_occupancy_matches_ground_truth():
+    df, occupancy = simulated_tracks(0.1, n_tracks=1)
+    kernel = profile_kernel(**PROFILE, delta_t=DELTA_T)
+    events, _ = deconvolve_tracks(df["MEAN_INTENSITY_CH1"].to_numpy(),
+                                  kernel)
+    comparison = compare_with_ground_truth(events, occupancy[0],
+                                           len(kernel))
+    assert (abs(comparison["mean_occupancy"] -
+                comparison["mean_occupancy_true"]) <
+            RATE_TOLERANCE * comparison["mean_occupancy_true"])
+    assert comparison["correlation"] > 0.9
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from kinetic_analysis.analysis.analysis_directory import directory_analysis
+from kinetic_analysis.analysis.analysis_track import tracks_analysis
+from kinetic_analysis.generator.generator_track import generate_tracks
+
+PROFILE = {"prot_length": 490,
+           "suntag_length": 796,
+           "nb_suntag": 32,
+           "fluo_one_suntag": 4,
+           "translation_rate": 24}
+ANALYSIS = {"delta_t": 0.5,
+            "protein_size": 1286,
+            "rtol": 1e-1,
+            "simulation": True}
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+@pytest.mark.parametrize("batch_size", [2, 100])
+def test_directory_analysis_matches_tracks_analysis(tmp_path, batch_size):
+    expected = []
+    for seed, n in enumerate([5, 3]):
+        df = generate_tracks(n, **PROFILE, binding_rate=0.05, step=0.5,
+                             length=1000, seed=seed)
+        name = "tracks{}.csv".format(seed)
+        df[COLUMNS].to_csv(tmp_path / name, index=False)
+        results = tracks_analysis(df, **ANALYSIS)
+        results.insert(0, "file", name)
+        expected.append(results)
+    expected = pd.concat(expected, ignore_index=True)
+    (tmp_path / "broken.xml").write_text("<TrackMate>")
+
+    status = {}
+
+    def progress(name, state, n_done, n_files):
+        status[name] = state
+
+    with pytest.warns(UserWarning, match="broken.xml"):
+        results = directory_analysis(str(tmp_path), n_jobs=2,
+                                     progress=progress,
+                                     batch_size=batch_size, **ANALYSIS)
+    pd.testing.assert_frame_equal(results, expected, check_dtype=False)
+    assert status["tracks0.csv"] == status["tracks1.csv"] == "done"
+    assert status["broken.xml"].startswith("error")
@@ -0,0 +1,34 @@
+import numpy as np
+
+from kinetic_analysis.analysis.analysis_population import (
+    batch_autocorrelation,
+    population_autocorrelation,
+    tracks_to_matrix)
+from kinetic_analysis.generator.generator_expected import (
+    expected_autocorrelation)
+from kinetic_analysis.generator.generator_track import generate_tracks
+
+PROFILE = {"prot_length": 490,
+           "suntag_length": 796,
+           "nb_suntag": 32,
+           "fluo_one_suntag": 4,
+           "translation_rate": 24}
+STEP = 0.5
+# Largest error of the simulated autocorrelation, relative to G(0)
+ACF_TOLERANCE = 0.1
+
+
+def test_expected_autocorrelation_matches_simulation():
+    df = generate_tracks(20, **PROFILE, binding_rate=0.05, step=STEP,
+                         length=6000, seed=0)
+    _, y, lengths = tracks_to_matrix(df)
+    x_auto, g_auto, weights = batch_autocorrelation(y, lengths,
+                                                    delta_t=STEP,
+                                                    max_lag=150)
+    g_mean, _ = population_autocorrelation(g_auto, weights)
+    expected = expected_autocorrelation(x_auto, **PROFILE,
+                                        binding_rate=0.05,
+                                        step=STEP,
+                                        track_length=lengths[0])
+    np.testing.assert_allclose(g_mean, expected,
+                               atol=ACF_TOLERANCE * expected[0])
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from kinetic_analysis.generator.generator_track import (generate_tracks,
+                                                        iter_generate_tracks)
+from kinetic_analysis.utils.memory import (get_memory_budget,
+                                           set_memory_budget)
+
+PARAMS = {"prot_length": 490,
+          "suntag_length": 796,
+          "nb_suntag": 32,
+          "fluo_one_suntag": 4,
+          "translation_rate": 24,
+          "binding_rate": 0.05,
+          "step": 0.5,
+          "length": 1100}
+
+
+def test_chunks_give_the_same_tracks():
+    expected = generate_tracks(5, **PARAMS, seed=1)
+    for chunk_size in [1, 2, 5]:
+        chunks = list(iter_generate_tracks(5, seed=1, chunk_size=chunk_size,
+                                           **PARAMS))
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                      expected)
+
+
+def test_budgeted_generation_gives_the_same_tracks():
+    expected = generate_tracks(5, **PARAMS, seed=1)
+    budget = get_memory_budget()
+    # Less than the memory of one track, tracks are generated one by one
+    set_memory_budget("30kB")
+    try:
+        assert len(list(iter_generate_tracks(5, seed=1, **PARAMS))) == 5
+        pd.testing.assert_frame_equal(generate_tracks(5, **PARAMS, seed=1),
+                                      expected)
+    finally:
+        set_memory_budget(budget)
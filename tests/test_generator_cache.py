@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.generator.generator_cache import (cached_generate_tracks,
+                                                        dataset_key)
+from kinetic_analysis.generator.generator_track import generate_tracks
+
+PARAMS = {"prot_length": 490,
+          "suntag_length": 796,
+          "nb_suntag": 32,
+          "fluo_one_suntag": 4,
+          "translation_rate": 24,
+          "binding_rate": 0.05,
+          "step": 0.5,
+          "length": 1100}
+
+
+def test_dataset_key_normalises_numbers():
+    key = dataset_key({**PARAMS, "n": 5, "seed": 1})
+    assert key == dataset_key({**PARAMS, "n": 5.0, "seed": 1,
+                               "length": float(PARAMS["length"])})
+    assert key != dataset_key({**PARAMS, "n": 5, "seed": 2})
+    assert key != dataset_key({**PARAMS, "n": 5, "seed": 1, "noise": True})
+
+
+def test_cached_tracks_match_generated(tmp_path):
+    cache_dir = str(tmp_path)
+    expected = generate_tracks(3, **PARAMS, seed=0)
+    first = cached_generate_tracks(3, **PARAMS, seed=0, cache_dir=cache_dir)
+    second = cached_generate_tracks(3, **PARAMS, seed=0, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(second, expected)
+    assert not isinstance(second["FRAME"].to_numpy(), np.memmap)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_population import (
+    batch_autocorrelation,
+    tracks_to_matrix)
+from kinetic_analysis.analysis.analysis_track import autocorrelation
+from kinetic_analysis.utils.track_store import TrackStore
+
+
+def tracks_with_gap(step=1):
+    # Track 1 misses its third frame
+    return pd.DataFrame({"TRACK_ID": [1, 1, 1, 1, 2, 2, 2],
+                         "FRAME": np.array([5, 6, 8, 9, 0, 1, 2]) * step,
+                         "MEAN_INTENSITY_CH1": [1., 2., 4., 5., 1., 3., 2.]})
+
+
+def test_tracks_to_matrix_keeps_frame_gaps():
+    for step in [1, 0.1]:
+        ids_track, y, lengths = tracks_to_matrix(tracks_with_gap(step))
+        np.testing.assert_array_equal(ids_track, [1, 2])
+        np.testing.assert_array_equal(lengths, [4, 3])
+        np.testing.assert_array_equal(y, [[1, 2, np.nan, 4, 5],
+                                          [1, 3, 2, np.nan, np.nan]])
+
+
+def test_tracks_to_matrix_track_store():
+    df = tracks_with_gap()
+    expected = tracks_to_matrix(df)
+    for a, b in zip(tracks_to_matrix(TrackStore.in_memory(df)), expected):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_batch_autocorrelation_counts_pairs_of_gaps():
+    _, y, lengths = tracks_to_matrix(tracks_with_gap())
+    _, g_auto, weights = batch_autocorrelation(y, lengths, max_lag=4,
+                                               normalize=False)
+    np.testing.assert_array_equal(weights[0], [4, 2, 1, 2, 1])
+    # Direct computation on the pairs of points of track 1
+    z = y[0] - np.nanmean(y[0])
+    for lag in range(5):
+        products = z[:len(z) - lag] * z[lag:]
+        np.testing.assert_allclose(g_auto[0, lag], np.nanmean(products))
+
+
+def test_batch_autocorrelation_matches_multipletau():
+    rng = np.random.default_rng(0)
+    tracks = [100 + np.cumsum(rng.normal(size=n)) for n in [200, 160, 120]]
+    y = np.full((len(tracks), 200), np.nan)
+    for i, track in enumerate(tracks):
+        y[i, :len(track)] = track
+    lengths = np.array([len(track) for track in tracks])
+    x_auto, g_auto, weights = batch_autocorrelation(y, lengths,
+                                                    delta_t=0.5,
+                                                    max_lag=50)
+    for i, track in enumerate(tracks):
+        # Lags of the first level of multipletau are not averaged
+        x, g = autocorrelation(track, delta_t=0.5)
+        np.testing.assert_allclose(x[:51], x_auto)
+        np.testing.assert_allclose(g[:51], g_auto[i], rtol=1e-6)
+        np.testing.assert_array_equal(weights[i], len(track) -
+                                      np.arange(51))
@@ -0,0 +1,35 @@
+import json
+
+from kinetic_analysis.utils import profiling
+
+
+def test_merge_stages_of_other_process(tmp_path):
+    # Report of a job written by another process
+    with profiling.profiling(str(tmp_path / "job.json")):
+        with profiling.stage("fit"):
+            profiling.add_nfev("fit", 10)
+        with profiling.stage("write"):
+            pass
+    with open(tmp_path / "job.json") as f:
+        job = json.load(f)["stages"]
+
+    profiler = profiling.enable_profiling()
+    try:
+        with profiling.stage("fit"):
+            profiling.add_nfev("fit", 5)
+        report = profiling.get_profile([job, job]).set_index("stage")
+    finally:
+        profiling.disable_profiling()
+    assert report.loc["fit", "calls"] == 3
+    assert report.loc["fit", "nfev"] == 25
+    assert report.loc["write", "calls"] == 2
+    # Stages of the app are not modified by the reports of the jobs
+    assert profiler.stages["fit"]["calls"] == 1
+
+
+def test_merge_stages_keeps_highest_memory():
+    stages = {"fit": {"calls": 1, "time": 1., "nfev": 0, "rss_peak": 50.}}
+    profiling.merge_stages(stages, {"fit": {"calls": 2, "time": .5,
+                                            "nfev": 3, "rss_peak": 20.}})
+    assert stages["fit"] == {"calls": 3, "time": 1.5, "nfev": 3,
+                             "rss_peak": 50.}
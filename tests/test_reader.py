@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kinetic_analysis.utils.reader import (cached_read_tracks,
+                                           iter_tracks_csv,
+                                           read_trackmate_xml,
+                                           read_tracks,
+                                           sniff_csv)
+
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+# Header lines of a TrackMate export after the names of the columns
+TRACKMATE_HEADER = [
+    "Label,Spot ID,Track ID,Quality,X,Frame,Mean intensity ch1,"
+    "Manual spot color",
+    "Label,Spot ID,Track ID,Quality,X,Frame,Mean ch1,Spot color",
+    ",,,(quality),(micron),,(counts),"]
+
+
+def spots(seed=0):
+    # Three tracks of different lengths and one spot without track
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for i, n in enumerate([5, 8, 3]):
+        tracks.append(pd.DataFrame({"TRACK_ID": float(i),
+                                    "FRAME": np.arange(n) + 2 * i,
+                                    "MEAN_INTENSITY_CH1":
+                                        rng.uniform(10, 100, n).round(3)}))
+    tracks.append(pd.DataFrame({"TRACK_ID": [np.nan],
+                                "FRAME": [0],
+                                "MEAN_INTENSITY_CH1": [42.]}))
+    df = pd.concat(tracks, ignore_index=True)
+    df.insert(0, "ID", np.arange(len(df)) + 100)
+    df.insert(0, "LABEL", ["ID" + str(i) for i in df["ID"]])
+    df.insert(3, "QUALITY", 1.5)
+    df.insert(4, "POSITION_X", rng.uniform(0, 10, len(df)).round(3))
+    df["MANUAL_SPOT_COLOR"] = np.where(df["ID"] % 3 == 0, "red", None)
+    return df
+
+
+def write_trackmate_csv(df, path):
+    df.to_csv(path, index=False, na_rep="None")
+    with open(path) as f:
+        lines = f.read().splitlines()
+    with open(path, "w") as f:
+        f.write("\n".join(lines[:1] + TRACKMATE_HEADER + lines[1:]) + "\n")
+    return str(path)
+
+
+def write_trackmate_xml(df, path, filtered=(0, 1)):
+    # Spots of each frame, edges between consecutive spots of a track
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<TrackMate version="7.0">', "<Model>",
+             '<AllSpots nspots="{}">'.format(len(df))]
+    for frame, rows in df.groupby("FRAME"):
+        lines.append('<SpotsInFrame frame="{}">'.format(frame))
+        for _, s in rows.iterrows():
+            lines.append('<Spot ID="{}" FRAME="{}" MEAN_INTENSITY_CH1="{}" '
+                         'QUALITY="1.0" />'.format(s["ID"], s["FRAME"],
+                                                   s["MEAN_INTENSITY_CH1"]))
+        lines.append("</SpotsInFrame>")
+    lines += ["</AllSpots>", "<AllTracks>"]
+    for i, track in df.dropna(subset=["TRACK_ID"]).groupby("TRACK_ID"):
+        lines.append('<Track name="Track_{0}" TRACK_ID="{0}">'.format(
+            int(i)))
+        ids = track.sort_values("FRAME")["ID"].to_numpy()
+        for source, target in zip(ids[:-1], ids[1:]):
+            lines.append('<Edge SPOT_SOURCE_ID="{}" SPOT_TARGET_ID="{}" />'
+                         .format(source, target))
+        lines.append("</Track>")
+    lines += ["</AllTracks>", "<FilteredTracks>"]
+    lines += ['<TrackID TRACK_ID="{}" />'.format(i) for i in filtered]
+    lines += ["</FilteredTracks>", "</Model>", "</TrackMate>"]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+    return str(path)
+
+
+def reference(path):
+    # Direct read with pandas, the 3 extra header lines skipped
+    return pd.read_csv(path, skiprows=[1, 2, 3], na_values=["None"])
+
+
+def tracks_of(df):
+    df = df[df["TRACK_ID"].notna()].sort_values(["TRACK_ID", "FRAME"])
+    return {int(i): track[COLUMNS[1:]].to_numpy(dtype=float)
+            for i, track in df.groupby("TRACK_ID")}
+
+
+def assert_same_tracks(tracks, expected):
+    tracks = {int(i): track.sort_values("FRAME")[COLUMNS[1:]].to_numpy(
+        dtype=float) for i, track in tracks}
+    assert sorted(tracks) == sorted(expected)
+    for i in expected:
+        np.testing.assert_allclose(tracks[i], expected[i])
+
+
+def test_sniff_trackmate_header(tmp_path):
+    path = write_trackmate_csv(spots(), tmp_path / "tracks.csv")
+    layout = sniff_csv(path)
+    assert layout["sep"] == ","
+    assert layout["skiprows"] == 4
+    assert layout["columns"] == list(spots().columns)
+
+
+@pytest.mark.parametrize("engine", [None, "c"])
+def test_read_tracks_matches_pandas(tmp_path, engine):
+    path = write_trackmate_csv(spots(), tmp_path / "tracks.csv")
+    pd.testing.assert_frame_equal(read_tracks(path, engine=engine),
+                                  reference(path), check_dtype=False)
+
+
+def test_read_tracks_projects_and_renames(tmp_path):
+    path = write_trackmate_csv(spots(), tmp_path / "tracks.csv")
+    columns = {"TRACK_ID": "TRACK_ID", "MEAN_INTENSITY_CH1": "intensity"}
+    datas = read_tracks(path, columns=columns, compact=True)
+    assert list(datas.columns) == ["TRACK_ID", "intensity"]
+    assert datas["intensity"].dtype == np.float32
+    expected = reference(path)[list(columns)].rename(columns=columns)
+    pd.testing.assert_frame_equal(datas, expected, check_dtype=False,
+                                  rtol=1e-6)
+    with pytest.raises(KeyError):
+        read_tracks(path, columns=["TRACK_ID", "MISSING"])
+
+
+def test_sidecar_matches_direct_read(tmp_path):
+    path = write_trackmate_csv(spots(), tmp_path / "tracks.csv")
+    cache_dir = str(tmp_path / "cache")
+    first = cached_read_tracks(path, cache_dir=cache_dir)
+    second = cached_read_tracks(path, cache_dir=cache_dir)
+    assert isinstance(second["LABEL"].dtype, pd.CategoricalDtype)
+    text = {"LABEL": object, "MANUAL_SPOT_COLOR": object}
+    pd.testing.assert_frame_equal(second.astype(text), first.astype(text))
+    pd.testing.assert_frame_equal(first, read_tracks(path))
+
+
+@pytest.mark.parametrize("chunksize", [2, 7, 100])
+def test_iter_tracks_csv_sorted(tmp_path, chunksize):
+    path = write_trackmate_csv(spots(), tmp_path / "tracks.csv")
+    assert_same_tracks(iter_tracks_csv(path, COLUMNS, chunksize=chunksize),
+                       tracks_of(spots()))
+
+
+def test_iter_tracks_csv_spilled(tmp_path):
+    # Spots sorted by frame, the rows of the tracks are interleaved
+    df = spots().sort_values(["FRAME", "ID"])
+    path = write_trackmate_csv(df, tmp_path / "tracks.csv")
+    tracks = iter_tracks_csv(path, COLUMNS, chunksize=3, sorted_input=False,
+                             n_buckets=2, spill_dir=str(tmp_path))
+    assert_same_tracks(tracks, tracks_of(df))
+    with pytest.raises(ValueError):
+        list(iter_tracks_csv(path, COLUMNS, chunksize=3))
+
+
+def test_trackmate_xml_matches_csv(tmp_path):
+    df = spots()
+    csv_path = write_trackmate_csv(df, tmp_path / "tracks.csv")
+    xml_path = write_trackmate_xml(df, tmp_path / "tracks.xml",
+                                   filtered=(0, 1, 2))
+    datas = read_trackmate_xml(xml_path)
+    assert list(datas.columns) == COLUMNS
+    expected = read_tracks(csv_path, columns=COLUMNS).dropna()
+    expected = expected.sort_values(["TRACK_ID", "FRAME"],
+                                    ignore_index=True)
+    pd.testing.assert_frame_equal(datas, expected, check_dtype=False)
+
+    store = read_trackmate_xml(xml_path, str(tmp_path / "store"))
+    pd.testing.assert_frame_equal(store.to_frame(columns=COLUMNS), datas,
+                                  check_dtype=False)
+
+
+def test_trackmate_xml_keeps_filtered_tracks(tmp_path):
+    path = write_trackmate_xml(spots(), tmp_path / "tracks.xml",
+                               filtered=(0, 2))
+    assert sorted(read_trackmate_xml(path)["TRACK_ID"].unique()) == [0, 2]
+    all_tracks = read_trackmate_xml(path, filtered_only=False)
+    assert sorted(all_tracks["TRACK_ID"].unique()) == [0, 1, 2]
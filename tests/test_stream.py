@@ -0,0 +1,47 @@
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_stream import stream_tracks_analysis
+from kinetic_analysis.analysis.analysis_track import tracks_analysis
+from kinetic_analysis.generator.generator_track import generate_tracks
+
+PROFILE = {"prot_length": 490,
+           "suntag_length": 796,
+           "nb_suntag": 32,
+           "fluo_one_suntag": 4,
+           "translation_rate": 24}
+ANALYSIS = {"delta_t": 0.5,
+            "protein_size": 1286,
+            "rtol": 1e-1,
+            "simulation": True}
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+def sorted_results(results):
+    return results.sort_values(["id", "model"], ignore_index=True)
+
+
+def test_stream_analysis_matches_tracks_analysis(tmp_path):
+    df = generate_tracks(6, **PROFILE, binding_rate=0.05, step=0.5,
+                         length=1500, seed=0)
+    path = str(tmp_path / "tracks.csv")
+    df[COLUMNS].to_csv(path, index=False)
+    expected = sorted_results(tracks_analysis(df, **ANALYSIS))
+
+    results = stream_tracks_analysis(path, chunksize=500, batch_size=4,
+                                     **ANALYSIS)
+    pd.testing.assert_frame_equal(sorted_results(results), expected,
+                                  check_dtype=False)
+
+    # Unsorted file, tracks go through the bucket files
+    df.sample(frac=1, random_state=0)[COLUMNS].to_csv(path, index=False)
+    results = stream_tracks_analysis(path, chunksize=500,
+                                     sorted_input=False, **ANALYSIS)
+    pd.testing.assert_frame_equal(sorted_results(results), expected,
+                                  check_dtype=False)
+
+    output = str(tmp_path / "results.csv")
+    assert stream_tracks_analysis(path, output, chunksize=500,
+                                  sorted_input=False, batch_size=4,
+                                  **ANALYSIS) == 6
+    pd.testing.assert_frame_equal(sorted_results(pd.read_csv(output)),
+                                  expected, check_dtype=False)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import (
+    best_models,
+    fit_autocorrelation_linear,
+    fit_models)
+
+
+def test_failed_linear_fit_has_no_score():
+    # The curve crosses the x axis at the second point, the linear method
+    # has less than 2 points to fit and returns -1
+    x = np.arange(8) * 0.5
+    y = np.array([1., -0.5, -0.2, 0.1, -0.1, 0.05, -0.02, 0.01])
+    assert fit_autocorrelation_linear(x, y, protein_size=1500)[0] == -1
+    fits = {fit["model"]: fit for fit in fit_models(x, y, ["linear"])}
+    for k in ["elongation_r", "init_translation_r", "rss", "aic", "bic"]:
+        assert np.isnan(fits["linear"][k])
+
+
+def test_linear_fit_of_a_crossing_curve():
+    # The curve is negative from x = 5.5
+    x = np.arange(40) * 0.5
+    y = 1 - x / 5.2
+    fits = {fit["model"]: fit for fit in fit_models(x, y, ["linear"])}
+    np.testing.assert_allclose(fits["linear"]["elongation_r"], 1500 / 5.5)
+    for k in ["rss", "aic", "bic"]:
+        assert np.isfinite(fits["linear"][k])
+
+
+def test_best_models_one_row_per_track():
+    # Track 1: the custom model is best, track 2: no fit succeeded,
+    # track 3: rejected by the screening
+    results = pd.DataFrame({"id": [3, 1, 1, 2, 2],
+                            "model": [np.nan, "linear", "custom", "linear",
+                                      "custom"],
+                            "aic": [np.nan, 5., 2., np.nan, np.nan],
+                            "qc_reason": ["constant", "", "", "", ""]})
+    results["best"] = (results["aic"] ==
+                       results.groupby("id")["aic"].transform("min"))
+    best = best_models(results)
+    assert list(best["id"]) == [3, 1, 2]
+    assert list(best["model"].fillna("")) == ["", "custom", "linear"]
+    assert list(best["qc_reason"]) == ["constant", "", ""]
+    # Same track id in two files
+    results["file"] = ["a", "a", "a", "b", "b"]
+    results.loc[3, "id"] = 1
+    best = best_models(results, ["file", "id"])
+    assert list(best["model"].fillna("")) == ["", "custom", "linear",
+                                              "custom"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from kinetic_analysis.analysis.analysis_track import tracks_analysis
+from kinetic_analysis.generator.generator_track import generate_tracks
+from kinetic_analysis.utils.track_store import TrackStore, write_track_store
+
+PROFILE = {"prot_length": 490,
+           "suntag_length": 796,
+           "nb_suntag": 32,
+           "fluo_one_suntag": 4,
+           "translation_rate": 24}
+ANALYSIS = {"delta_t": 0.5,
+            "protein_size": 1286,
+            "rtol": 1e-1,
+            "simulation": True}
+COLUMNS = ["TRACK_ID", "FRAME", "MEAN_INTENSITY_CH1"]
+
+
+def simulated_tracks(n=6, seed=0):
+    # Tracks of 1000 points, shuffled as in an unsorted file
+    df = generate_tracks(n, **PROFILE, binding_rate=0.05, step=0.5,
+                         length=1500, seed=seed)
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+
+def sorted_results(results):
+    return results.sort_values(["id", "model"], ignore_index=True)
+
+
+def test_store_matches_dataframe(tmp_path):
+    df = simulated_tracks()
+    expected = df[COLUMNS].sort_values(["TRACK_ID", "FRAME"],
+                                       ignore_index=True)
+    for store in [TrackStore.in_memory(df),
+                  write_track_store(df, str(tmp_path / "store")),
+                  TrackStore.in_memory(df).save(str(tmp_path / "saved"))]:
+        pd.testing.assert_frame_equal(store.to_frame(), expected)
+        np.testing.assert_array_equal(store.ids, np.arange(6))
+        frames, intensity = store.track(3)
+        track = expected[expected["TRACK_ID"] == 3]
+        np.testing.assert_array_equal(frames, track["FRAME"])
+        np.testing.assert_array_equal(intensity, track["MEAN_INTENSITY_CH1"])
+        pd.testing.assert_frame_equal(
+            store.select([1, 4]).to_frame(),
+            expected[expected["TRACK_ID"].isin([1, 4])].reset_index(
+                drop=True))
+
+
+def test_store_analysis_matches_dataframe():
+    df = simulated_tracks()
+    expected = sorted_results(tracks_analysis(df, models=("original",
+                                                          "linear"),
+                                              **ANALYSIS))
+    results = tracks_analysis(TrackStore.in_memory(df),
+                              models=("original", "linear"), **ANALYSIS)
+    pd.testing.assert_frame_equal(sorted_results(results), expected,
+                                  check_dtype=False)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from kinetic_analysis.analysis.analysis_window import window_autocorrelation
+
+
+def direct_window_autocorrelation(y, window, stride, max_lag):
+    g_auto = []
+    for start in range(0, len(y) - window + 1, stride):
+        w = y[start:start + window]
+        z = w - w.mean()
+        g_auto.append([np.mean(z[:window - k] * z[k:]) / w.mean() ** 2
+                       for k in range(max_lag + 1)])
+    return np.array(g_auto)
+
+
+def test_window_autocorrelation_matches_direct_computation():
+    rng = np.random.default_rng(0)
+    y = 100 + np.cumsum(rng.normal(size=500))
+    for window, stride, max_lag in [(50, 1, 24), (120, 7, 30), (2, 3, 1)]:
+        x_auto, g_auto, starts = window_autocorrelation(y, window, stride,
+                                                        delta_t=0.5,
+                                                        max_lag=max_lag)
+        np.testing.assert_allclose(x_auto, np.arange(max_lag + 1) * 0.5)
+        np.testing.assert_array_equal(starts,
+                                      np.arange(0, len(y) - window + 1,
+                                                stride))
+        np.testing.assert_allclose(
+            g_auto, direct_window_autocorrelation(y, window, stride,
+                                                  max_lag),
+            rtol=1e-6, atol=1e-12)